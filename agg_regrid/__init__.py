@@ -16,28 +16,64 @@
 # along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
 """A package for experimental regridding functionality."""
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import copy
-from math import ceil, floor
-import operator
+import os
+import threading
+import warnings
 
 import numpy as np
 import numpy.ma as ma
 
-import iris
-from iris.analysis._interpolation import snapshot_grid, get_xy_dim_coords
-
-from ._agg import raster as agg_raster
+from ._pipeline import pipeline
+# The iris-free array-level API. Note that iris (and therefore cartopy) is
+# only imported when the iris-based regridding scheme is used.
+from .core import (agg, agg_raster, agg_raster_float, agg_weights,  # noqa
+                   AGGREGATIONS, BuildCancelled, DEFAULT_BUFFER_DEPTH,
+                   DEFAULT_PIXEL_FORMAT, _PIXEL_FORMATS, _check_min_coverage,
+                   _check_precision, Progress, _regrid, _reuse_rows,
+                   _tgt_cells, _window_slice, Weights)
+from .engines import (_check_engine, build_weights,  # noqa
+                      register_engine)
+from .scrip import load_weights, save_weights  # noqa
 
 
 __version__ = '0.3.dev0'
 
 
-# Default to using an 8x8 pixel buffer for each source grid cell.
-DEFAULT_BUFFER_DEPTH = 8
+# The CF cell method of each aggregation, other than the mean.
+_CELL_METHODS = {'sum': 'sum', 'min': 'minimum', 'max': 'maximum',
+                 'std': 'standard_deviation'}
+
+# The approximate number of target grid bounds points transformed between
+# coordinate reference systems by each parallel task.
+_TRANSFORM_CHUNK_SIZE = 2 ** 16
+
+
+def snapshot_grid(cube):
+    """
+    Lazily import and call :func:`iris.analysis._interpolation.snapshot_grid`.
+
+    """
+    from iris.analysis._interpolation import snapshot_grid
+    return snapshot_grid(cube)
+
+
+def get_xy_dim_coords(cube):
+    """
+    Lazily import and call
+    :func:`iris.analysis._interpolation.get_xy_dim_coords`.
+
+    """
+    from iris.analysis._interpolation import get_xy_dim_coords
+    return get_xy_dim_coords(cube)
 
 
 class AreaWeighted:
-    def __init__(self, buffer_depth=None):
+    def __init__(self, buffer_depth=None, pixel_format=None,
+                 strict_grid=False, min_coverage=None, engine='agg',
+                 tgt_cells=None, compact=None):
         """
         Anti-Grain Geometry (AGG) regridding scheme for performing
         area-weighted conservative regridding.
@@ -49,16 +85,66 @@ class AreaWeighted:
             to represent each source grid cell. Increase the buffer depth for
             regrid operations involving a high resolution target grid compared
             to a low resolution source grid.
+        * pixel_format (str):
+            The format of the pixel coverage rendered by AGG, either 'gray8'
+            or 'float'. The 'gray8' coverage is quantised to 1/255 per pixel,
+            whereas the 'float' coverage is the fractional area of each pixel,
+            which achieves the same accuracy with a much smaller buffer depth.
+            Defaults to 'gray8'.
+        * strict_grid (bool):
+            Compare the horizontal coordinates of each source cube in full
+            with the source grid of the regridder, rather than by their
+            fingerprint. Defaults to False.
+        * min_coverage (float):
+            The minimum fraction of a target grid cell covered by the source
+            grid, for the target grid cell to be regridded. Target grid cells
+            which partially overlap the source grid are clipped to the source
+            grid, and regridded from the overlapping source grid cells only.
+            Defaults to None, in which case only the target grid cells
+            entirely within the source grid are regridded.
+        * engine (str):
+            The name of the engine which calculates the area weights, being
+            'agg' to rasterise with AGG, 'separable' for a target grid with
+            the same coordinate system as the source grid, 'exact' to
+            clip the target grid cells exactly, any engine registered with
+            :func:`register_engine`, or 'auto' to select the valid engine
+            with the lowest estimated cost for the grids. Defaults to 'agg'.
+        * tgt_cells:
+            The target grid cells to regrid, either as a boolean array with
+            the shape of the target grid, which is True for each target grid
+            cell required, or as a sequence of the (y, x) row-major flattened
+            indices of the target grid cells. The weights are only calculated
+            and applied for these target grid cells, and the other target
+            grid cells are masked. Defaults to None, in which case all target
+            grid cells are regridded.
+        * compact (str):
+            The precision of the compact storage of the weights, being
+            'float64', 'float32' or 'fixed', which reduces the memory
+            footprint of the weights of very large regridders several-fold,
+            see :meth:`Weights.compact`. Defaults to None, in which case the
+            weights are stored uncompacted.
 
         """
         if buffer_depth is None:
             buffer_depth = DEFAULT_BUFFER_DEPTH
 
+        if pixel_format is None:
+            pixel_format = DEFAULT_PIXEL_FORMAT
+
         self.buffer_depth = buffer_depth
+        self.pixel_format = pixel_format
+        self.strict_grid = strict_grid
+        self.min_coverage = min_coverage
+        self.engine = engine
+        self.tgt_cells = tgt_cells
+        self.compact = compact
 
     def __repr__(self):
-        msg = '{}(buffer_depth={})'
-        return msg.format(self.__class__.__name__, self.buffer_depth)
+        msg = '{}(buffer_depth={}, pixel_format={!r}, strict_grid={}, ' \
+            'min_coverage={}, engine={!r}, compact={!r})'
+        return msg.format(self.__class__.__name__, self.buffer_depth,
+                          self.pixel_format, self.strict_grid,
+                          self.min_coverage, self.engine, self.compact)
 
     def regridder(self, src_grid, tgt_grid):
         """
@@ -83,7 +169,13 @@ class AreaWeighted:
 
         """
         return _AreaWeightedRegridder(src_grid, tgt_grid,
-                                      buffer_depth=self.buffer_depth)
+                                      buffer_depth=self.buffer_depth,
+                                      pixel_format=self.pixel_format,
+                                      strict_grid=self.strict_grid,
+                                      min_coverage=self.min_coverage,
+                                      engine=self.engine,
+                                      tgt_cells=self.tgt_cells,
+                                      compact=self.compact)
 
 
 class _AreaWeightedRegridder:
@@ -92,7 +184,9 @@ class _AreaWeightedRegridder:
 
     """
 
-    def __init__(self, src_grid_cube, tgt_grid_cube, buffer_depth=None):
+    def __init__(self, src_grid_cube, tgt_grid_cube, buffer_depth=None,
+                 pixel_format=None, strict_grid=False, min_coverage=None,
+                 engine='agg', tgt_cells=None, compact=None):
         """
         Creates a area-weighted regridder which uses an Anti-Grain
         Geometry (AGG) backend to rasterise the conversion between the source
@@ -112,8 +206,35 @@ class _AreaWeightedRegridder:
             to represent each source grid cell. Increase the buffer depth for
             regrid operations involving a high resolution target grid compared
             to a low resolution source grid.
+        * pixel_format (str):
+            The format of the pixel coverage rendered by AGG, either 'gray8'
+            or 'float'. Defaults to 'gray8'.
+        * strict_grid (bool):
+            Compare the horizontal coordinates of each source cube in full
+            with the source grid, rather than by their fingerprint.
+            Defaults to False.
+        * min_coverage (float):
+            The minimum fraction of a target grid cell covered by the source
+            grid, for the target grid cell to be regridded. Defaults to None,
+            in which case only the target grid cells entirely within the
+            source grid are regridded.
+        * engine (str):
+            The name of the engine which calculates the area weights, or
+            'auto' to select the valid engine with the lowest estimated cost.
+            Defaults to 'agg'.
+        * tgt_cells:
+            The target grid cells to regrid, either as a boolean array with
+            the shape of the target grid or as a sequence of flattened
+            indices, with the other target grid cells masked. Defaults to
+            None, in which case all target grid cells are regridded.
+        * compact (str):
+            The precision of the compact storage of the weights, being
+            'float64', 'float32' or 'fixed'. Defaults to None, in which
+            case the weights are stored uncompacted.
 
         """
+        import iris.cube
+
         if not isinstance(src_grid_cube, iris.cube.Cube):
             emsg = 'The source grid must be a cube, got {}.'
             raise TypeError(emsg.format(type(src_grid_cube)))
@@ -125,7 +246,26 @@ class _AreaWeightedRegridder:
         if buffer_depth is None:
             buffer_depth = DEFAULT_BUFFER_DEPTH
 
+        if pixel_format is None:
+            pixel_format = DEFAULT_PIXEL_FORMAT
+
+        if pixel_format not in _PIXEL_FORMATS:
+            emsg = 'Invalid pixel format, got {!r} expected one of {}.'
+            raise ValueError(emsg.format(pixel_format,
+                                         sorted(_PIXEL_FORMATS)))
+
+        _check_min_coverage(min_coverage)
+        _check_engine(engine)
+        if compact is not None:
+            _check_precision(compact)
+
         self.buffer_depth = buffer_depth
+        self.pixel_format = pixel_format
+        self.strict_grid = strict_grid
+        self.min_coverage = min_coverage
+        self.engine = engine
+        self.tgt_cells = tgt_cells
+        self.compact = compact
 
         # Snapshot the state of the grid cubes to ensure that the regridder
         # is impervious to external changes to the original cubes.
@@ -142,6 +282,11 @@ class _AreaWeightedRegridder:
             emsg = 'The target grid cube requires a native coordinate system.'
             raise ValueError(emsg)
 
+        # Fingerprint the grids, which is much cheaper to compare against
+        # than the full coordinates of each source cube.
+        self._src_fingerprint = _grid_fingerprint(self._sx, self._sy)
+        self._tgt_fingerprint = _grid_fingerprint(self._gx, self._gy)
+
         # Cache the grid bounds converted to the source crs.
         self._gx_bounds = None
         self._gy_bounds = None
@@ -150,7 +295,321 @@ class _AreaWeightedRegridder:
         self._sx_bounds = None
         self._sy_bounds = None
 
-    def __call__(self, src_cube):
+        # Cache the weights of the target grid cells.
+        self._weights = None
+
+        # Serialise the calculation of the weights, so that concurrent
+        # callers share a single calculation.
+        self._lock = threading.Lock()
+
+        # The pending asynchronous calculation of the weights, as the tuple
+        # of its event loop and future.
+        self._pending_weights = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_pending_weights'] = None
+        if self._weights is not None:
+            # The cached target grid bounds are only required to calculate
+            # weights, so recalculate them on demand rather than pickle them.
+            state['_gx_bounds'] = state['_gy_bounds'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _grid_bounds(self):
+        """
+        Calculate and cache the contiguous bounds of the source grid, and
+        the contiguous bounds of the target grid converted to the source crs.
+
+        Returns:
+            Tuple of the 1d source x and y contiguous bounds, and the 2d
+            target grid x and y contiguous bounds in the source crs.
+
+        """
+        # Now calculate and cache the grid bounds in the source crs.
+        if self._gx_bounds is None or self._gy_bounds is None:
+            # Convert the contiguous bounds of the grid to the source crs.
+            if self._sx.coord_system == self._gx.coord_system:
+                gxx, gyy = np.meshgrid(self._gx.contiguous_bounds(),
+                                       self._gy.contiguous_bounds())
+                self._gx_bounds, self._gy_bounds = gxx, gyy
+            else:
+                from_crs = self._gx.coord_system.as_cartopy_crs()
+                to_crs = self._sx.coord_system.as_cartopy_crs()
+                bounds = _transform_bounds(from_crs, to_crs,
+                                           self._gx.contiguous_bounds(),
+                                           self._gy.contiguous_bounds())
+                self._gx_bounds, self._gy_bounds = bounds
+
+        # Calculate and cache the source contiguous bounds.
+        if self._sx_bounds is None or self._sy_bounds is None:
+            self._sx_bounds = self._sx.contiguous_bounds()
+            self._sy_bounds = self._sy.contiguous_bounds()
+
+        return (self._sx_bounds, self._sy_bounds,
+                self._gx_bounds, self._gy_bounds)
+
+    def _get_weights(self, progress=None, cancel=None):
+        """
+        Calculate and cache the :class:`Weights` of the target grid cells,
+        which are reused for each source cube regridded.
+
+        The weights are calculated once, even when called concurrently from
+        multiple threads.
+
+        Kwargs:
+
+        * progress:
+            A callable reporting the :class:`Progress` of the calculation,
+            see :func:`agg_weights`. Defaults to None.
+        * cancel:
+            A cancellation token of the calculation, see
+            :func:`agg_weights`. Defaults to None.
+
+        """
+        if self._weights is None:
+            with self._lock:
+                if self._weights is None:
+                    bounds = self._grid_bounds()
+                    sx_bounds, sy_bounds, gx_bounds, gy_bounds = bounds
+                    weights = build_weights(self.engine,
+                                            self._sx.points, sx_bounds,
+                                            self._sy.points, sy_bounds,
+                                            gx_bounds, gy_bounds,
+                                            self.buffer_depth,
+                                            pixel_format=self.pixel_format,
+                                            min_coverage=self.min_coverage,
+                                            tgt_cells=self.tgt_cells,
+                                            progress=progress, cancel=cancel)
+                    self._weights = self._compact(weights)
+        return self._weights
+
+    def _compact(self, weights):
+        # Compact the storage of the weights, if required.
+        if self.compact is not None:
+            weights.compact(self.compact)
+        return weights
+
+    def calculate_weights(self, progress=None, cancel=None):
+        """
+        Calculate the weights of this regridder ahead of regridding, which
+        may take many minutes for a high resolution grid, reporting the
+        progress of the calculation and allowing it to be cancelled.
+
+        The weights are cached, so this returns immediately once the
+        weights have been calculated.
+
+        Kwargs:
+
+        * progress:
+            A callable, which is called with the :class:`Progress` of the
+            calculation before each row band of the target grid and on
+            completion, e.g. to update a progress bar. Defaults to None.
+        * cancel:
+            A cancellation token, such as a :class:`threading.Event`, which
+            is checked before each row band of the target grid. Once the
+            token is set, the calculation raises :class:`BuildCancelled`,
+            and no weights are cached. Defaults to None.
+
+        Returns:
+            The :class:`Weights` of the target grid cells.
+
+        """
+        return self._get_weights(progress=progress, cancel=cancel)
+
+    def share(self, filename=None):
+        """
+        Share the weights of this regridder, calculating them if necessary,
+        through a memory mapped file, so that pickling this regridder, e.g.
+        to send it to multiprocessing or dask worker processes on the same
+        host, only pickles a reference to the weights, see
+        :meth:`Weights.share`.
+
+        Kwargs:
+
+        * filename:
+            The name of the file to share the weights through. Defaults to
+            None, in which case a temporary file in shared memory (where
+            available) is used, for the lifetime of the weights. This
+            regridder must then be kept until every pickle of it has been
+            unpickled.
+
+        Returns:
+            This regridder.
+
+        """
+        self._get_weights().share(filename)
+        return self
+
+    def save_weights(self, filename):
+        """
+        Save the weights of this regridder, calculating them if necessary,
+        to a SCRIP/ESMF sparse weights file, see
+        :func:`agg_regrid.save_weights`.
+
+        Args:
+
+        * filename:
+            The name of the weights file.
+
+        """
+        save_weights(self._get_weights(), filename)
+
+    def updated(self, tgt_grid_cube, tgt_cells=None):
+        """
+        Create a regridder from the source grid of this regridder to a new
+        target grid, such as a moved or extended limited area domain.
+
+        The weights of each new target grid cell with the same bounds in
+        the source crs as a target grid cell of this regridder are reused,
+        and only the weights of the other new target grid cells are
+        calculated.
+
+        Args:
+
+        * tgt_grid_cube:
+            The :class:`~iris.cube.Cube` providing the new target grid.
+
+        Kwargs:
+
+        * tgt_cells:
+            The new target grid cells to regrid, see :class:`AreaWeighted`.
+            Defaults to None, in which case all new target grid cells are
+            regridded.
+
+        Returns:
+            The new regridder, with the weights of the new target grid.
+
+        """
+        import iris.cube
+
+        if not isinstance(tgt_grid_cube, iris.cube.Cube):
+            emsg = 'The target grid must be a cube, got {}.'
+            raise TypeError(emsg.format(type(tgt_grid_cube)))
+
+        gx, gy = snapshot_grid(tgt_grid_cube)
+        if gx.coord_system is None or gy.coord_system is None:
+            emsg = 'The target grid cube requires a native coordinate system.'
+            raise ValueError(emsg)
+
+        # Copy this regridder, with a new lock, for the new target grid.
+        regridder = copy.copy(self)
+        regridder._gx, regridder._gy = gx, gy
+        regridder._tgt_fingerprint = _grid_fingerprint(gx, gy)
+        regridder._gx_bounds = regridder._gy_bounds = None
+        regridder._weights = None
+        regridder.tgt_cells = tgt_cells
+
+        weights = self._weights
+        if weights is None:
+            # There are no weights to reuse.
+            return regridder
+
+        # Match the new target grid cells with the target grid cells of
+        # this regridder by their bounds.
+        _, _, gx_bounds, gy_bounds = self._grid_bounds()
+        keys = _cell_keys(gx_bounds, gy_bounds)
+        if self.tgt_cells is not None:
+            # Only the selected target grid cells have weights to reuse.
+            cells = _tgt_cells(self.tgt_cells, weights.tgt_shape)
+        else:
+            cells = np.arange(keys.size)
+        order = cells[np.argsort(keys[cells])]
+        sorted_keys = keys[order]
+
+        _, _, gx_bounds, gy_bounds = regridder._grid_bounds()
+        new_keys = _cell_keys(gx_bounds, gy_bounds)
+        reuse = np.full(new_keys.size, -1, dtype=np.int64)
+        if order.size:
+            positions = np.minimum(np.searchsorted(sorted_keys, new_keys),
+                                   order.size - 1)
+            found = sorted_keys[positions] == new_keys
+            reuse[found] = order[positions[found]]
+
+        required = np.ones(new_keys.size, dtype=bool)
+        if tgt_cells is not None:
+            required[:] = False
+            required[_tgt_cells(tgt_cells, new_keys.shape)] = True
+        reuse[~required] = -1
+
+        # Calculate the weights of the remaining required target grid cells.
+        sx_bounds, sy_bounds, gx_bounds, gy_bounds = regridder._grid_bounds()
+        other = build_weights(self.engine, self._sx.points, sx_bounds,
+                              self._sy.points, sy_bounds, gx_bounds,
+                              gy_bounds, self.buffer_depth,
+                              pixel_format=self.pixel_format,
+                              min_coverage=self.min_coverage,
+                              tgt_cells=np.flatnonzero(required &
+                                                       (reuse < 0)))
+        regridder._weights = regridder._compact(_reuse_rows(weights, reuse,
+                                                            other))
+        return regridder
+
+    def window(self, y=None, x=None, bbox=None):
+        """
+        Create a regridder from the source grid of this regridder to a
+        rectangular window of its target grid, such as a regional subdomain.
+
+        The cached weights, and target grid bounds, of the window are taken
+        from this regridder, so that no weights are recalculated.
+
+        Kwargs:
+
+        * y:
+            The slice of the target grid rows of the window. Defaults to
+            None, in which case all rows are in the window.
+        * x:
+            The slice of the target grid columns of the window. Defaults to
+            None, in which case all columns are in the window.
+        * bbox:
+            The (x_min, y_min, x_max, y_max) bounding box of the window in
+            the coordinates of the target grid, as an alternative to the
+            slices, which selects the target grid cells with points within
+            the bounding box. Defaults to None.
+
+        Returns:
+            The new regridder, with the target grid of the window.
+
+        """
+        ny, nx = self._gy.shape[0], self._gx.shape[0]
+        if bbox is not None:
+            if y is not None or x is not None:
+                emsg = 'Expected either the window slices or a bounding ' \
+                    'box, not both.'
+                raise ValueError(emsg)
+            x_min, y_min, x_max, y_max = bbox
+            x = _bbox_slice(self._gx.points, x_min, x_max)
+            y = _bbox_slice(self._gy.points, y_min, y_max)
+        y = _window_slice(y, ny, 'y')
+        x = _window_slice(x, nx, 'x')
+
+        # Copy this regridder, with a new lock, for the window.
+        regridder = copy.copy(self)
+        regridder._gx, regridder._gy = self._gx[x], self._gy[y]
+        regridder._tgt_fingerprint = _grid_fingerprint(regridder._gx,
+                                                       regridder._gy)
+        regridder._gx_bounds = regridder._gy_bounds = None
+        if self._gx_bounds is not None and self._gy_bounds is not None:
+            # The contiguous bounds of the window.
+            bounds = (slice(y.start, y.stop + 1), slice(x.start, x.stop + 1))
+            regridder._gx_bounds = self._gx_bounds[bounds]
+            regridder._gy_bounds = self._gy_bounds[bounds]
+
+        if self.tgt_cells is not None:
+            required = np.zeros(ny * nx, dtype=bool)
+            required[_tgt_cells(self.tgt_cells, (ny, nx))] = True
+            regridder.tgt_cells = required.reshape(ny, nx)[y, x]
+
+        regridder._weights = None
+        if self._weights is not None:
+            regridder._weights = self._weights.window(y, x)
+        return regridder
+
+    def __call__(self, src_cube, coverage=False):
         """
         Regrid the provided :class:`~iris.cube.Cube` on to the target grid
         of this :class:`AreaWeightedRegridder`.
@@ -164,6 +623,12 @@ class _AreaWeightedRegridder:
         * src_cube:
             A :class:`~iris.cube.Cube` to be regridded.
 
+        Kwargs:
+
+        * coverage (bool):
+            Also return the coverage fraction cube of the target grid cells.
+            Defaults to False.
+
         Returns:
             A :class:`~iris.cube.Cube` defined with the horizontal dimensions
             of the target and the other dimensions from the supplied source
@@ -171,38 +636,126 @@ class _AreaWeightedRegridder:
             :class:`~iris.cube.Cube` will be converted to values on the new
             grid using conservative area-weighted regridding.
 
+            Given coverage, the tuple of the regridded cube and the coverage
+            fraction cube. This is the 2d :meth:`coverage` of the target grid
+            by the source grid, unless the source data is masked, in which
+            case it is the fraction of each target grid cell covered by the
+            unmasked source data, with the same shape as the regridded cube.
+            The coverage requires the weights to have target grid cell
+            areas, see :meth:`coverage`.
+
         """
-        # Sanity check the supplied source cube.
-        if not isinstance(src_cube, iris.cube.Cube):
-            emsg = 'The source must be a cube, got {}.'
-            raise TypeError(emsg.format(type(src_cube)))
+        sx, sy, sx_dim, sy_dim, data = self._prepare(src_cube)
+
+        if coverage and ma.isMA(data):
+            # Calculate the valid data fraction in the same pass.
+            weights = self._get_weights()
+            result, fraction = _regrid(weights, data, sx_dim, sy_dim,
+                                       aggregations=('mean', 'fraction'))
+            # Broadcast the (y, x) coverage over the source dimensions.
+            tgt_coverage = _tgt_coverage(weights)
+            if sx_dim < sy_dim:
+                tgt_coverage = tgt_coverage.T
+            shape = [1] * data.ndim
+            shape[sy_dim], shape[sx_dim] = weights.tgt_shape
+            # Target grid cells without unmasked source data have no
+            # coverage, rather than being masked.
+            fraction = ma.filled(fraction, 0) * tgt_coverage.reshape(shape)
+            fraction_cube = self._create_cube(fraction, src_cube, sx, sy,
+                                              sx_dim, sy_dim)
+            _coverage_metadata(fraction_cube)
+        else:
+            # Perform the regrid with the cached weights.
+            result = _regrid(self._get_weights(), data, sx_dim, sy_dim)
+
+        result_cube = self._create_cube(result, src_cube, sx, sy, sx_dim,
+                                        sy_dim)
+
+        if coverage:
+            if not ma.isMA(data):
+                fraction_cube = self.coverage()
+            return result_cube, fraction_cube
 
-        # Get the source cube x and y coordinates.
-        sx, sy = get_xy_dim_coords(src_cube)
+        return result_cube
 
-        if (sx, sy) != (self._sx, self._sy):
-            emsg = 'The source cube is not defined on the same source grid ' \
-                'as this regridder.'
-            raise ValueError(emsg)
+    def coverage(self):
+        """
+        The fraction of each target grid cell covered by the source grid,
+        which is calculated once with the cached weights. The target grid
+        cells without weights, such as those with less than the minimum
+        coverage, have no coverage.
 
-        # Convert the contiguous bounds of the grid to the source crs.
-        gxx, gyy = np.meshgrid(self._gx.contiguous_bounds(),
-                               self._gy.contiguous_bounds())
+        The coverage requires the target grid cell areas, which are unknown
+        for weights loaded from a weights file without target grid cell
+        area fractions, or calculated by an engine which does not provide
+        them, in which case a ValueError is raised.
 
-        # Now calculate and cache the grid bounds in the source crs.
-        if self._gx_bounds is None or self._gy_bounds is None:
-            if sx.coord_system == self._gx.coord_system:
-                self._gx_bounds, self._gy_bounds = gxx, gyy
-            else:
-                from_crs = self._gx.coord_system.as_cartopy_crs()
-                to_crs = sx.coord_system.as_cartopy_crs()
-                xyz = to_crs.transform_points(from_crs, gxx, gyy)
-                self._gx_bounds, self._gy_bounds = xyz[..., 0], xyz[..., 1]
+        Returns:
+            The 2d :class:`~iris.cube.Cube` of the coverage fraction on the
+            target grid.
 
-        # Calculate and cache the source contiguous bounds.
-        if self._sx_bounds is None or self._sy_bounds is None:
-            self._sx_bounds = sx.contiguous_bounds()
-            self._sy_bounds = sy.contiguous_bounds()
+        """
+        import iris.cube
+
+        cube = iris.cube.Cube(_tgt_coverage(self._get_weights()))
+        _coverage_metadata(cube)
+        cube.add_dim_coord(_share_coord(self._gy), 0)
+        cube.add_dim_coord(_share_coord(self._gx), 1)
+        return cube
+
+    def aggregate(self, src_cube, aggregations):
+        """
+        Regrid the provided :class:`~iris.cube.Cube` on to the target grid
+        of this :class:`AreaWeightedRegridder` with each of the area-weighted
+        aggregations, computed together in one pass with the cached weights.
+
+        Args:
+
+        * src_cube:
+            A :class:`~iris.cube.Cube` to be regridded.
+        * aggregations:
+            The sequence of the names of the aggregations, from 'mean',
+            'sum', 'fraction', 'min', 'max' and 'std'. See
+            :meth:`Weights.aggregate`.
+
+        Returns:
+            A :class:`~iris.cube.CubeList` of the regridded cube of each
+            aggregation, in order. The 'mean' cube is the same as calling
+            this regridder. The other cubes are given an 'area' cell method,
+            except for the 'valid_fraction' cube of the 'fraction'.
+
+        """
+        import iris.coords
+        import iris.cube
+
+        aggregations = tuple(aggregations)
+        sx, sy, sx_dim, sy_dim, data = self._prepare(src_cube)
+
+        results = _regrid(self._get_weights(), data, sx_dim, sy_dim,
+                          aggregations=aggregations)
+
+        cubes = iris.cube.CubeList()
+        for name, result in zip(aggregations, results):
+            cube = self._create_cube(result, src_cube, sx, sy, sx_dim, sy_dim)
+            if name == 'fraction':
+                cube.rename('valid_fraction')
+                cube.units = '1'
+            elif name != 'mean':
+                method = _CELL_METHODS[name]
+                cube.add_cell_method(iris.coords.CellMethod(method, 'area'))
+            cubes.append(cube)
+
+        return cubes
+
+    def _prepare(self, src_cube):
+        """
+        Check the source cube, and return its x and y coordinates and
+        dimensions, and its data to regrid.
+
+        """
+        # Sanity check the supplied source cube, and get its x and y
+        # coordinates.
+        sx, sy = self._check_cube(src_cube)
 
         sx_dim = src_cube.coord_dims(sx)[0]
         sy_dim = src_cube.coord_dims(sy)[0]
@@ -213,263 +766,461 @@ class _AreaWeightedRegridder:
         if ma.isMA(data) and not ma.is_masked(data):
             data = data.data
 
-        # Perform the regrid.
-        result = agg(data, sx.points, self._sx_bounds,
-                     sy.points, self._sy_bounds, sx_dim, sy_dim,
-                     self._gx_bounds, self._gy_bounds, self.buffer_depth)
+        return sx, sy, sx_dim, sy_dim, data
+
+    def _check_cube(self, cube, kind='source'):
+        """
+        Check that the cube is defined on the source (or target) grid of
+        this regridder, and return its x and y coordinates.
+
+        """
+        import iris.cube
+
+        if not isinstance(cube, iris.cube.Cube):
+            emsg = 'The {} must be a cube, got {}.'
+            raise TypeError(emsg.format(kind, type(cube)))
+
+        x, y = get_xy_dim_coords(cube)
+
+        if kind == 'source':
+            grid, fingerprint = (self._sx, self._sy), self._src_fingerprint
+        else:
+            grid, fingerprint = (self._gx, self._gy), self._tgt_fingerprint
+
+        if self.strict_grid:
+            same_grid = (x, y) == grid
+        else:
+            same_grid = _grid_fingerprint(x, y) == fingerprint
+
+        if not same_grid:
+            emsg = 'The {0} cube is not defined on the same {0} grid as ' \
+                'this regridder.'
+            raise ValueError(emsg.format(kind))
+
+        return x, y
+
+    def adjoint(self, tgt_cube):
+        """
+        Apply the adjoint (transpose) of this :class:`AreaWeightedRegridder`
+        to the provided :class:`~iris.cube.Cube` on the target grid, mapping
+        it back on to the source grid, e.g. for target grid increments.
+
+        The adjoint reuses the cached weights of this regridder, see
+        :meth:`Weights.apply_adjoint`.
+
+        Args:
+
+        * tgt_cube:
+            A :class:`~iris.cube.Cube` defined on the target grid.
+
+        Returns:
+            A :class:`~iris.cube.Cube` defined with the horizontal dimensions
+            of the source grid and the other dimensions from the supplied
+            target :class:`~iris.cube.Cube`.
+
+        """
+        gx, gy = self._check_cube(tgt_cube, kind='target')
+
+        gx_dim = tgt_cube.coord_dims(gx)[0]
+        gy_dim = tgt_cube.coord_dims(gy)[0]
+
+        result = _regrid(self._get_weights(), tgt_cube.data, gx_dim, gy_dim,
+                         adjoint=True)
+
+        return self._create_cube(result, tgt_cube, gx, gy, gx_dim, gy_dim,
+                                 adjoint=True)
+
+    async def aregrid(self, src_cube, executor=None):
+        """
+        Asynchronously regrid the provided :class:`~iris.cube.Cube` on to the
+        target grid of this :class:`AreaWeightedRegridder`, without blocking
+        the event loop.
+
+        The weights and the regridded cube are calculated in the executor.
+        Concurrent calls awaiting the weights of this regridder share a
+        single calculation of the weights.
+
+        Args:
+
+        * src_cube:
+            A :class:`~iris.cube.Cube` to be regridded.
+
+        Kwargs:
+
+        * executor:
+            The :class:`concurrent.futures.Executor` to calculate in.
+            Defaults to the default executor of the event loop.
+
+        Returns:
+            The regridded :class:`~iris.cube.Cube`, as for calling this
+            regridder.
+
+        """
+        loop = asyncio.get_event_loop()
+
+        if self._weights is None:
+            pending = self._pending_weights
+            if pending is None or pending[0] is not loop:
+                future = loop.run_in_executor(executor, self._get_weights)
+                self._pending_weights = pending = (loop, future)
+            try:
+                # Shield the shared calculation from the cancellation of
+                # any one of its callers.
+                await asyncio.shield(pending[1])
+            finally:
+                if pending[1].done() and self._pending_weights is pending:
+                    self._pending_weights = None
+
+        return await loop.run_in_executor(executor, self, src_cube)
+
+    def regrid_iter(self, cubes, prefetch=2):
+        """
+        Regrid each :class:`~iris.cube.Cube` of the given iterable on to the
+        target grid of this :class:`AreaWeightedRegridder`, e.g. each time
+        slice of a long time series.
+
+        The next source cubes are loaded, and regridded, on background
+        threads while the consumer handles the previous regridded cubes, so
+        that I/O overlaps with computation.
+
+        Args:
+
+        * cubes:
+            An iterable of the :class:`~iris.cube.Cube` to be regridded,
+            which are all defined on the source grid of this regridder.
+
+        Kwargs:
+
+        * prefetch (int):
+            The maximum number of loaded source cubes, and of regridded cubes,
+            queued ahead of their consumer. Defaults to 2.
+
+        Returns:
+            A generator of the regridded :class:`~iris.cube.Cube`, in the
+            order of the source cubes.
+
+        """
+        if prefetch < 1:
+            emsg = 'Expected a prefetch of at least one, got {}.'
+            raise ValueError(emsg.format(prefetch))
+
+        return pipeline(cubes, (_realise, self), prefetch)
+
+    def _create_cube(self, data, src_cube, sx, sy, sx_dim, sy_dim,
+                     adjoint=False):
+        """
+        Create the result cube of the regridded data from the source cube.
+
+        The coordinates of the result cube share read-only views of the
+        points and bounds of the target grid coordinates and the source
+        cube coordinates that do not span the horizontal dimensions, rather
+        than copying them. Any aux factories of the source cube are added to
+        the result cube, with their reference surfaces regridded on to the
+        target grid.
+
+        For the adjoint, the source cube is on the target grid and the result
+        cube is on the source grid, and any aux factories with reference
+        surfaces are dropped.
+
+        Args:
+
+        * data:
+            The regridded data.
+        * src_cube:
+            The source :class:`~iris.cube.Cube` that was regridded.
+        * sx:
+            The x-coordinate of the source cube.
+        * sy:
+            The y-coordinate of the source cube.
+        * sx_dim:
+            The x-dimension of the source cube.
+        * sy_dim:
+            The y-dimension of the source cube.
+
+        Kwargs:
+
+        * adjoint (bool):
+            Whether the data is the result of the adjoint regrid.
+            Defaults to False.
 
-        #
-        # XXX: Need to deal the factories when constructing result cube.
-        #
-        result_cube = iris.cube.Cube(result)
+        Returns:
+            The regridded :class:`~iris.cube.Cube`.
+
+        """
+        import iris.coords
+        import iris.cube
+
+        gx, gy = (self._sx, self._sy) if adjoint else (self._gx, self._gy)
+
+        result_cube = iris.cube.Cube(data)
         result_cube.metadata = copy.deepcopy(src_cube.metadata)
 
-        def copy_coords(coords, add_coord):
+        # Map the id of each source coordinate to its result coordinate,
+        # for updating the aux factories.
+        coord_mapping = {}
+
+        def share_coords(coords, add_coord):
             for coord in coords:
                 dims = src_cube.coord_dims(coord)
                 if coord is sx:
-                    coord = self._gx
+                    result_coord = _share_coord(gx)
                 elif coord is sy:
-                    coord = self._gy
+                    result_coord = _share_coord(gy)
                 elif sx_dim in dims or sy_dim in dims:
                     continue
-                result_coord = coord.copy()
+                else:
+                    result_coord = _share_coord(coord)
                 add_coord(result_coord, dims)
+                coord_mapping[id(coord)] = result_coord
 
-        copy_coords(src_cube.dim_coords, result_cube.add_dim_coord)
-        copy_coords(src_cube.aux_coords, result_cube.add_aux_coord)
+        share_coords(src_cube.dim_coords, result_cube.add_dim_coord)
+        share_coords(src_cube.aux_coords, result_cube.add_aux_coord)
+
+        for factory in src_cube.aux_factories:
+            for coord in factory.dependencies.values():
+                if coord is None or id(coord) in coord_mapping:
+                    continue
+                dims = src_cube.coord_dims(coord)
+                if not adjoint and sx_dim in dims and sy_dim in dims:
+                    # Regrid the reference surface with the cached weights.
+                    points = _regrid(self._get_weights(), coord.points,
+                                     dims.index(sx_dim), dims.index(sy_dim))
+                    result_coord = iris.coords.AuxCoord(points)
+                    result_coord.metadata = copy.deepcopy(coord.metadata)
+                    result_cube.add_aux_coord(result_coord, dims)
+                    coord_mapping[id(coord)] = result_coord
+            try:
+                result_cube.add_aux_factory(factory.updated(coord_mapping))
+            except KeyError:
+                emsg = 'Cannot update aux factory {!r} because of dropped ' \
+                    'coordinates.'
+                warnings.warn(emsg.format(factory.name()))
 
         return result_cube
 
 
-def agg(data, sx_points, sx_bounds, sy_points, sy_bounds,
-        sx_dim, sy_dim, gx_bounds, gy_bounds, depth):
+def load_regridder(filename, src_grid_cube, tgt_grid_cube, **kwargs):
+    """
+    Create an area-weighted regridder between the source and target grids
+    with the weights loaded from a SCRIP/ESMF sparse weights file, such as
+    saved by :meth:`_AreaWeightedRegridder.save_weights` or generated by
+    another tool, see :func:`agg_regrid.load_weights`.
+
+    Args:
+
+    * filename:
+        The name of the weights file.
+    * src_grid_cube:
+        The :class:`~iris.cube.Cube` providing the source grid.
+    * tgt_grid_cube:
+        The :class:`~iris.cube.Cube` providing the target grid.
+
+    Any other keyword arguments are passed to the regridder.
+
+    Returns:
+        The regridder, with the same interface as
+        :meth:`AreaWeighted.regridder`.
+
+    """
+    regridder = _AreaWeightedRegridder(src_grid_cube, tgt_grid_cube,
+                                       **kwargs)
+    weights = load_weights(filename)
+
+    src_shape = (regridder._sy.shape[0], regridder._sx.shape[0])
+    tgt_shape = (regridder._gy.shape[0], regridder._gx.shape[0])
+    if weights.src_shape != src_shape or weights.tgt_shape != tgt_shape:
+        emsg = 'The weights file {!r} is for a source grid {} and target ' \
+            'grid {}, got {} and {}.'
+        raise ValueError(emsg.format(filename, weights.src_shape,
+                                     weights.tgt_shape, src_shape,
+                                     tgt_shape))
+
+    regridder._weights = regridder._compact(weights)
+    return regridder
+
+
+def _transform_bounds(from_crs, to_crs, x_bounds, y_bounds, workers=None):
+    """
+    Transform the 2d mesh of the 1d contiguous x and y bounds from one
+    cartopy crs to another.
+
+    The mesh is transformed in chunks of rows, in parallel over a pool of
+    threads, and written into the preallocated result, so that the full
+    mesh of the bounds is never held in memory in the original crs.
+
+    Args:
+
+    * from_crs:
+        The cartopy crs of the bounds.
+    * to_crs:
+        The cartopy crs to transform the bounds to.
+    * x_bounds:
+        The 1d contiguous x bounds.
+    * y_bounds:
+        The 1d contiguous y bounds.
+
+    Kwargs:
+
+    * workers (int):
+        The maximum number of threads. Defaults to None, in which case
+        the number of CPUs is used.
+
+    Returns:
+        Tuple of the 2d x and y bounds, with shape (y, x), in the
+        transformed crs.
+
+    """
+    ny, nx = len(y_bounds), len(x_bounds)
+    gx_bounds = np.empty((ny, nx))
+    gy_bounds = np.empty((ny, nx))
+    rows = max(1, _TRANSFORM_CHUNK_SIZE // max(nx, 1))
+
+    def transform(start):
+        stop = min(start + rows, ny)
+        shape = (stop - start, nx)
+        xx = np.broadcast_to(x_bounds, shape)
+        yy = np.broadcast_to(y_bounds[start:stop, np.newaxis], shape)
+        xyz = to_crs.transform_points(from_crs, xx, yy)
+        gx_bounds[start:stop] = xyz[..., 0]
+        gy_bounds[start:stop] = xyz[..., 1]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    starts = range(0, ny, rows)
+    if workers > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Consume the results to re-raise any exception.
+            list(executor.map(transform, starts))
+    else:
+        for start in starts:
+            transform(start)
+
+    return gx_bounds, gy_bounds
+
+
+def _bbox_slice(points, lower, upper):
+    # The slice of the monotonic points within the closed interval, or an
+    # empty slice.
+    inside = np.flatnonzero((points >= lower) & (points <= upper))
+    if inside.size == 0:
+        return slice(0, 0)
+    return slice(inside[0], inside[-1] + 1)
+
+
+def _cell_keys(gx_bounds, gy_bounds):
+    """
+    Returns the 1d keys of the (y, x) row-major target grid cells, being
+    the bytes of the bounds of the four corners of each target grid cell.
+
+    """
+    corners = [bounds[j:bounds.shape[0] - 1 + j, i:bounds.shape[1] - 1 + i]
+               for bounds in (gx_bounds, gy_bounds)
+               for j in (0, 1) for i in (0, 1)]
+    keys = np.ascontiguousarray(np.stack(corners, axis=-1),
+                                dtype=np.float64)
+    return keys.view(np.dtype((np.void, keys.itemsize * 8))).ravel()
+
+
+def _tgt_coverage(weights):
+    # The 2d coverage of the target grid cells, which is zero for the target
+    # grid cells without weights.
+    coverage = weights.coverage
+    if coverage is None:
+        emsg = 'The coverage is unavailable, as the weights have no target ' \
+            'grid cell areas.'
+        raise ValueError(emsg)
+    return np.where(weights.tgt_mask, 0., coverage)
+
+
+def _coverage_metadata(cube):
     """
-    Perform a area-weighted regrid of the data using an Anti-Grain
-    Geometry (AGG) backend to rasterise the conversion between the source
-    and target grids.
+    Set the metadata of the given coverage fraction cube.
+
+    """
+    cube.rename('coverage_fraction')
+    cube.units = '1'
+    cube.attributes = {}
+    cube.cell_methods = ()
+
+
+def _realise(cube):
+    """
+    Returns the given cube, having loaded its lazy data.
+
+    """
+    import iris.cube
+
+    if isinstance(cube, iris.cube.Cube) and cube.has_lazy_data():
+        cube.data
+    return cube
+
+
+def _read_only(array):
+    """
+    Returns a read-only view of the given real array, or the given lazy
+    array unchanged.
+
+    """
+    if isinstance(array, np.ndarray):
+        array = array.view()
+        array.flags.writeable = False
+    return array
+
+
+def _share_coord(coord):
+    """
+    Returns a copy of the given coordinate which shares read-only views of
+    its points and bounds, rather than copying them.
+
+    Only the metadata of the coordinate is deep-copied, so the copy may be
+    freely modified without affecting the given coordinate, except for the
+    values of its points and bounds.
+
+    """
+    # Pre-empt the deep copy of the data managers of the points and bounds.
+    memo = {}
+    for name in ('_values_dm', '_bounds_dm'):
+        data_manager = getattr(coord, name, None)
+        if data_manager is not None:
+            array = _read_only(data_manager.core_data())
+            memo[id(data_manager)] = data_manager.copy(data=array)
+    return copy.deepcopy(coord, memo)
+
+
+def _coord_fingerprint(coord):
+    """
+    Returns a cheap, hashable summary of the given 1d horizontal coordinate,
+    made from its name, units, shape, dtype, end points, mean spacing, end
+    bounds and coordinate system.
+
+    """
+    points = coord.points
+    first, last = float(points[0]), float(points[-1])
+    spacing = (last - first) / (points.size - 1) if points.size > 1 else 0.
+    bounds = coord.bounds
+    if bounds is not None:
+        bounds = (bounds.shape, float(bounds.flat[0]), float(bounds.flat[-1]))
+    return (coord.name(), str(coord.units), points.shape, points.dtype.str,
+            first, last, spacing, bounds, repr(coord.coord_system))
+
+
+def _grid_fingerprint(x, y):
+    """
+    Returns a cheap, hashable fingerprint of the grid defined by the given
+    x and y coordinates.
+
+    Grids with different fingerprints are different, whereas grids with the
+    same fingerprint may only differ by their interior points or bounds.
 
     Args:
 
-    * data:
-        The source grid data, which must be at least 2d, that requires
-        to be regridded to the target grid.
-    * sx_points:
-        The source grid x-coordinate points, which must be 1d, monotonic
-        and regular.
-    * sx_bounds:
-        The source grid x-coordinate contiguous bounds, which must be 1d,
-        monotonic and regular.
-    * sy_points:
-        The source grid y-coordinate points, which must be 1d, monotonic
-        and regular.
-    * sy_bounds:
-        The source grid y-coordinate contiguous bounds, which must be 1d,
-        monotonic and regular.
-    * sx_dim:
-        The data dimension of the x-coordinate.
-    * sy_dim:
-        The data dimension of the y-coordinate.
-    * gx_bounds:
-        The target grid x-coordinate contiguous bounds, which must be 2d.
-        The dimensionality of the target grid is assumed to be in (y, x) order.
-    * gy_bounds:
-        The target grid y-coordinate contiguous bounds, which must be 2d.
-        The dimensionality of the target grid is assumed to be in (y, x) order.
-    * depth:
-        The depth (N) specifying the NxN pixel buffer to represent each source
-        grid cell.
+    * x:
+        The 1d x-coordinate of the grid.
+    * y:
+        The 1d y-coordinate of the grid.
 
     Returns:
-        The data with same horizontal dimensionality as the target grid. The
-        data values are converted to the new grid using conservative
-        area-weighted regridding.
+        Tuple of the x and y coordinate fingerprints.
 
     """
-    #
-    # Sanity check the arguments ...
-    #
-    if sx_points.ndim != 1:
-        emsg = 'Expected 1d src x-coordinate points, got {}d.'
-        raise ValueError(emsg.format(sx_points.ndim))
-
-    if sy_points.ndim != 1:
-        emsg = 'Expected 1d src y-coordinate points, got {}d.'
-        raise ValueError(emsg.format(sy_points.ndim))
-
-    if sx_bounds.ndim != 1:
-        emsg = 'Expected 1d contiguous src x-coordinate bounds, got {}d.'
-        raise ValueError(emsg.format(sx_bounds.ndim))
-
-    if sy_bounds.ndim != 1:
-        emsg = 'Expected 1d contiguous src y-coordinate bounds, got {}d.'
-        raise ValueError(emsg.format(sy_bounds.ndim))
-
-    if sx_bounds.size != sx_points.size + 1:
-        emsg = 'Invalid number of src x-coordinate bounds, got {} expected {}.'
-        raise ValueError(emsg.format(sx_bounds.size, sx_points.size + 1))
-
-    if sy_bounds.size != sy_points.size + 1:
-        emsg = 'Invalid number of src y-coordinate bounds, got {} expected {}.'
-        raise ValueError(emsg.format(sy_bounds.size, sy_points.size + 1))
-
-    # Determine the source data dimensionality ...
-    ndim = data.ndim
-    dims = list(range(ndim))
-
-    if data.ndim < 2:
-        emsg = 'Expected at least 2d src data, got {}d.'
-        raise ValueError(emsg.format(data.ndim))
-
-    # Account for negative indexing ...
-    if sx_dim < 0:
-        sx_dim += ndim
-
-    if sx_dim not in dims:
-        emsg = 'Invalid src x-coordinate dimension, got {} expected ' \
-            'within range {}-{}.'
-        raise ValueError(emsg.format(sx_dim, dims[0], dims[-1]))
-
-    # Account for negative indexing ...
-    if sy_dim < 0:
-        sy_dim += ndim
-
-    if sy_dim not in dims:
-        emsg = 'Invalid src y-coordinate dimension, got {} expected ' \
-            'within range {}-{}.'
-        raise ValueError(emsg.format(sy_dim, dims[0], dims[-1]))
-
-    # Determine the source data shape ...
-    shape = data.shape
-
-    if shape[sx_dim] != sx_points.size:
-        emsg = 'The src x-coordinate points {} do not align with src data {}' \
-            ' over dimension {}.'
-        raise ValueError(emsg.format(sx_points.shape, shape, sx_dim))
-
-    if shape[sy_dim] != sy_points.size:
-        emsg = 'The src y-coordinate points {} do not align with src data {}' \
-            ' over dimension {}.'
-        raise ValueError(emsg.format(sy_points.shape, shape, sy_dim))
-
-    if gx_bounds.ndim != 2:
-        emsg = 'Expected 2d contiguous grid x-coordinate bounds, got {}d.'
-        raise ValueError(emsg.format(gx_bounds.ndim))
-
-    if gy_bounds.ndim != 2:
-        emsg = 'Expected 2d contiguous grid y-coordinate bounds, got {}d.'
-        raise ValueError(emsg.format(gy_bounds.ndim))
-
-    if gx_bounds.shape != gy_bounds.shape:
-        emsg = 'Misaligned grid x-coordinate bounds {} and ' \
-            'y-coordinate bounds {}.'
-        raise ValueError(emsg.format(gx_bounds.shape, gy_bounds.shape))
-
-    # Ensure the grid bounds have the correct dtype ...
-    gx_bounds = np.asarray(gx_bounds, dtype=np.float64)
-    gy_bounds = np.asarray(gy_bounds, dtype=np.float64)
-
-    #
-    # XXX: Makes gross assumption that all coordinates are increasing.
-    # Need to deal with this properly in a generic way.
-    #
-
-    def start_and_delta(points, bounds, kind):
-        # Constrain to regular points only.
-        delta = np.diff(points)
-        mean_delta = np.mean(delta)
-        rtol = 0.002
-        try:
-            atol = mean_delta * rtol
-            np.testing.assert_allclose(delta, mean_delta, atol=abs(atol))
-        except AssertionError as e:
-            emsg = 'Expected src {}-coordinate points to be regular{}'
-            raise ValueError(emsg.format(kind, e))
-        return bounds.min(), mean_delta
-
-    sx0, sdx = start_and_delta(sx_points, sx_bounds, 'x')
-    sy0, sdy = start_and_delta(sy_points, sy_bounds, 'y')
-
-    #
-    # Deal with generic source shape ...
-    #
-    snx, sny = sx_points.size, sy_points.size
-    dr = [sy_dim, sx_dim]
-    do = ndim - len(dr)
-    ds = sorted(dims, key=lambda d: d in dr)
-    dmap = {d: dr.index(d) + do if d in dr else ds.index(d) for d in dims}
-    regrid_order, _ = zip(*sorted(dmap.items(), key=operator.itemgetter(1)))
-    _, result_order = zip(*sorted(dmap.items(), key=operator.itemgetter(0)))
-
-    if regrid_order != tuple(dims):
-        data = np.transpose(data, regrid_order)
-
-    # Reshape the source data into (-1, y, x)
-    regrid_shape = data.shape
-    data = data.reshape((-1,) + regrid_shape[-2:])
-
-    #
-    # Deal with generic grid shape ...
-    #
-    gnx, gny = gx_bounds.shape[1] - 1, gx_bounds.shape[0] - 1
-    result = ma.empty((data.shape[0], gny, gnx))
-    result_shape = list(regrid_shape)
-    result_shape[-2:] = gny, gnx
-    result_shape = tuple(result_shape)
-    result.mask = True
-
-    def _sum_chunk(x, chunk_size, axis=-1):
-        shape = x.shape
-        if axis < 0:
-            axis += x.ndim
-        shape = shape[:axis] + (-1, chunk_size) + shape[axis + 1:]
-        x = x.reshape(shape)
-        return x.sum(axis=axis + 1)
-
-    #
-    # XXX: Cythonise this ...
-    #
-    dims = (1, 2)
-    for yi in range(gny):
-        for xi in range(gnx):
-            yi_stop = yi + 2
-            xi_stop = xi + 2
-            # Get the bounding box of the grid cell in source coordinates.
-            cell_x = gx_bounds[yi:yi_stop, xi:xi_stop]
-            cell_y = gy_bounds[yi:yi_stop, xi:xi_stop]
-            # Convert to fractional source indices.
-            cell_xi = (cell_x - sx0) / sdx
-            cell_yi = (cell_y - sy0) / sdy
-            xi_min, xi_max = min(*cell_xi.flat), max(*cell_xi.flat)
-            yi_min, yi_max = min(*cell_yi.flat), max(*cell_yi.flat)
-            if xi_min < 0 or yi_min < 0 or xi_max > snx or yi_max > sny:
-                # At least one vertex of the grid cell is out of bounds.
-                continue
-            # Snap fractional cell indices outwards to actual source indices.
-            xi_min = int(floor(xi_min))
-            xi_max = int(ceil(xi_max))
-            yi_min = int(floor(yi_min))
-            yi_max = int(ceil(yi_max))
-            # Calculate the weights for the source region
-            # overlapped by this grid cell.
-            cell_xi -= xi_min
-            cell_yi -= yi_min
-            wshape = (depth*(yi_max-yi_min), depth*(xi_max-xi_min))
-            weights = np.zeros(wshape, dtype=np.uint8)
-            agg_raster(weights, depth*cell_xi, depth*cell_yi)
-            if depth > 1:
-                weights = _sum_chunk(_sum_chunk(weights, depth), depth, 0)
-            weights = weights / (depth*depth*255)
-            # Now calculate the weighted result for this grid cell.
-            wsum = weights.sum()
-            if wsum:
-                tmp = data[:, yi_min:yi_max, xi_min:xi_max]
-                result[:, yi, xi] = (tmp * weights).sum(axis=dims) / wsum
-
-    if result.shape != result_shape:
-        result = result.reshape(result_shape)
-
-    if result_order != tuple(dims):
-        result = np.transpose(result, result_order)
-
-    return result
+    return _coord_fingerprint(x), _coord_fingerprint(y)
@@ -22,6 +22,8 @@ cimport numpy as np
 cdef extern from "_agg_raster.h":
     void _raster(np.uint8_t *weights, const double *xi, const double *yi,
                  int nx, int ny)
+    void _raster_float(double *weights, const double *xi, const double *yi,
+                       int nx, int ny)
 
 
 def raster(np.ndarray[np.uint8_t, ndim=2] weights,
@@ -50,3 +52,32 @@ def raster(np.ndarray[np.uint8_t, ndim=2] weights,
     """
     _raster(<np.uint8_t *>weights.data, <const double *>xi.data,
             <const double *>yi.data, weights.shape[1], weights.shape[0])
+
+
+def raster_float(np.ndarray[np.float64_t, ndim=2] weights,
+                 np.ndarray[np.float64_t, ndim=2] xi,
+                 np.ndarray[np.float64_t, ndim=2] yi):
+    """
+    Utilises the sub-pixel accuracy of the Anti-Grain Geometry (AGG)
+    scanline rasterizer to calculate rasterised weights, without
+    quantising the pixel coverage.
+
+    Renders a single target cell in the source grid buffer, as per
+    :func:`raster`, but the weights are the raw (0-1) fractional area of
+    each pixel covered by the target cell, rather than the 8-bit grey-scale
+    (0-255) coverage rendered by the `agg::pixfmt_gray8` pixel format.
+
+    The origin of the buffer is the top-left-hand-corner.
+
+    Args:
+
+    * weights:
+        The 2d weights buffer is updated in-place.
+    * xi:
+        The fractional x-coordinates of the target cell corners.
+    * yi:
+        The fractional y-coordinates of the target cell corners.
+
+    """
+    _raster_float(<double *>weights.data, <const double *>xi.data,
+                  <const double *>yi.data, weights.shape[1], weights.shape[0])
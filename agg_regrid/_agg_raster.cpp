@@ -17,11 +17,14 @@
 # along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
 */
 
+#include <math.h>
 #include <string.h>
 
 #include <agg_basics.h>
 #include <agg_pixfmt_gray.h>
+#include <agg_rasterizer_cells_aa.h>
 #include <agg_rasterizer_scanline_aa.h>
+#include <agg_rasterizer_sl_clip.h>
 #include <agg_renderer_base.h>
 #include <agg_renderer_scanline.h>
 #include <agg_rendering_buffer.h>
@@ -54,3 +57,91 @@ void _raster(uint8_t *weights, const double *xi, const double *yi,
 
     agg::render_scanlines_aa_solid(ras, sl, ren, agg::gray8(255));
 }
+
+
+void _raster_float(double *weights, const double *xi, const double *yi,
+                   int nx, int ny)
+{
+    typedef agg::rasterizer_cells_aa<agg::cell_aa> outline_type;
+    typedef agg::ras_conv_int conv_type;
+
+    // The clock-wise order of the target cell corners.
+    static const int order[] = {0, 1, 3, 2, 0};
+
+    // The accumulated area of a fully covered pixel.
+    static const double full = 2.0 * agg::poly_subpixel_scale *
+        agg::poly_subpixel_scale;
+
+    outline_type outline;
+    int i;
+
+    for (i = 0; i < 4; i++)
+    {
+        outline.line(conv_type::upscale(xi[order[i]]),
+                     conv_type::upscale(yi[order[i]]),
+                     conv_type::upscale(xi[order[i + 1]]),
+                     conv_type::upscale(yi[order[i + 1]]));
+    }
+
+    outline.sort_cells();
+
+    if (outline.total_cells() == 0)
+    {
+        return;
+    }
+
+    int y_min = outline.min_y() < 0 ? 0 : outline.min_y();
+    int y_max = outline.max_y() < ny ? outline.max_y() : ny - 1;
+
+    // Sweep the scanlines as per agg::rasterizer_scanline_aa, but retain
+    // the raw accumulated cell area rather than quantising it to 8-bits.
+    for (int y = y_min; y <= y_max; y++)
+    {
+        unsigned num_cells = outline.scanline_num_cells(y);
+        const agg::cell_aa* const* cells = outline.scanline_cells(y);
+        double *row = weights + y * nx;
+        int cover = 0;
+
+        while (num_cells)
+        {
+            const agg::cell_aa* cur_cell = *cells;
+            int x = cur_cell->x;
+            int area = cur_cell->area;
+            double alpha;
+
+            cover += cur_cell->cover;
+
+            // Accumulate all cells with the same x.
+            while (--num_cells)
+            {
+                cur_cell = *++cells;
+                if (cur_cell->x != x) break;
+                area += cur_cell->area;
+                cover += cur_cell->cover;
+            }
+
+            if (area)
+            {
+                if (x >= 0 && x < nx)
+                {
+                    alpha = fabs(((cover << (agg::poly_subpixel_shift + 1)) -
+                                  area) / full);
+                    row[x] = alpha > 1.0 ? 1.0 : alpha;
+                }
+                x++;
+            }
+
+            if (num_cells && cur_cell->x > x)
+            {
+                int x_stop = cur_cell->x < nx ? cur_cell->x : nx;
+                alpha = fabs((cover << (agg::poly_subpixel_shift + 1)) /
+                             full);
+                alpha = alpha > 1.0 ? 1.0 : alpha;
+                for (i = x < 0 ? 0 : x; i < x_stop; i++)
+                {
+                    row[i] = alpha;
+                }
+            }
+        }
+    }
+}
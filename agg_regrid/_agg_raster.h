@@ -43,4 +43,7 @@
 void _raster(uint8_t *weights, const double *xi, const double *yi,
              int nx, int ny);
 
+void _raster_float(double *weights, const double *xi, const double *yi,
+                   int nx, int ny);
+
 #endif
@@ -0,0 +1,137 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A streaming pipeline of stages, each running on a background thread and
+connected by bounded queues.
+
+"""
+
+import queue
+import threading
+
+
+# The interval, in seconds, at which blocked stages check for a stop.
+_POLL = 0.1
+
+# Marks the end of the items of a stage.
+_END = object()
+
+
+class _Failure:
+    """Wraps the exception raised by a stage."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(target, item, stop):
+    """
+    Put the item on the target queue, unless stopped first.
+
+    Returns:
+        Whether the item was put on the queue.
+
+    """
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(source, stop):
+    """
+    Yield the items of the source queue up to the end, unless stopped first,
+    re-raising the exception of any failed stage.
+
+    """
+    while not stop.is_set():
+        try:
+            item = source.get(timeout=_POLL)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def _stage(items, func, target, stop):
+    """
+    Put the result of the function of each of the items on the target queue,
+    followed by the end marker, or the failure of the stage.
+
+    """
+    try:
+        for item in items:
+            if not _put(target, func(item), stop):
+                return
+    except Exception as error:
+        _put(target, _Failure(error), stop)
+    else:
+        _put(target, _END, stop)
+
+
+def pipeline(items, funcs, maxsize):
+    """
+    Stream the items through each of the functions in turn, with each
+    function running on its own background thread.
+
+    At most `maxsize` results of each function are queued ahead of the next
+    function (or the consumer of the pipeline), so that memory stays flat
+    however many items are streamed. Any exception raised by the iteration
+    of the items, or by a function, is re-raised to the consumer. Closing the
+    pipeline early stops the background threads.
+
+    Args:
+
+    * items:
+        An iterable of the items to stream. This is iterated on the
+        background thread of the first function.
+    * funcs:
+        The sequence of functions to apply to each item.
+    * maxsize (int):
+        The maximum number of results queued after each function.
+
+    Returns:
+        A generator of the results of the last function, in the order of
+        the items.
+
+    """
+    stop = threading.Event()
+    threads = []
+    source = iter(items)
+    for func in funcs:
+        target = queue.Queue(maxsize=maxsize)
+        thread = threading.Thread(target=_stage,
+                                  args=(source, func, target, stop))
+        thread.daemon = True
+        threads.append(thread)
+        source = _drain(target, stop)
+
+    for thread in threads:
+        thread.start()
+    try:
+        for result in source:
+            yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
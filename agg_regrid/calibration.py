@@ -0,0 +1,326 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Calibrate the accuracy against the cost of the area weights calculated
+for a source and target grid pair.
+
+The area weights of each setting, such as the engine, buffer depth and
+pixel format, are compared with the exact planar or spherical overlap areas
+of the target grid cells on the source grid.
+
+"""
+
+from collections import namedtuple
+import time
+
+import numpy as np
+
+from .core import DEFAULT_BUFFER_DEPTH
+from .engines import _rectilinear, build_weights, exact_weights
+
+
+#: The default buffer depths to calibrate.
+DEFAULT_DEPTHS = (1, 2, 4, 8, 16)
+
+#: The default pixel formats to calibrate.
+DEFAULT_PIXEL_FORMATS = ('gray8', 'float')
+
+
+class Calibration(namedtuple('Calibration', ['setting', 'max_error',
+                                             'mean_error',
+                                             'conservation_error',
+                                             'build_time'])):
+    """
+    The accuracy and cost of the area weights calculated with a setting.
+
+    * setting:
+        The dictionary of the engine and keyword arguments which calculated
+        the weights, see :func:`calibrate`.
+    * max_error:
+        The maximum absolute error of the normalised weights, being the
+        fractional contribution of each source grid cell to the area-weighted
+        mean of a target grid cell.
+    * mean_error:
+        The mean absolute error of the normalised weights.
+    * conservation_error:
+        The relative error of the total source grid area apportioned to the
+        target grid cells.
+    * build_time:
+        The time in seconds to calculate the weights.
+
+    """
+    __slots__ = ()
+
+
+def _source_areas(sx_bounds, sy_bounds, spherical=False):
+    # The relative areas of the source grid cells.
+    if spherical:
+        dx = np.diff(np.radians(sx_bounds))
+        dy = np.diff(np.sin(np.radians(sy_bounds)))
+        areas = np.abs(dy[:, np.newaxis] * dx)
+    else:
+        areas = np.ones((sy_bounds.size - 1, sx_bounds.size - 1))
+    return areas.ravel()
+
+
+def _errors(weights, reference, areas):
+    # Compare the normalised weights with the reference weights.
+    def normalised(w):
+        rows = w.rows
+        keep = w.data != 0
+        keys = rows[keep] * areas.size + w.indices[keep]
+        return keys, w.data[keep] / w.wsum[rows[keep]]
+
+    keys, values = normalised(weights)
+    ref_keys, ref_values = normalised(reference)
+    union = np.union1d(keys, ref_keys)
+    diff = np.zeros(union.size)
+    diff[np.searchsorted(union, keys)] += values
+    diff[np.searchsorted(union, ref_keys)] -= ref_values
+    diff = np.abs(diff)
+    max_error = diff.max() if diff.size else 0.0
+    mean_error = diff.mean() if diff.size else 0.0
+
+    # Compare the total source grid area apportioned to the target grid.
+    total = np.sum(weights.data * areas[weights.indices])
+    ref_total = np.sum(reference.data * areas[reference.indices])
+    if ref_total:
+        conservation_error = abs(total - ref_total) / ref_total
+    else:
+        conservation_error = abs(total)
+
+    return max_error, mean_error, conservation_error
+
+
+def calibrate(sx_bounds, sy_bounds, gx_bounds, gy_bounds, settings=None,
+              spherical=False, repeat=1):
+    """
+    Calibrate the accuracy and cost of the area weights calculated with
+    each setting, against the exact area weights.
+
+    Args:
+
+    * sx_bounds:
+        The source grid x-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * sy_bounds:
+        The source grid y-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * gx_bounds:
+        The target grid x-coordinate contiguous bounds in the source
+        coordinate system, which must be 2d.
+    * gy_bounds:
+        The target grid y-coordinate contiguous bounds in the source
+        coordinate system, which must be 2d.
+
+    Kwargs:
+
+    * settings:
+        A sequence of dictionaries of keyword arguments, each of which is
+        passed to :func:`agg_regrid.engines.build_weights`, with the name
+        of the 'engine' (defaults to 'agg') and the buffer 'depth' (defaults
+        to :data:`agg_regrid.DEFAULT_BUFFER_DEPTH`). Defaults to the 'agg'
+        engine with each of the :data:`DEFAULT_DEPTHS` and each of the
+        :data:`DEFAULT_PIXEL_FORMATS`, the 'separable' engine when the
+        target grid is rectilinear, and the 'exact' engine.
+    * spherical:
+        Compare with the exact overlap areas on the sphere, where the source
+        grid x and y coordinates are longitude and latitude in degrees.
+        Otherwise, compare with the exact planar overlap areas.
+        Defaults to False.
+    * repeat:
+        The number of times to calculate the weights of each setting, with
+        the shortest time reported. Defaults to 1.
+
+    Returns:
+        A list of :class:`Calibration`, one for each setting.
+
+    """
+    sx_bounds = np.asarray(sx_bounds, dtype=np.float64)
+    sy_bounds = np.asarray(sy_bounds, dtype=np.float64)
+
+    if settings is None:
+        settings = [dict(depth=depth, pixel_format=pixel_format)
+                    for pixel_format in DEFAULT_PIXEL_FORMATS
+                    for depth in DEFAULT_DEPTHS]
+        if _rectilinear(np.asarray(gx_bounds), np.asarray(gy_bounds)):
+            settings.append(dict(engine='separable'))
+        settings.append(dict(engine='exact'))
+
+    sx_points = (sx_bounds[:-1] + sx_bounds[1:]) / 2
+    sy_points = (sy_bounds[:-1] + sy_bounds[1:]) / 2
+    reference = exact_weights(sx_bounds, sy_bounds, gx_bounds, gy_bounds,
+                              spherical=spherical)
+    areas = _source_areas(sx_bounds, sy_bounds, spherical=spherical)
+
+    result = []
+    for setting in settings:
+        kwargs = dict(setting)
+        engine = kwargs.pop('engine', 'agg')
+        depth = kwargs.pop('depth', DEFAULT_BUFFER_DEPTH)
+        build_time = None
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            weights = build_weights(engine, sx_points, sx_bounds, sy_points,
+                                    sy_bounds, gx_bounds, gy_bounds, depth,
+                                    **kwargs)
+            elapsed = time.perf_counter() - start
+            if build_time is None or elapsed < build_time:
+                build_time = elapsed
+        errors = _errors(weights, reference, areas)
+        result.append(Calibration(dict(setting), *errors,
+                                  build_time=build_time))
+
+    return result
+
+
+def calibrate_cubes(src_grid_cube, tgt_grid_cube, settings=None,
+                    spherical=None, repeat=1):
+    """
+    Calibrate the accuracy and cost of the area weights calculated with
+    each setting for the source and target grid cubes, see
+    :func:`calibrate`.
+
+    Args:
+
+    * src_grid_cube:
+        The :class:`~iris.cube.Cube` providing the source grid.
+    * tgt_grid_cube:
+        The :class:`~iris.cube.Cube` providing the target grid.
+
+    Kwargs:
+
+    * settings:
+        A sequence of dictionaries of keyword arguments of the engine
+        which calculates the weights, see :func:`calibrate`.
+    * spherical:
+        Compare with the exact overlap areas on the sphere. Defaults to
+        True when the source grid coordinate system is geographic.
+    * repeat:
+        The number of times to calculate the weights of each setting.
+
+    Returns:
+        A list of :class:`Calibration`, one for each setting.
+
+    """
+    import iris.coord_systems
+    from . import _AreaWeightedRegridder
+
+    regridder = _AreaWeightedRegridder(src_grid_cube, tgt_grid_cube)
+    sx_bounds, sy_bounds, gx_bounds, gy_bounds = regridder._grid_bounds()
+
+    if spherical is None:
+        geog = (iris.coord_systems.GeogCS, iris.coord_systems.RotatedGeogCS)
+        spherical = isinstance(regridder._sx.coord_system, geog)
+
+    return calibrate(sx_bounds, sy_bounds, gx_bounds, gy_bounds,
+                     settings=settings, spherical=spherical, repeat=repeat)
+
+
+def synthetic_grids(src_shape=(40, 60), tgt_shape=(30, 45), angle=15.0,
+                    margin=1.0):
+    """
+    Create a regular source grid and a rotated regular target grid, which
+    lies within the source grid.
+
+    The source grid cells are 1 degree in size and centred on the origin.
+
+    Kwargs:
+
+    * src_shape:
+        The (y, x) shape of the source grid. Defaults to (40, 60).
+    * tgt_shape:
+        The (y, x) shape of the target grid. Defaults to (30, 45).
+    * angle:
+        The anti-clockwise rotation of the target grid in degrees.
+        Defaults to 15.
+    * margin:
+        The margin between the target grid and the edge of the source
+        grid, in source grid cells. Defaults to 1.
+
+    Returns:
+        Tuple of the 1d source x and y contiguous bounds, and the 2d
+        target grid x and y contiguous bounds.
+
+    """
+    sny, snx = src_shape
+    gny, gnx = tgt_shape
+    sx_bounds = np.arange(snx + 1, dtype=np.float64) - snx / 2
+    sy_bounds = np.arange(sny + 1, dtype=np.float64) - sny / 2
+
+    # Scale the rotated target grid to fit within the source grid.
+    theta = np.radians(angle)
+    cos, sin = abs(np.cos(theta)), abs(np.sin(theta))
+    scale = min((snx - 2 * margin) / (gnx * cos + gny * sin),
+                (sny - 2 * margin) / (gnx * sin + gny * cos))
+    u, v = np.meshgrid((np.arange(gnx + 1) - gnx / 2) * scale,
+                       (np.arange(gny + 1) - gny / 2) * scale)
+    gx_bounds = u * np.cos(theta) - v * np.sin(theta)
+    gy_bounds = u * np.sin(theta) + v * np.cos(theta)
+
+    return sx_bounds, sy_bounds, gx_bounds, gy_bounds
+
+
+def cheapest(calibrations, tolerance):
+    """
+    Select the calibration with the shortest build time that has a maximum
+    weight error within the tolerance.
+
+    Args:
+
+    * calibrations:
+        A sequence of :class:`Calibration`.
+    * tolerance:
+        The maximum absolute error of the normalised weights.
+
+    Returns:
+        The :class:`Calibration`, or None if no calibration is within
+        the tolerance.
+
+    """
+    valid = [calibration for calibration in calibrations
+             if calibration.max_error <= tolerance]
+    return min(valid, key=lambda c: c.build_time) if valid else None
+
+
+def report(calibrations):
+    """
+    Format the calibrations as a table, in order of build time.
+
+    Args:
+
+    * calibrations:
+        A sequence of :class:`Calibration`.
+
+    Returns:
+        The table string.
+
+    """
+    header = '{:<36} {:>10} {:>10} {:>12} {:>10}'.format(
+        'setting', 'max error', 'mean error', 'conservation', 'time (s)')
+    lines = [header, '-' * len(header)]
+    for calibration in sorted(calibrations, key=lambda c: c.build_time):
+        setting = ', '.join('{}={}'.format(key, value) for key, value
+                            in sorted(calibration.setting.items()))
+        lines.append('{:<36} {:>10.2e} {:>10.2e} {:>12.2e} {:>10.4f}'.format(
+            setting, calibration.max_error, calibration.mean_error,
+            calibration.conservation_error, calibration.build_time))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(report(calibrate(*synthetic_grids())))
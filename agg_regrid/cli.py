@@ -0,0 +1,322 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The ``agg-regrid`` command line batch regridder.
+
+Regrids every cube loaded from the input files on to the grid of the target
+file, and saves the result of each input file to the output directory with
+the same file name, e.g.
+
+    agg-regrid -t target.nc -o regridded/ --workers 4 input/*.nc
+
+Each distinct source grid is only regridded with one regridder, so the
+weights are only calculated once per source grid. The cubes of each input
+file are regridded in parallel by a pool of worker threads.
+
+"""
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+from . import (AreaWeighted, DEFAULT_BUFFER_DEPTH, DEFAULT_PIXEL_FORMAT,
+               get_xy_dim_coords, _grid_fingerprint)
+from .core import _PIXEL_FORMATS
+from .engines import _check_engine, engine_names
+
+# The phases of a batch regrid, in order.
+PHASES = ('load', 'build', 'regrid', 'save')
+
+
+class Summary:
+    """
+    The accumulated counts and per phase timings of a batch regrid.
+
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.cubes = 0
+        self.skipped = 0
+        self.regridders = 0
+        self.nbytes = 0
+        self.times = OrderedDict((phase, 0.) for phase in PHASES)
+
+    def __repr__(self):
+        msg = '{}(files={}, cubes={}, skipped={}, regridders={})'
+        return msg.format(self.__class__.__name__, self.files, self.cubes,
+                          self.skipped, self.regridders)
+
+    def timer(self, phase):
+        """
+        Returns a context manager that accumulates the elapsed time of its
+        block in the given phase.
+
+        """
+        return _Timer(self.times, phase)
+
+    def report(self):
+        """
+        Returns the summary as a printable table.
+
+        """
+        total = sum(self.times.values())
+        lines = ['Regridded {} cubes from {} files with {} regridders '
+                 '({} cubes skipped).'.format(self.cubes, self.files,
+                                              self.regridders, self.skipped)]
+        for phase, elapsed in self.times.items():
+            percent = 100. * elapsed / total if total else 0.
+            msg = '{:>8}: {:9.3f} s {:5.1f}%'
+            lines.append(msg.format(phase, elapsed, percent))
+        lines.append('{:>8}: {:9.3f} s'.format('total', total))
+        elapsed = self.times['regrid']
+        if elapsed:
+            msg = 'Throughput: {:.1f} cubes/s, {:.1f} MB/s of source data ' \
+                'regridded.'
+            lines.append(msg.format(self.cubes / elapsed,
+                                    self.nbytes / elapsed / 1e6))
+        return '\n'.join(lines)
+
+
+class _Timer:
+    def __init__(self, times, phase):
+        self.times = times
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.times[self.phase] += time.time() - self.start
+
+
+def _output_filename(filename, output_dir):
+    return os.path.join(output_dir, os.path.basename(filename))
+
+
+def _regrid_chunk(regridders, chunk):
+    return [regridders[key](cube) for key, cube in chunk]
+
+
+def regrid_files(filenames, target, output_dir, buffer_depth=None,
+                 pixel_format=None, engine='agg', workers=1, chunk_size=1,
+                 log=None, min_coverage=None):
+    """
+    Regrid the cubes of each of the input files on to the target grid, and
+    save them to the output directory.
+
+    Args:
+
+    * filenames:
+        The input file names.
+    * target:
+        The :class:`~iris.cube.Cube` defining the target grid.
+    * output_dir:
+        The directory to save the regridded input files to.
+
+    Kwargs:
+
+    * buffer_depth (int):
+        The AGG buffer depth. Defaults to
+        :data:`~agg_regrid.DEFAULT_BUFFER_DEPTH`.
+    * pixel_format (str):
+        The AGG pixel format. Defaults to
+        :data:`~agg_regrid.DEFAULT_PIXEL_FORMAT`.
+    * engine (str):
+        The weights engine, see :class:`~agg_regrid.AreaWeighted`.
+        Defaults to 'agg'.
+    * workers (int):
+        The number of worker threads regridding the cubes of each file.
+        Defaults to 1.
+    * chunk_size (int):
+        The number of cubes regridded by each task of a worker.
+        Defaults to 1.
+    * log:
+        A file to log the skipped cubes to. Defaults to :data:`sys.stderr`.
+    * min_coverage (float):
+        The minimum fraction of a target grid cell covered by the source
+        grid, for the target grid cell to be regridded. Defaults to None,
+        in which case only the target grid cells entirely within the
+        source grid are regridded.
+
+    Returns:
+        The :class:`Summary` of the batch regrid.
+
+    """
+    import iris
+    import iris.cube
+    import iris.exceptions
+
+    _check_engine(engine)
+
+    if workers < 1:
+        emsg = 'Expected at least one worker, got {}.'
+        raise ValueError(emsg.format(workers))
+
+    if chunk_size < 1:
+        emsg = 'Expected a chunk size of at least one, got {}.'
+        raise ValueError(emsg.format(chunk_size))
+
+    for filename in filenames:
+        output = _output_filename(filename, output_dir)
+        if os.path.realpath(filename) == os.path.realpath(output):
+            emsg = 'Cannot overwrite the input file {!r} with its output.'
+            raise ValueError(emsg.format(filename))
+
+    if log is None:
+        log = sys.stderr
+
+    scheme = AreaWeighted(buffer_depth=buffer_depth,
+                          pixel_format=pixel_format,
+                          min_coverage=min_coverage, engine=engine)
+    summary = Summary()
+    # The regridders, keyed by the fingerprint of their source grid.
+    regridders = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for filename in filenames:
+            with summary.timer('load'):
+                cubes = iris.load(filename)
+
+            # Build a regridder (and its weights) for each new source grid.
+            tasks = []
+            with summary.timer('build'):
+                for cube in cubes:
+                    try:
+                        key = _grid_fingerprint(*get_xy_dim_coords(cube))
+                        if key not in regridders:
+                            regridder = scheme.regridder(cube, target)
+                            regridder._get_weights()
+                            regridders[key] = regridder
+                    except (iris.exceptions.CoordinateNotFoundError,
+                            ValueError, TypeError) as error:
+                        msg = '{}: skipping cube {!r}: {}'
+                        print(msg.format(filename, cube.name(), error),
+                              file=log)
+                        summary.skipped += 1
+                        continue
+                    tasks.append((key, cube))
+
+            with summary.timer('regrid'):
+                chunks = [tasks[i:i + chunk_size]
+                          for i in range(0, len(tasks), chunk_size)]
+                results = executor.map(_regrid_chunk,
+                                       [regridders] * len(chunks), chunks)
+                result = iris.cube.CubeList(cube for chunk in results
+                                            for cube in chunk)
+
+            with summary.timer('save'):
+                if result:
+                    iris.save(result, _output_filename(filename, output_dir))
+
+            summary.files += 1
+            summary.cubes += len(result)
+            summary.nbytes += sum(cube.core_data().nbytes
+                                  for _, cube in tasks)
+
+    summary.regridders = len(regridders)
+    return summary
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog='agg-regrid',
+        description='Conservative area-weighted regridding of the cubes in '
+                    'the input files on to a target grid, using the '
+                    'Anti-Grain Geometry (AGG) rasteriser.')
+    parser.add_argument('inputs', nargs='+', metavar='INPUT',
+                        help='The input files to regrid.')
+    parser.add_argument('-t', '--target', required=True,
+                        help='The file containing the target grid cube.')
+    parser.add_argument('--target-name',
+                        help='The name of the target grid cube, if the '
+                             'target file contains more than one cube.')
+    parser.add_argument('-o', '--output-dir', required=True,
+                        help='The directory to save the regridded files to, '
+                             'with the same names as the input files.')
+    parser.add_argument('-d', '--depth', type=int,
+                        default=DEFAULT_BUFFER_DEPTH,
+                        help='The AGG buffer depth (default: %(default)s).')
+    parser.add_argument('--pixel-format', choices=sorted(_PIXEL_FORMATS),
+                        default=DEFAULT_PIXEL_FORMAT,
+                        help='The AGG pixel format (default: %(default)s).')
+    parser.add_argument('--engine', choices=engine_names(), default='agg',
+                        help='The weights engine (default: %(default)s).')
+    parser.add_argument('--min-coverage', type=float,
+                        help='Regrid the target grid cells partially '
+                             'covered by the source grid, with at least this '
+                             'fraction covered (default: only the target grid '
+                             'cells entirely within the source grid).')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The number of worker threads '
+                             '(default: %(default)s).')
+    parser.add_argument('-c', '--chunk-size', type=int, default=1,
+                        help='The number of cubes regridded by each worker '
+                             'task (default: %(default)s).')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not print the summary.')
+    return parser
+
+
+def main(argv=None):
+    """
+    The entry point of the ``agg-regrid`` command.
+
+    Kwargs:
+
+    * argv:
+        The command line arguments. Defaults to :data:`sys.argv`.
+
+    """
+    parser = _parser()
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error('argument -w/--workers: must be at least 1')
+    if args.chunk_size < 1:
+        parser.error('argument -c/--chunk-size: must be at least 1')
+    if args.min_coverage is not None and \
+            not 0 <= args.min_coverage <= 1:
+        parser.error('argument --min-coverage: must be between 0 and 1')
+    if not os.path.isdir(args.output_dir):
+        parser.error('output directory {!r} does not '
+                     'exist'.format(args.output_dir))
+
+    import iris
+
+    start = time.time()
+    target = iris.load_cube(args.target, args.target_name)
+    load_target = time.time() - start
+
+    summary = regrid_files(args.inputs, target, args.output_dir,
+                           buffer_depth=args.depth,
+                           pixel_format=args.pixel_format,
+                           engine=args.engine, workers=args.workers,
+                           chunk_size=args.chunk_size,
+                           min_coverage=args.min_coverage)
+    summary.times['load'] += load_target
+
+    if not args.quiet:
+        print(summary.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1489 @@
+# (C) British Crown Copyright 2015 - 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The array-level API of agg-regrid, which has no dependency on iris.
+
+"""
+
+from collections import namedtuple, OrderedDict
+from math import ceil, floor
+import operator
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+import numpy.ma as ma
+
+from ._agg import raster as agg_raster
+from ._agg import raster_float as agg_raster_float
+
+
+# Default to using an 8x8 pixel buffer for each source grid cell.
+DEFAULT_BUFFER_DEPTH = 8
+
+# Default to rendering 8-bit grey-scale coverage for each pixel.
+DEFAULT_PIXEL_FORMAT = 'gray8'
+
+# The names of the supported aggregations of the source data within each
+# target grid cell.
+AGGREGATIONS = ('mean', 'sum', 'fraction', 'min', 'max', 'std')
+
+# The supported pixel formats, mapped to the associated raster function,
+# pixel buffer dtype and coverage value of a fully covered pixel.
+_PIXEL_FORMATS = {'gray8': (agg_raster, np.uint8, 255),
+                  'float': (agg_raster_float, np.float64, 1)}
+
+# The number of source mask patterns with cached mask-adjusted weights.
+_MASK_CACHE_SIZE = 8
+
+# The supported precisions of compact weights.
+_PRECISIONS = ('float64', 'float32', 'fixed')
+
+# The directory of the files of shared weights, being shared memory where
+# available.
+_SHARED_DIR = '/dev/shm'
+
+# The byte alignment of each array in the file of shared weights.
+_SHARED_ALIGN = 64
+
+# The approximate number of gathered source data values in each block of
+# target grid cells and leading slices applied together, sized so that
+# the temporaries of each block stay in cache.
+_BLOCK_SIZE = 2 ** 15
+
+# The maximum number of leading slices in each block.
+_BLOCK_LEADING = 16
+
+
+class Weights:
+    """
+    The sparse area weights of the source grid cells overlapped by each
+    target grid cell.
+
+    The weights are held in compressed sparse row form, with one row per
+    target grid cell and one column per source grid cell, both in (y, x)
+    row-major order. Each row holds the weights of the source grid cells
+    within the bounding window of the target grid cell.
+
+    """
+
+    def __init__(self, src_shape, tgt_shape, indptr, indices, data, wsum,
+                 tgt_area=None, quantum=None):
+        """
+        Args:
+
+        * src_shape:
+            The (y, x) shape of the source grid.
+        * tgt_shape:
+            The (y, x) shape of the target grid.
+        * indptr:
+            The 1d offsets into the `indices` and `data` of each target grid
+            cell, with one more element than the number of target grid cells.
+        * indices:
+            The 1d flattened indices of the source grid cells within the
+            window of each target grid cell.
+        * data:
+            The 1d fraction of each source grid cell covered by the
+            associated target grid cell.
+        * wsum:
+            The 1d sum of the weights of each target grid cell.
+
+        Kwargs:
+
+        * tgt_area:
+            The 1d area of each target grid cell, in units of the (uniform)
+            area of a source grid cell. Defaults to None, in which case the
+            :attr:`coverage` is unknown.
+        * quantum:
+            The quantum of the weights, when they are all exact multiples of
+            it, such as the 'gray8' AGG weights. Defaults to None.
+
+        """
+        self.src_shape = tuple(src_shape)
+        self.tgt_shape = tuple(tgt_shape)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self._indices = np.asarray(indices, dtype=np.int64)
+        self._data = np.asarray(data, dtype=np.float64)
+        self.wsum = np.asarray(wsum, dtype=np.float64)
+        self.quantum = quantum
+
+        # The start of the rectangular source window of each target grid
+        # cell, which replaces the indices of compact weights, and the
+        # fixed-point scale and precision of the compact weights.
+        self._starts = None
+        self._scale = None
+        self._precision = None
+
+        # The maximum absolute error of the stored weights.
+        self.error = 0.
+
+        tgt_size = int(np.prod(self.tgt_shape))
+        if self.indptr.shape != (tgt_size + 1,):
+            emsg = 'Expected {} weights row offsets for target grid {}, ' \
+                'got {}.'
+            raise ValueError(emsg.format(tgt_size + 1, self.tgt_shape,
+                                         self.indptr.size))
+
+        if self._indices.shape != self._data.shape:
+            emsg = 'Misaligned weights indices {} and data {}.'
+            raise ValueError(emsg.format(self._indices.shape,
+                                         self._data.shape))
+
+        if self.wsum.shape != (tgt_size,):
+            emsg = 'Expected {} weights sums for target grid {}, got {}.'
+            raise ValueError(emsg.format(tgt_size, self.tgt_shape,
+                                         self.wsum.size))
+
+        self.tgt_area = tgt_area
+        if tgt_area is not None:
+            self.tgt_area = np.asarray(tgt_area, dtype=np.float64)
+            if self.tgt_area.shape != (tgt_size,):
+                emsg = 'Expected {} target grid cell areas for target grid ' \
+                    '{}, got {}.'
+                raise ValueError(emsg.format(tgt_size, self.tgt_shape,
+                                             self.tgt_area.size))
+        self._coverage = None
+
+        # The target grid cells without weights, which are always masked.
+        self.tgt_mask = (np.diff(self.indptr) == 0).reshape(self.tgt_shape)
+        self._tgt_masked = self.tgt_mask.any()
+
+        # Group the target grid cells by their number of weights, so that
+        # the weights of each group may be applied as a dense block. Each
+        # group is the target grid cells, their number of weights, and the
+        # source window pattern of compact weights.
+        self._groups = []
+        counts = np.diff(self.indptr)
+        for count in np.unique(counts[counts > 0]):
+            rows = np.flatnonzero(counts == count)
+            self._groups.append((rows, int(count), None))
+
+        # The transposed weights, calculated on demand for the adjoint.
+        self._transposed = None
+
+        # The least recently used cache of the mask-adjusted weights, keyed
+        # by the packed source mask.
+        self._mask_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # The reference to the shared arrays of the weights, and the
+        # finalizer which removes the file of the shared arrays.
+        self._shared = None
+        self._owner = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        # The derived caches are recalculated on demand.
+        state['_mask_cache'] = OrderedDict()
+        state['_transposed'] = None
+        state['_coverage'] = None
+        state['_owner'] = None
+        if self._shared is not None:
+            # Pickle the shared arrays by reference.
+            for name in self._arrays():
+                state.pop(name, None)
+            state['_groups'] = [(None, count, None)
+                                for _, count, _ in self._groups]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        if self._shared is not None:
+            try:
+                arrays = self._shared.load()
+            except FileNotFoundError:
+                emsg = 'The file {!r} of the shared weights no longer ' \
+                    'exists, as the shared weights were garbage collected ' \
+                    'or the file was removed before they were unpickled.'
+                raise FileNotFoundError(emsg.format(self._shared.filename))
+            self._set_arrays(arrays)
+
+    def __repr__(self):
+        msg = '{}(src_shape={}, tgt_shape={}, nnz={})'
+        return msg.format(self.__class__.__name__, self.src_shape,
+                          self.tgt_shape, self.nnz)
+
+    @property
+    def nnz(self):
+        """The number of stored weights."""
+        return self._data.size
+
+    @property
+    def indices(self):
+        """
+        The 1d flattened index of the source grid cell of each stored weight.
+
+        """
+        if self._starts is None:
+            return self._indices
+        # Expand the source windows of the compact weights.
+        indices = np.empty(self.nnz, dtype=self._starts.dtype)
+        for rows, count, pattern in self._groups:
+            block_indices, offsets = self._gather(rows, count, pattern)
+            indices[offsets] = block_indices
+        return indices
+
+    @property
+    def data(self):
+        """The 1d fraction of each source grid cell of each stored weight."""
+        if self._scale is not None:
+            return self._data * self._scale
+        return self._data.astype(np.float64, copy=False)
+
+    @property
+    def nbytes(self):
+        """The total memory footprint of the weights, in bytes."""
+        return sum(self.footprint().values())
+
+    def footprint(self):
+        """
+        The memory footprint of each part of the weights, including any
+        cached results, in bytes.
+
+        Returns:
+            A :class:`collections.OrderedDict` of the name and number of
+            bytes of each part.
+
+        """
+        def nbytes(*arrays):
+            return sum(array.nbytes for array in arrays
+                       if array is not None)
+
+        groups = [array for group in self._groups for array in group
+                  if isinstance(array, np.ndarray)]
+        with self._lock:
+            cached = [array for entry in self._mask_cache.values()
+                      for array in entry]
+        transposed = self._transposed or ()
+
+        result = OrderedDict()
+        result['indptr'] = nbytes(self.indptr)
+        result['indices'] = nbytes(self._indices, self._starts)
+        result['data'] = nbytes(self._data)
+        result['groups'] = nbytes(*groups)
+        result['wsum'] = nbytes(self.wsum, self.tgt_area)
+        result['tgt_mask'] = nbytes(self.tgt_mask)
+        result['cache'] = nbytes(self._coverage, *cached + list(transposed))
+        return result
+
+    def compact(self, precision='float32'):
+        """
+        Compact the storage of the weights in place, to reduce the memory
+        footprint of the weights of very large regridders several-fold.
+
+        The source grid cells of each target grid cell are stored as the
+        start of their rectangular window, as calculated by all the builtin
+        engines, otherwise as 32-bit indices where they fit. The weights are
+        stored in the given precision, and the maximum absolute error of
+        the stored weights is the :attr:`error`.
+
+        Kwargs:
+
+        * precision:
+            The precision of the stored weights, either 'float64' for the
+            exact weights, 'float32', or 'fixed' for 16-bit (or 32-bit)
+            fixed-point weights in units of the :attr:`quantum`, which is
+            exact, or else in units of 1/65535 of the largest weight.
+            Defaults to 'float32'.
+
+        Returns:
+            The compacted weights.
+
+        """
+        _check_precision(precision)
+
+        # The compacted arrays are no longer shared.
+        self._shared = None
+
+        with self._lock:
+            self._mask_cache.clear()
+        self._transposed = None
+
+        if self._starts is None:
+            self._compact_indices()
+
+        data = self.data
+        if precision == 'fixed':
+            quantum = self.quantum
+            if quantum is None:
+                quantum = (data.max() if data.size else 1.) / 65535
+            stored = np.rint(data / quantum)
+            dtype = np.uint16 if stored.max(initial=0) <= 65535 \
+                else np.uint32
+            self._data = stored.astype(dtype)
+            self._scale = quantum
+        else:
+            self._data = data.astype(precision)
+            self._scale = None
+        self._precision = precision
+        self.error += float(np.max(np.abs(self.data - data), initial=0))
+        return self
+
+    def window(self, y, x):
+        """
+        Returns the weights of a rectangular window of the target grid,
+        such as a regional subdomain, taken from these weights without any
+        recalculation.
+
+        Args:
+
+        * y:
+            The slice of the target grid rows of the window.
+        * x:
+            The slice of the target grid columns of the window.
+
+        Returns:
+            The :class:`Weights` of the window, with the same source grid,
+            and stored in the same precision.
+
+        """
+        ny, nx = self.tgt_shape
+        y = _window_slice(y, ny, 'y')
+        x = _window_slice(x, nx, 'x')
+        cells = (np.arange(y.start, y.stop)[:, np.newaxis] * nx +
+                 np.arange(x.start, x.stop)).ravel()
+
+        counts = np.diff(self.indptr)[cells]
+        indptr = np.zeros(cells.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        positions = np.repeat(self.indptr[cells] - indptr[:-1], counts)
+        positions += np.arange(positions.size)
+
+        if self._starts is None:
+            indices = self._indices[positions]
+        else:
+            # Expand the source windows of the window target grid cells.
+            indices = np.empty(positions.size, dtype=self._starts.dtype)
+            local = np.full(self.wsum.size, -1, dtype=np.int64)
+            local[cells] = np.arange(cells.size)
+            for rows, count, pattern in self._groups:
+                window = local[rows]
+                inside = window >= 0
+                offsets = indptr[window[inside], np.newaxis] + np.arange(count)
+                indices[offsets] = (self._starts[rows[inside], np.newaxis] +
+                                    pattern)
+
+        data = self._data[positions]
+        quantum = self.quantum
+        if self._scale is not None:
+            # The fixed-point weights are exact multiples of their scale.
+            data = data * self._scale
+            quantum = self._scale
+
+        tgt_area = None
+        if self.tgt_area is not None:
+            tgt_area = self.tgt_area[cells]
+
+        result = Weights(self.src_shape, (y.stop - y.start, x.stop - x.start),
+                         indptr, indices, data, self.wsum[cells],
+                         tgt_area=tgt_area, quantum=quantum)
+        if self._precision is not None:
+            result.compact(self._precision)
+        result.error = self.error
+        return result
+
+    def share(self, filename=None):
+        """
+        Share the arrays of the weights through a memory mapped file, so
+        that pickling the weights, or a regridder with these weights, only
+        pickles a reference to the file. Each process that unpickles the
+        weights maps the same file, rather than receiving its own copy, e.g.
+        when sending a regridder to many worker processes on the same host.
+
+        Kwargs:
+
+        * filename:
+            The name of the file to share the arrays through, which must be
+            accessible to the other processes, and which remains after
+            use. Defaults to None, in which case a temporary file in shared
+            memory (where available) is used, and removed once these weights
+            are garbage collected.
+
+        Returns:
+            The shared weights.
+
+        .. note::
+
+            The file must exist when the weights are unpickled, and the
+            weights are read-only once shared. In particular, the temporary
+            file is removed once these weights are garbage collected, so
+            these weights must be kept until every pickle of them has been
+            unpickled, e.g. by the tasks queued for worker processes.
+
+        """
+        owner = filename is None
+        if owner:
+            directory = _SHARED_DIR if os.path.isdir(_SHARED_DIR) else None
+            handle, filename = tempfile.mkstemp(prefix='agg_regrid-',
+                                                suffix='.weights',
+                                                dir=directory)
+            os.close(handle)
+
+        shared = _SharedFile.create(filename, self._arrays())
+        self._set_arrays(shared.load())
+        self._shared = shared
+        if owner:
+            self._owner = weakref.finalize(self, _remove, filename,
+                                           os.getpid())
+        return self
+
+    def _arrays(self):
+        # The arrays of the weights, by attribute name, with the arrays of
+        # each group named by their position.
+        arrays = OrderedDict()
+        for name in ('indptr', '_indices', '_starts', '_data', 'wsum',
+                     'tgt_area', 'tgt_mask'):
+            array = getattr(self, name)
+            if array is not None:
+                arrays[name] = array
+        for i, (rows, _, pattern) in enumerate(self._groups):
+            arrays['_groups.{}.rows'.format(i)] = rows
+            if pattern is not None:
+                arrays['_groups.{}.pattern'.format(i)] = pattern
+        return arrays
+
+    def _set_arrays(self, arrays):
+        # Replace the arrays of the weights, as named by _arrays.
+        groups = []
+        for i, (_, count, _) in enumerate(self._groups):
+            rows = arrays.pop('_groups.{}.rows'.format(i))
+            pattern = arrays.pop('_groups.{}.pattern'.format(i), None)
+            groups.append((rows, count, pattern))
+        self._groups = groups
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def _compact_indices(self):
+        # Store the source grid cell indices as the start of the rectangular
+        # window of each target grid cell, or else as 32-bit indices where
+        # they fit.
+        src_size = int(np.prod(self.src_shape))
+        dtype = np.int32 if src_size <= np.iinfo(np.int32).max else np.int64
+        snx = self.src_shape[1]
+        counts = np.diff(self.indptr)
+        cells = np.flatnonzero(counts)
+        indices = self._indices
+        first = indices[self.indptr[cells]]
+        last = indices[self.indptr[cells + 1] - 1]
+        heights = (last - first) // snx + 1
+        widths = counts[cells] // heights
+        if np.any(heights * widths != counts[cells]):
+            # The weights are not over rectangular windows.
+            self._indices = indices.astype(dtype)
+            return
+
+        groups = []
+        starts = np.zeros(counts.size, dtype=dtype)
+        starts[cells] = first
+        shapes = np.stack([heights, widths], axis=-1)
+        for height, width in np.unique(shapes, axis=0):
+            rows = cells[(heights == height) & (widths == width)]
+            pattern = (np.arange(height)[:, np.newaxis] * snx +
+                       np.arange(width)).ravel().astype(dtype)
+            offsets = self.indptr[rows, np.newaxis] + np.arange(pattern.size)
+            if not np.array_equal(starts[rows, np.newaxis] + pattern,
+                                  indices[offsets]):
+                # The weights are not over rectangular windows.
+                self._indices = indices.astype(dtype)
+                return
+            groups.append((rows.astype(dtype), pattern.size, pattern))
+
+        self._starts = starts
+        self._indices = None
+        self._groups = groups
+
+    def _gather(self, rows, count, pattern):
+        """
+        Returns the 2d source grid cell indices, and the offsets of the
+        stored weights, of the target grid cells of a group.
+
+        """
+        offsets = self.indptr[rows, np.newaxis] + np.arange(count)
+        if pattern is None:
+            indices = self._indices[offsets]
+        else:
+            indices = self._starts[rows, np.newaxis] + pattern
+        return indices, offsets
+
+    @property
+    def coverage(self):
+        """
+        The 2d fraction of each target grid cell covered by the source grid,
+        or None if the areas of the target grid cells are unknown.
+
+        """
+        if self._coverage is None and self.tgt_area is not None:
+            coverage = np.zeros(self.wsum.shape)
+            np.divide(self.wsum, self.tgt_area, out=coverage,
+                      where=self.tgt_area > 0)
+            # Allow for the quantised coverage of AGG pixels.
+            np.clip(coverage, 0, 1, out=coverage)
+            coverage = coverage.reshape(self.tgt_shape)
+            coverage.flags.writeable = False
+            self._coverage = coverage
+        return self._coverage
+
+    @property
+    def rows(self):
+        """The 1d target grid cell (row) index of each stored weight."""
+        return np.repeat(np.arange(self.wsum.size), np.diff(self.indptr))
+
+    def apply(self, data):
+        """
+        Perform the area-weighted regrid of the data.
+
+        Args:
+
+        * data:
+            The source data, which must be 3d with shape (-1, y, x).
+
+        Returns:
+            The regridded data with shape (-1, y, x) of the target grid. This
+            is a :class:`numpy.ndarray`, unless target grid cells have no
+            weights or the source data is masked, in which case it is a
+            :class:`numpy.ma.MaskedArray`.
+
+        """
+        result, = self.aggregate(data, ('mean',))
+        return result
+
+    def aggregate(self, data, aggregations):
+        """
+        Perform each of the area-weighted aggregations of the data over the
+        source grid cells of each target grid cell, together in one pass
+        over the data.
+
+        The supported aggregations are:
+
+        * 'mean': the area-weighted mean, as for :meth:`apply`.
+        * 'sum': the area-weighted sum, for extensive quantities.
+        * 'fraction': the fraction of the weight of each target grid cell
+          from unmasked source data.
+        * 'min', 'max': the minimum and maximum of the unmasked source data
+          overlapping each target grid cell.
+        * 'std': the area-weighted standard deviation of the unmasked source
+          data overlapping each target grid cell.
+
+        Args:
+
+        * data:
+            The source data, which must be 3d with shape (-1, y, x).
+        * aggregations:
+            The sequence of the names of the aggregations.
+
+        Returns:
+            A list of the result of each aggregation, with shape (-1, y, x)
+            of the target grid. Each is a :class:`numpy.ndarray`, unless any
+            of its target grid cells are masked, in which case it is a
+            :class:`numpy.ma.MaskedArray`.
+
+        """
+        aggregations = tuple(aggregations)
+        for name in aggregations:
+            if name not in AGGREGATIONS:
+                emsg = 'Invalid aggregation, got {!r} expected one of {}.'
+                raise ValueError(emsg.format(name, list(AGGREGATIONS)))
+
+        if data.ndim != 3 or data.shape[1:] != self.src_shape:
+            emsg = 'Expected src data with shape (-1,) + {}, got {}.'
+            raise ValueError(emsg.format(self.src_shape, data.shape))
+
+        # Manipulating masked arrays can be of the order 4-5 times slower,
+        # therefore use the underlying numpy array if there are no masked data
+        if ma.isMA(data) and not ma.is_masked(data):
+            data = data.data
+
+        n = data.shape[0]
+        size = self.wsum.size
+        data = data.reshape(n, -1)
+        results = {name: np.empty((n, size)) for name in aggregations}
+
+        # The statistics of the source data within each target grid cell
+        # are only over the overlapping (non-zero weight) source data, which
+        # may be empty when the source data is masked.
+        extrema = {'min', 'max', 'std'}.intersection(aggregations)
+        mask = empty = None
+
+        if ma.isMA(data):
+            # Group the slices by their source mask, which is typically
+            # shared by every slice (e.g. a land-sea mask), so that each
+            # group is aggregated with the same mask-adjusted weights.
+            masks = ma.getmaskarray(data)
+            values = ma.filled(data, 0)
+            patterns = OrderedDict()
+            for i, src_mask in enumerate(masks):
+                key = np.packbits(src_mask).tobytes()
+                patterns.setdefault(key, []).append(i)
+
+            mask = np.empty((n, size), dtype=bool)
+            if extrema:
+                empty = np.empty((n, size), dtype=bool)
+            for key, index in patterns.items():
+                weights, tgt_mask, tgt_empty, fraction = \
+                    self._masked_weights(key, masks[index[0]])
+                if len(index) == n:
+                    index = slice(None)
+                    part = results
+                else:
+                    part = {name: np.empty((len(index), size))
+                            for name in aggregations}
+                self._accumulate(values[index], weights, part)
+                if 'fraction' in part:
+                    part['fraction'][:] = fraction
+                if part is not results:
+                    for name in aggregations:
+                        results[name][index] = part[name]
+                mask[index] = tgt_mask
+                if empty is not None:
+                    empty[index] = tgt_empty
+        else:
+            self._accumulate(data, self._data, results)
+            if 'fraction' in results:
+                results['fraction'][:] = 1
+            # Only build the result masks when required.
+            if self._tgt_masked:
+                mask = np.empty((n, size), dtype=bool)
+                mask[:] = self.tgt_mask.ravel()
+
+        shape = (n,) + self.tgt_shape
+        result = []
+        for name in aggregations:
+            values = results[name].reshape(shape)
+            name_mask = mask
+            if name in extrema and empty is not None:
+                name_mask = mask | empty
+            if name_mask is not None:
+                name_mask = name_mask.reshape(shape)
+                if len(aggregations) > 1:
+                    # Each result owns its mask.
+                    name_mask = name_mask.copy()
+                values = ma.masked_array(values, mask=name_mask)
+            result.append(values)
+
+        return result
+
+    def _accumulate(self, values, weights, results):
+        """
+        Aggregate the unmasked source data with the given weights, which
+        are zero for any masked source data, into the results of each
+        aggregation, except 'fraction'.
+
+        """
+        n = values.shape[0]
+        for group_rows, count, pattern in self._groups:
+            last = None
+            for lead, tile in _blocks(n, group_rows.size, count):
+                if tile != last:
+                    # Gather the weights of each tile once, for all of its
+                    # chunks of leading slices.
+                    last = tile
+                    rows = group_rows[tile]
+                    indices, offsets = self._gather(rows, count, pattern)
+                    row_weights = weights[offsets]
+                    wsum = self.wsum[rows]
+                src = values[lead, indices]
+                # Ensure the weighted source data is contiguous over each
+                # target grid cell, to sum over the source region in
+                # row-major order.
+                tmp = np.multiply(src, row_weights, order='C',
+                                  dtype=np.float64)
+                numerator = tmp.sum(axis=-1)
+                if self._scale is not None:
+                    numerator *= self._scale
+
+                if 'mean' in results:
+                    results['mean'][lead, rows] = numerator / wsum
+                if 'sum' in results:
+                    results['sum'][lead, rows] = numerator
+
+                if {'min', 'max', 'std'}.intersection(results):
+                    inside = np.broadcast_to(row_weights > 0, src.shape)
+                    if 'min' in results:
+                        results['min'][lead, rows] = np.where(
+                            inside, src, np.inf).min(axis=-1)
+                    if 'max' in results:
+                        results['max'][lead, rows] = np.where(
+                            inside, src, -np.inf).max(axis=-1)
+                    if 'std' in results:
+                        w = np.where(inside, row_weights, 0).astype(
+                            np.float64, copy=False)
+                        wvalid = w.sum(axis=-1)
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            mean = (w * src).sum(axis=-1) / wvalid
+                            deviation = src - mean[..., np.newaxis]
+                            variance = ((w * deviation ** 2).sum(axis=-1) /
+                                        wvalid)
+                        results['std'][lead, rows] = np.sqrt(variance)
+
+    def _masked_weights(self, key, src_mask):
+        """
+        Returns the weights adjusted for the 1d source mask, with zero
+        weight for the masked source data, along with the 1d mask of the
+        target grid cells with all their source data masked, the 1d mask of
+        the target grid cells without overlapping unmasked source data, and
+        the 1d fraction of the weight of each target grid cell from unmasked
+        source data.
+
+        These are cached for the most recently used source masks, by their
+        packed key.
+
+        """
+        with self._lock:
+            entry = self._mask_cache.get(key)
+            if entry is not None:
+                self._mask_cache.move_to_end(key)
+                return entry
+
+        weights = self._data.copy()
+        tgt_mask = self.tgt_mask.ravel().copy()
+        tgt_empty = np.zeros(self.wsum.shape, dtype=bool)
+        fraction = np.zeros(self.wsum.shape)
+        for rows, count, pattern in self._groups:
+            indices, offsets = self._gather(rows, count, pattern)
+            masked = src_mask[indices]
+            weights[offsets[masked]] = 0
+            row_weights = weights[offsets]
+            # A target grid cell is masked when all its source data
+            # are masked.
+            tgt_mask[rows] = masked.all(axis=-1)
+            tgt_empty[rows] = ~(row_weights > 0).any(axis=-1)
+            valid = row_weights.sum(axis=-1, dtype=np.float64)
+            if self._scale is not None:
+                valid *= self._scale
+            fraction[rows] = valid / self.wsum[rows]
+
+        entry = (weights, tgt_mask, tgt_empty, fraction)
+        with self._lock:
+            self._mask_cache[key] = entry
+            while len(self._mask_cache) > _MASK_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+        return entry
+
+    def _transpose(self):
+        # Order the normalised weights by source grid cell (column), to sum
+        # the contributions to each source grid cell as contiguous runs.
+        if self._transposed is None:
+            indices = self.indices
+            order = np.argsort(indices, kind='stable')
+            rows = self.rows[order]
+            weights = self.data[order] / self.wsum[rows]
+            columns, starts = np.unique(indices[order], return_index=True)
+            self._transposed = (rows, weights, columns, starts)
+        return self._transposed
+
+    def apply_adjoint(self, data):
+        """
+        Perform the adjoint (transpose) of the area-weighted regrid, which
+        maps the target grid data back on to the source grid.
+
+        Each source grid cell accumulates the data of each target grid cell
+        scaled by the normalised weight of the source grid cell within that
+        target grid cell, which is the transpose of the area-weighted regrid
+        of unmasked source data. Masked target data contribute nothing, and
+        source grid cells outside the target grid are zero.
+
+        Args:
+
+        * data:
+            The target data, which must be 3d with shape (-1, y, x).
+
+        Returns:
+            The adjoint data with shape (-1, y, x) of the source grid.
+
+        """
+        if data.ndim != 3 or data.shape[1:] != self.tgt_shape:
+            emsg = 'Expected tgt data with shape (-1,) + {}, got {}.'
+            raise ValueError(emsg.format(self.tgt_shape, data.shape))
+
+        n = data.shape[0]
+        data = ma.filled(data, 0).reshape(n, -1)
+        result = np.zeros((n, int(np.prod(self.src_shape))))
+
+        rows, weights, columns, starts = self._transpose()
+        if columns.size:
+            contributions = data[:, rows] * weights
+            result[:, columns] = np.add.reduceat(contributions, starts,
+                                                 axis=-1)
+
+        return result.reshape((n,) + self.src_shape)
+
+
+class _SharedFile(namedtuple('_SharedFile', 'filename layout')):
+    """
+    The reference to arrays shared through a file, being the name of the
+    file, and the byte offset, dtype and shape of each named array.
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, filename, arrays):
+        """
+        Write the named arrays to the file, and return their reference.
+
+        """
+        layout = OrderedDict()
+        offset = 0
+        with open(filename, 'wb') as fh:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                offset = -(-offset // _SHARED_ALIGN) * _SHARED_ALIGN
+                layout[name] = (offset, array.dtype.str, array.shape)
+                fh.seek(offset)
+                fh.write(array.data)
+                offset += array.nbytes
+            fh.truncate(offset)
+        return cls(filename, layout)
+
+    def load(self):
+        """
+        Returns the named read-only arrays, memory mapped from the file.
+
+        """
+        arrays = OrderedDict()
+        for name, (offset, dtype, shape) in self.layout.items():
+            if np.prod(shape, dtype=np.int64):
+                array = np.memmap(self.filename, dtype=dtype, mode='r',
+                                  offset=offset, shape=shape)
+                arrays[name] = np.asarray(array)
+            else:
+                arrays[name] = np.empty(shape, dtype=dtype)
+        return arrays
+
+
+def _remove(filename, pid):
+    # Remove the file of shared weights, in the process which created it.
+    if os.getpid() == pid:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class BuildCancelled(Exception):
+    """
+    Raised when the calculation of the weights is cancelled.
+
+    """
+
+
+class Progress(namedtuple('Progress', 'done total elapsed')):
+    """
+    The progress of the calculation of the weights, being the number of
+    target grid cells done, the total number of target grid cells, and the
+    elapsed time in seconds.
+
+    """
+
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """The number of target grid cells done per second."""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def remaining(self):
+        """
+        The estimated time remaining in seconds, or None if unknown.
+
+        """
+        rate = self.rate
+        return (self.total - self.done) / rate if rate else None
+
+
+class _Monitor:
+    """
+    Reports the progress of the calculation of the weights to the progress
+    callback, and checks the cancellation token.
+
+    """
+
+    def __init__(self, total, progress=None, cancel=None):
+        self.total = total
+        self.progress = progress
+        self.cancel = cancel
+        self.start = time.perf_counter()
+
+    def __call__(self, done):
+        if done < self.total and self.cancel is not None and \
+                self.cancel.is_set():
+            emsg = 'The calculation of the weights was cancelled after {} ' \
+                'of {} target grid cells.'
+            raise BuildCancelled(emsg.format(done, self.total))
+        if self.progress is not None:
+            elapsed = time.perf_counter() - self.start
+            self.progress(Progress(done, self.total, elapsed))
+
+
+def _blocks(n, nrows, count):
+    """
+    Yield the slices of the leading dimension and of the target grid cells
+    of each block of a group of target grid cells, each with `count`
+    weights, in tile-major order.
+
+    Each spatial tile of (row-major, and so spatially adjacent) target grid
+    cells is applied to a chunk of the leading slices at a time, so that the
+    gathered source windows of the block are reused from cache rather than
+    streamed from memory over every leading slice.
+
+    """
+    leading = max(1, min(n, _BLOCK_LEADING, _BLOCK_SIZE // count))
+    tile = max(1, _BLOCK_SIZE // (leading * count))
+    for start in range(0, nrows, tile):
+        rows = slice(start, start + tile)
+        for lead in range(0, n, leading):
+            yield slice(lead, lead + leading), rows
+
+
+def _reuse_rows(weights, reuse, other):
+    # Combine the rows of the weights, selected for each target grid cell
+    # by the reuse index (or -1), with the rows of the other weights for
+    # the remaining target grid cells, into new weights with the source
+    # and target grids of the other weights.
+    reused = reuse >= 0
+    source = np.where(reused, reuse, 0)
+    counts = np.where(reused, np.diff(weights.indptr)[source],
+                      np.diff(other.indptr))
+    starts = np.where(reused, weights.indptr[source],
+                      other.indptr[:-1] + weights.indices.size)
+
+    indptr = np.zeros(counts.size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    positions = np.repeat(starts - indptr[:-1], counts)
+    positions += np.arange(positions.size)
+
+    indices = np.concatenate([weights.indices, other.indices])[positions]
+    data = np.concatenate([weights.data, other.data])[positions]
+    wsum = np.where(reused, weights.wsum[source], other.wsum)
+    tgt_area = None
+    if weights.tgt_area is not None and other.tgt_area is not None:
+        tgt_area = np.where(reused, weights.tgt_area[source], other.tgt_area)
+
+    quantum = other.quantum if weights.quantum == other.quantum else None
+
+    return Weights(other.src_shape, other.tgt_shape, indptr, indices, data,
+                   wsum, tgt_area=tgt_area, quantum=quantum)
+
+
+def _check_src_grid(sx_points, sx_bounds, sy_points, sy_bounds):
+    # Sanity check the source grid coordinates.
+    if sx_points.ndim != 1:
+        emsg = 'Expected 1d src x-coordinate points, got {}d.'
+        raise ValueError(emsg.format(sx_points.ndim))
+
+    if sy_points.ndim != 1:
+        emsg = 'Expected 1d src y-coordinate points, got {}d.'
+        raise ValueError(emsg.format(sy_points.ndim))
+
+    if sx_bounds.ndim != 1:
+        emsg = 'Expected 1d contiguous src x-coordinate bounds, got {}d.'
+        raise ValueError(emsg.format(sx_bounds.ndim))
+
+    if sy_bounds.ndim != 1:
+        emsg = 'Expected 1d contiguous src y-coordinate bounds, got {}d.'
+        raise ValueError(emsg.format(sy_bounds.ndim))
+
+    if sx_bounds.size != sx_points.size + 1:
+        emsg = 'Invalid number of src x-coordinate bounds, got {} expected {}.'
+        raise ValueError(emsg.format(sx_bounds.size, sx_points.size + 1))
+
+    if sy_bounds.size != sy_points.size + 1:
+        emsg = 'Invalid number of src y-coordinate bounds, got {} expected {}.'
+        raise ValueError(emsg.format(sy_bounds.size, sy_points.size + 1))
+
+
+def _check_tgt_grid(gx_bounds, gy_bounds):
+    # Sanity check the target grid contiguous bounds.
+    if gx_bounds.ndim != 2:
+        emsg = 'Expected 2d contiguous grid x-coordinate bounds, got {}d.'
+        raise ValueError(emsg.format(gx_bounds.ndim))
+
+    if gy_bounds.ndim != 2:
+        emsg = 'Expected 2d contiguous grid y-coordinate bounds, got {}d.'
+        raise ValueError(emsg.format(gy_bounds.ndim))
+
+    if gx_bounds.shape != gy_bounds.shape:
+        emsg = 'Misaligned grid x-coordinate bounds {} and ' \
+            'y-coordinate bounds {}.'
+        raise ValueError(emsg.format(gx_bounds.shape, gy_bounds.shape))
+
+
+def _check_min_coverage(min_coverage):
+    if min_coverage is not None and not 0 <= min_coverage <= 1:
+        emsg = 'Expected a minimum coverage between 0 and 1, got {}.'
+        raise ValueError(emsg.format(min_coverage))
+
+
+def _check_precision(precision):
+    if precision not in _PRECISIONS:
+        emsg = 'Invalid weights precision, got {!r} expected one of {}.'
+        raise ValueError(emsg.format(precision, list(_PRECISIONS)))
+
+
+def _window_slice(window, size, name):
+    # The slice of the target grid cells of a window along the named
+    # dimension of the given size, with a unit step.
+    if window is None:
+        window = slice(None)
+    if not isinstance(window, slice) or window.step not in (None, 1):
+        emsg = 'Expected a unit step slice of the target grid {}-dimension, ' \
+            'got {!r}.'
+        raise ValueError(emsg.format(name, window))
+    start, stop, _ = window.indices(size)
+    if stop <= start:
+        emsg = 'Expected a non-empty window of the target grid ' \
+            '{}-dimension, got {!r}.'
+        raise ValueError(emsg.format(name, window))
+    return slice(start, stop)
+
+
+def _tgt_cells(tgt_cells, tgt_shape):
+    # The sorted unique flattened indices of the selected target grid cells,
+    # given either a boolean array with the shape of the target grid or a
+    # sequence of flattened indices.
+    tgt_cells = np.asarray(tgt_cells)
+    if tgt_cells.dtype == bool:
+        if tgt_cells.shape != tuple(tgt_shape):
+            emsg = 'Expected target cells with the shape of the target ' \
+                'grid {}, got {}.'
+            raise ValueError(emsg.format(tuple(tgt_shape), tgt_cells.shape))
+        return np.flatnonzero(tgt_cells)
+
+    size = int(np.prod(tgt_shape))
+    if tgt_cells.size and (not np.issubdtype(tgt_cells.dtype, np.integer) or
+                           tgt_cells.min() < 0 or tgt_cells.max() >= size):
+        emsg = 'Expected target cell indices within the range 0-{}, got {}.'
+        raise ValueError(emsg.format(size - 1, tgt_cells))
+    return np.unique(tgt_cells.astype(np.int64))
+
+
+def _cell_areas(xi_bounds, yi_bounds):
+    """
+    Returns the 1d areas of the quadrilateral cells of the 2d contiguous
+    grid bounds, with the shoelace formula.
+
+    """
+    # The cell corners, in order around each cell.
+    corners = [(slice(None, -1), slice(None, -1)),
+               (slice(None, -1), slice(1, None)),
+               (slice(1, None), slice(1, None)),
+               (slice(1, None), slice(None, -1))]
+    twice_area = 0
+    for i, corner in enumerate(corners):
+        following = corners[(i + 1) % len(corners)]
+        twice_area = twice_area + (xi_bounds[corner] * yi_bounds[following] -
+                                   xi_bounds[following] * yi_bounds[corner])
+    return np.abs(twice_area).ravel() / 2
+
+
+def _start_and_delta(points, bounds, kind):
+    # Constrain to regular points only.
+    delta = np.diff(points)
+    mean_delta = np.mean(delta)
+    rtol = 0.002
+    try:
+        atol = mean_delta * rtol
+        np.testing.assert_allclose(delta, mean_delta, atol=abs(atol))
+    except AssertionError as e:
+        emsg = 'Expected src {}-coordinate points to be regular{}'
+        raise ValueError(emsg.format(kind, e))
+    return bounds.min(), mean_delta
+
+
+def _sum_chunk(x, chunk_size, axis=-1):
+    shape = x.shape
+    if axis < 0:
+        axis += x.ndim
+    shape = shape[:axis] + (-1, chunk_size) + shape[axis + 1:]
+    x = x.reshape(shape)
+    return x.sum(axis=axis + 1)
+
+
+def agg_weights(sx_points, sx_bounds, sy_points, sy_bounds,
+                gx_bounds, gy_bounds, depth, pixel_format=None,
+                min_coverage=None, tgt_cells=None, progress=None, cancel=None):
+    """
+    Calculate the area weights between the source and target grids using
+    an Anti-Grain Geometry (AGG) backend to rasterise each target grid cell
+    on to the source grid.
+
+    Args:
+
+    * sx_points:
+        The source grid x-coordinate points, which must be 1d, monotonic
+        and regular.
+    * sx_bounds:
+        The source grid x-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * sy_points:
+        The source grid y-coordinate points, which must be 1d, monotonic
+        and regular.
+    * sy_bounds:
+        The source grid y-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * gx_bounds:
+        The target grid x-coordinate contiguous bounds, which must be 2d.
+        The dimensionality of the target grid is assumed to be in (y, x) order.
+    * gy_bounds:
+        The target grid y-coordinate contiguous bounds, which must be 2d.
+        The dimensionality of the target grid is assumed to be in (y, x) order.
+    * depth:
+        The depth (N) specifying the NxN pixel buffer to represent each source
+        grid cell.
+
+    Kwargs:
+
+    * pixel_format:
+        The format of the pixel coverage rendered by AGG, either 'gray8'
+        (quantised to 1/255 per pixel) or 'float' (the fractional area of
+        each pixel). Defaults to 'gray8'.
+    * min_coverage:
+        The minimum fraction of a target grid cell covered by the source
+        grid, for the target grid cell to have weights. Target grid cells
+        which partially overlap the source grid are clipped to the source
+        grid. Defaults to None, in which case only the target grid cells
+        entirely within the source grid have weights. Note that the 'gray8'
+        coverage of a target grid cell may fall short of full coverage by
+        the order of 0.1%.
+    * tgt_cells:
+        The target grid cells to calculate the weights of, either as a
+        boolean array with the shape of the target grid, which is True for
+        each target grid cell required, or as a sequence of the (y, x)
+        row-major flattened indices of the target grid cells. The other
+        target grid cells have no weights. Defaults to None, in which case
+        the weights of all target grid cells are calculated.
+    * progress:
+        A callable, which is called with the :class:`Progress` of the
+        calculation before each row band of the target grid and on
+        completion. Defaults to None.
+    * cancel:
+        A cancellation token, such as a :class:`threading.Event`, which is
+        checked before each row band of the target grid. The calculation
+        raises :class:`BuildCancelled` once the token is set. Defaults to
+        None.
+
+    Returns:
+        The :class:`Weights` of the target grid cells, including their
+        :attr:`~Weights.coverage`.
+
+    """
+    _check_src_grid(sx_points, sx_bounds, sy_points, sy_bounds)
+    _check_tgt_grid(gx_bounds, gy_bounds)
+    _check_min_coverage(min_coverage)
+
+    if pixel_format is None:
+        pixel_format = DEFAULT_PIXEL_FORMAT
+
+    if pixel_format not in _PIXEL_FORMATS:
+        emsg = 'Invalid pixel format, got {!r} expected one of {}.'
+        raise ValueError(emsg.format(pixel_format, sorted(_PIXEL_FORMATS)))
+
+    raster, wdtype, wfull = _PIXEL_FORMATS[pixel_format]
+
+    # Ensure the grid bounds have the correct dtype ...
+    gx_bounds = np.asarray(gx_bounds, dtype=np.float64)
+    gy_bounds = np.asarray(gy_bounds, dtype=np.float64)
+
+    #
+    # XXX: Makes gross assumption that all coordinates are increasing.
+    # Need to deal with this properly in a generic way.
+    #
+    sx0, sdx = _start_and_delta(sx_points, sx_bounds, 'x')
+    sy0, sdy = _start_and_delta(sy_points, sy_bounds, 'y')
+
+    snx, sny = sx_points.size, sy_points.size
+    gnx, gny = gx_bounds.shape[1] - 1, gx_bounds.shape[0] - 1
+
+    # The grid bounds in fractional source indices, and the areas of the
+    # target grid cells in units of source grid cells.
+    xi_bounds = (gx_bounds - sx0) / sdx
+    yi_bounds = (gy_bounds - sy0) / sdy
+    tgt_area = _cell_areas(xi_bounds, yi_bounds)
+
+    clip = min_coverage is not None
+    if clip:
+        finite = np.isfinite(xi_bounds) & np.isfinite(yi_bounds)
+
+    counts = np.zeros(gny * gnx, dtype=np.int64)
+    wsum = np.zeros(gny * gnx, dtype=np.float64)
+    indices, data = [], []
+
+    if tgt_cells is None:
+        cells = range(gny * gnx)
+    else:
+        cells = _tgt_cells(tgt_cells, (gny, gnx)).tolist()
+
+    monitor = _Monitor(len(cells), progress=progress, cancel=cancel)
+    band = None
+
+    #
+    # XXX: Cythonise this ...
+    #
+    for done, cell in enumerate(cells):
+        yi, xi = divmod(cell, gnx)
+        if yi != band:
+            # Report progress and check for cancellation between the row
+            # bands of the target grid.
+            band = yi
+            monitor(done)
+        yi_stop = yi + 2
+        xi_stop = xi + 2
+        # Get the bounding box of the grid cell in fractional source
+        # indices.
+        cell_xi = xi_bounds[yi:yi_stop, xi:xi_stop].copy()
+        cell_yi = yi_bounds[yi:yi_stop, xi:xi_stop].copy()
+        if clip and not finite[yi:yi_stop, xi:xi_stop].all():
+            # At least one vertex of the grid cell is undefined.
+            continue
+        xi_min, xi_max = min(*cell_xi.flat), max(*cell_xi.flat)
+        yi_min, yi_max = min(*cell_yi.flat), max(*cell_yi.flat)
+        if not clip and (xi_min < 0 or yi_min < 0 or
+                         xi_max > snx or yi_max > sny):
+            # At least one vertex of the grid cell is out of bounds.
+            continue
+        # Snap fractional cell indices outwards to actual source indices.
+        xi_min = int(floor(xi_min))
+        xi_max = int(ceil(xi_max))
+        yi_min = int(floor(yi_min))
+        yi_max = int(ceil(yi_max))
+        if clip:
+            # Clip the source region to the source grid.
+            xi_min, xi_max = max(xi_min, 0), min(xi_max, snx)
+            yi_min, yi_max = max(yi_min, 0), min(yi_max, sny)
+            if xi_min >= xi_max or yi_min >= yi_max:
+                # The grid cell does not overlap the source grid.
+                continue
+        # Calculate the weights for the source region
+        # overlapped by this grid cell.
+        cell_xi -= xi_min
+        cell_yi -= yi_min
+        wshape = (depth*(yi_max-yi_min), depth*(xi_max-xi_min))
+        weights = np.zeros(wshape, dtype=wdtype)
+        raster(weights, depth*cell_xi, depth*cell_yi)
+        if depth > 1:
+            weights = _sum_chunk(_sum_chunk(weights, depth), depth, 0)
+        weights = weights / (depth*depth*wfull)
+        # Now record the weights of the source region for this grid cell.
+        wsum[cell] = weights.sum()
+        if clip and wsum[cell] < min_coverage * tgt_area[cell]:
+            # The grid cell is insufficiently covered by the source grid.
+            continue
+        if wsum[cell]:
+            window = (np.arange(yi_min, yi_max)[:, np.newaxis] * snx +
+                      np.arange(xi_min, xi_max))
+            counts[cell] = weights.size
+            indices.append(window.ravel())
+            data.append(weights.ravel())
+
+    monitor(len(cells))
+
+    indptr = np.zeros(counts.size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.concatenate(indices) if indices else np.empty(0, np.int64)
+    data = np.concatenate(data) if data else np.empty(0, np.float64)
+
+    # The quantised 'gray8' weights are exact multiples of their quantum.
+    quantum = None
+    if np.issubdtype(wdtype, np.integer):
+        quantum = 1. / (depth*depth*wfull)
+
+    return Weights((sny, snx), (gny, gnx), indptr, indices, data, wsum,
+                   tgt_area=tgt_area, quantum=quantum)
+
+
+def _regrid(weights, data, sx_dim, sy_dim, adjoint=False,
+            aggregations=None):
+    # Apply the weights (or their adjoint) to the generic source data shape,
+    # where the source dimensions have already been sanity checked. Given
+    # the aggregations, return the list of the result of each aggregation.
+    ndim = data.ndim
+    dims = list(range(ndim))
+
+    #
+    # Deal with generic source shape ...
+    #
+    dr = [sy_dim, sx_dim]
+    do = ndim - len(dr)
+    ds = sorted(dims, key=lambda d: d in dr)
+    dmap = {d: dr.index(d) + do if d in dr else ds.index(d) for d in dims}
+    regrid_order, _ = zip(*sorted(dmap.items(), key=operator.itemgetter(1)))
+    _, result_order = zip(*sorted(dmap.items(), key=operator.itemgetter(0)))
+
+    if regrid_order != tuple(dims):
+        data = np.transpose(data, regrid_order)
+
+    # Reshape the source data into (-1, y, x)
+    regrid_shape = data.shape
+    data = data.reshape((-1,) + regrid_shape[-2:])
+
+    #
+    # Deal with generic grid shape ...
+    #
+    if adjoint:
+        results = [weights.apply_adjoint(data)]
+        result_shape = regrid_shape[:-2] + weights.src_shape
+    elif aggregations is not None:
+        results = weights.aggregate(data, aggregations)
+        result_shape = regrid_shape[:-2] + weights.tgt_shape
+    else:
+        results = [weights.apply(data)]
+        result_shape = regrid_shape[:-2] + weights.tgt_shape
+
+    for i, result in enumerate(results):
+        if result.shape != result_shape:
+            result = result.reshape(result_shape)
+
+        if result_order != tuple(dims):
+            result = np.transpose(result, result_order)
+
+        results[i] = result
+
+    return results if aggregations is not None else results[0]
+
+
+def agg(data, sx_points, sx_bounds, sy_points, sy_bounds,
+        sx_dim, sy_dim, gx_bounds, gy_bounds, depth, pixel_format=None,
+        min_coverage=None, tgt_cells=None, progress=None, cancel=None):
+    """
+    Perform a area-weighted regrid of the data using an Anti-Grain
+    Geometry (AGG) backend to rasterise the conversion between the source
+    and target grids.
+
+    Args:
+
+    * data:
+        The source grid data, which must be at least 2d, that requires
+        to be regridded to the target grid.
+    * sx_points:
+        The source grid x-coordinate points, which must be 1d, monotonic
+        and regular.
+    * sx_bounds:
+        The source grid x-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * sy_points:
+        The source grid y-coordinate points, which must be 1d, monotonic
+        and regular.
+    * sy_bounds:
+        The source grid y-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * sx_dim:
+        The data dimension of the x-coordinate.
+    * sy_dim:
+        The data dimension of the y-coordinate.
+    * gx_bounds:
+        The target grid x-coordinate contiguous bounds, which must be 2d.
+        The dimensionality of the target grid is assumed to be in (y, x) order.
+    * gy_bounds:
+        The target grid y-coordinate contiguous bounds, which must be 2d.
+        The dimensionality of the target grid is assumed to be in (y, x) order.
+    * depth:
+        The depth (N) specifying the NxN pixel buffer to represent each source
+        grid cell.
+
+    Kwargs:
+
+    * pixel_format:
+        The format of the pixel coverage rendered by AGG, either 'gray8'
+        (quantised to 1/255 per pixel) or 'float' (the fractional area of
+        each pixel). Defaults to 'gray8'.
+    * min_coverage:
+        The minimum fraction of a target grid cell covered by the source
+        grid, for the target grid cell to be regridded. Defaults to None,
+        in which case only the target grid cells entirely within the
+        source grid are regridded.
+    * tgt_cells:
+        The target grid cells to regrid, either as a boolean array with the
+        shape of the target grid, which is True for each target grid cell
+        required, or as a sequence of the (y, x) row-major flattened indices
+        of the target grid cells. The other target grid cells are masked.
+        Defaults to None, in which case all target grid cells are regridded.
+    * progress:
+        A callable reporting the :class:`Progress` of the calculation of
+        the weights, as per :func:`agg_weights`. Defaults to None.
+    * cancel:
+        A cancellation token of the calculation of the weights, as per
+        :func:`agg_weights`. Defaults to None.
+
+    Returns:
+        The data with same horizontal dimensionality as the target grid. The
+        data values are converted to the new grid using conservative
+        area-weighted regridding. The data is a :class:`numpy.ndarray`,
+        unless target grid cells lie outside the source grid or the source
+        data is masked, in which case it is a :class:`numpy.ma.MaskedArray`.
+
+    """
+    #
+    # Sanity check the arguments ...
+    #
+    _check_src_grid(sx_points, sx_bounds, sy_points, sy_bounds)
+
+    # Determine the source data dimensionality ...
+    ndim = data.ndim
+    dims = list(range(ndim))
+
+    if data.ndim < 2:
+        emsg = 'Expected at least 2d src data, got {}d.'
+        raise ValueError(emsg.format(data.ndim))
+
+    # Account for negative indexing ...
+    if sx_dim < 0:
+        sx_dim += ndim
+
+    if sx_dim not in dims:
+        emsg = 'Invalid src x-coordinate dimension, got {} expected ' \
+            'within range {}-{}.'
+        raise ValueError(emsg.format(sx_dim, dims[0], dims[-1]))
+
+    # Account for negative indexing ...
+    if sy_dim < 0:
+        sy_dim += ndim
+
+    if sy_dim not in dims:
+        emsg = 'Invalid src y-coordinate dimension, got {} expected ' \
+            'within range {}-{}.'
+        raise ValueError(emsg.format(sy_dim, dims[0], dims[-1]))
+
+    # Determine the source data shape ...
+    shape = data.shape
+
+    if shape[sx_dim] != sx_points.size:
+        emsg = 'The src x-coordinate points {} do not align with src data {}' \
+            ' over dimension {}.'
+        raise ValueError(emsg.format(sx_points.shape, shape, sx_dim))
+
+    if shape[sy_dim] != sy_points.size:
+        emsg = 'The src y-coordinate points {} do not align with src data {}' \
+            ' over dimension {}.'
+        raise ValueError(emsg.format(sy_points.shape, shape, sy_dim))
+
+    _check_tgt_grid(gx_bounds, gy_bounds)
+
+    # Calculate the weights of each target grid cell ...
+    weights = agg_weights(sx_points, sx_bounds, sy_points, sy_bounds,
+                          gx_bounds, gy_bounds, depth,
+                          pixel_format=pixel_format,
+                          min_coverage=min_coverage, tgt_cells=tgt_cells,
+                          progress=progress, cancel=cancel)
+
+    return _regrid(weights, data, sx_dim, sy_dim)
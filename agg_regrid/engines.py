@@ -0,0 +1,639 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The registry of the engines which calculate the area weights between a
+source and target grid.
+
+Each engine is a weights builder with the same interface as
+:func:`agg_regrid.agg_weights`, e.g. a third-party engine is registered with
+
+    register_engine('mine', my_weights, valid=my_valid, cost=my_cost)
+
+and is then available to :class:`agg_regrid.AreaWeighted` by name. The
+'auto' engine selects the valid engine with the lowest estimated cost for
+the source and target grids.
+
+"""
+
+from collections import namedtuple, OrderedDict
+from math import ceil, floor
+
+import numpy as np
+
+from .core import (_cell_areas, _check_min_coverage, _check_src_grid,
+                   _check_tgt_grid, _Monitor, _start_and_delta, _tgt_cells,
+                   agg_weights, DEFAULT_PIXEL_FORMAT, Weights)
+
+
+#: The name of the engine which selects the registered engine with the
+#: lowest estimated cost.
+AUTO = 'auto'
+
+
+class GridProperties(namedtuple('GridProperties', ['rectilinear', 'cells',
+                                                   'window', 'depth',
+                                                   'pixel_format'])):
+    """
+    The properties of a source and target grid pair, used to select an
+    engine.
+
+    * rectilinear:
+        Whether the target grid is rectilinear in the source coordinate
+        system, as it is when both grids share the same coordinate system.
+    * cells:
+        The number of target grid cells.
+    * window:
+        The mean number of source grid cells within the bounding box of a
+        target grid cell, being the size ratio of the grids.
+    * depth:
+        The AGG buffer depth.
+    * pixel_format:
+        The AGG pixel format.
+
+    """
+    __slots__ = ()
+
+
+class Engine(namedtuple('Engine', ['builder', 'valid', 'cost'])):
+    """
+    A registered weights engine.
+
+    * builder:
+        The callable which calculates the :class:`agg_regrid.Weights`, with
+        the same interface as :func:`agg_regrid.agg_weights`.
+    * valid:
+        The callable which returns whether the engine supports the
+        :class:`GridProperties`, or None if it supports all grids.
+    * cost:
+        The callable which returns the estimated cost per target grid cell,
+        in microseconds, for the :class:`GridProperties`, or None if the
+        engine is never selected automatically.
+
+    """
+    __slots__ = ()
+
+
+# The registered engines, keyed by name.
+_ENGINES = OrderedDict()
+
+
+def register_engine(name, builder, valid=None, cost=None, replace=False):
+    """
+    Register a weights engine.
+
+    Args:
+
+    * name:
+        The name of the engine.
+    * builder:
+        The callable which calculates the :class:`agg_regrid.Weights`, with
+        the same interface as :func:`agg_regrid.agg_weights`.
+
+    Kwargs:
+
+    * valid:
+        The callable which returns whether the engine supports the
+        :class:`GridProperties` of a source and target grid pair.
+        Defaults to None, in which case the engine supports all grids.
+    * cost:
+        The callable which returns the estimated cost per target grid cell,
+        in microseconds, for the :class:`GridProperties`. Defaults to None,
+        in which case the engine is only used when requested by name.
+    * replace:
+        Replace any engine already registered with the name.
+        Defaults to False.
+
+    """
+    if name == AUTO:
+        emsg = 'Cannot register an engine named {!r}.'
+        raise ValueError(emsg.format(name))
+
+    if name in _ENGINES and not replace:
+        emsg = 'The engine {!r} is already registered.'
+        raise ValueError(emsg.format(name))
+
+    _ENGINES[name] = Engine(builder, valid, cost)
+
+
+def engine_names():
+    """
+    Returns the names of the registered engines, and the 'auto' engine.
+
+    """
+    return list(_ENGINES) + [AUTO]
+
+
+def _check_engine(engine):
+    if engine != AUTO and engine not in _ENGINES:
+        emsg = 'Invalid engine, got {!r} expected one of {}.'
+        raise ValueError(emsg.format(engine, engine_names()))
+
+
+def _rectilinear(gx_bounds, gy_bounds):
+    # Whether each row of the x-bounds, and each column of the y-bounds,
+    # are the same.
+    return bool(np.all(gx_bounds == gx_bounds[:1]) and
+                np.all(gy_bounds == gy_bounds[:, :1]))
+
+
+def grid_properties(sx_bounds, sy_bounds, gx_bounds, gy_bounds, depth,
+                    pixel_format=None):
+    """
+    Determine the :class:`GridProperties` of the source and target grids.
+
+    Args:
+
+    * sx_bounds:
+        The source grid x-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * sy_bounds:
+        The source grid y-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * gx_bounds:
+        The target grid x-coordinate contiguous bounds in the source
+        coordinate system, which must be 2d.
+    * gy_bounds:
+        The target grid y-coordinate contiguous bounds in the source
+        coordinate system, which must be 2d.
+    * depth:
+        The AGG buffer depth.
+
+    Kwargs:
+
+    * pixel_format:
+        The AGG pixel format. Defaults to 'gray8'.
+
+    Returns:
+        The :class:`GridProperties`.
+
+    """
+    if pixel_format is None:
+        pixel_format = DEFAULT_PIXEL_FORMAT
+
+    sx_bounds = np.asarray(sx_bounds, dtype=np.float64)
+    sy_bounds = np.asarray(sy_bounds, dtype=np.float64)
+    gx_bounds = np.asarray(gx_bounds, dtype=np.float64)
+    gy_bounds = np.asarray(gy_bounds, dtype=np.float64)
+
+    def extent(bounds, start, delta):
+        # The extent of the bounding box of each target grid cell,
+        # in whole source grid cells.
+        bounds = (bounds - start) / delta
+        corners = np.stack([bounds[:-1, :-1], bounds[:-1, 1:],
+                            bounds[1:, :-1], bounds[1:, 1:]])
+        with np.errstate(invalid='ignore'):
+            return (np.ceil(corners.max(axis=0)) -
+                    np.floor(corners.min(axis=0)))
+
+    x_extent = extent(gx_bounds, sx_bounds.min(), np.diff(sx_bounds).mean())
+    y_extent = extent(gy_bounds, sy_bounds.min(), np.diff(sy_bounds).mean())
+    windows = x_extent * y_extent
+    cells = windows.size
+    windows = windows[np.isfinite(windows)]
+    window = float(windows.mean()) if windows.size else 0.
+
+    return GridProperties(_rectilinear(gx_bounds, gy_bounds), cells, window,
+                          depth, pixel_format)
+
+
+def select_engine(properties):
+    """
+    Select the valid registered engine with the lowest estimated cost.
+
+    Args:
+
+    * properties:
+        The :class:`GridProperties` of the source and target grids.
+
+    Returns:
+        The name of the engine.
+
+    """
+    costs = [(engine.cost(properties), name)
+             for name, engine in _ENGINES.items()
+             if engine.cost is not None and
+             (engine.valid is None or engine.valid(properties))]
+
+    if not costs:
+        emsg = 'No registered engine supports the grids {}.'
+        raise ValueError(emsg.format(properties))
+
+    return min(costs, key=lambda item: item[0])[1]
+
+
+def build_weights(engine, sx_points, sx_bounds, sy_points, sy_bounds,
+                  gx_bounds, gy_bounds, depth, pixel_format=None,
+                  min_coverage=None, tgt_cells=None, progress=None,
+                  cancel=None):
+    """
+    Calculate the area weights between the source and target grids with
+    the named engine, see :func:`agg_regrid.agg_weights`.
+
+    Args:
+
+    * engine:
+        The name of a registered engine, or 'auto' to select the valid
+        engine with the lowest estimated cost.
+
+    The remaining arguments are passed to the builder of the engine, other
+    than the target cells, progress callback and cancellation token when
+    None, so that a builder need only support them when they are given.
+
+    Returns:
+        The :class:`agg_regrid.Weights` of the target grid cells.
+
+    """
+    _check_engine(engine)
+
+    if engine == AUTO:
+        properties = grid_properties(sx_bounds, sy_bounds, gx_bounds,
+                                     gy_bounds, depth,
+                                     pixel_format=pixel_format)
+        engine = select_engine(properties)
+
+    kwargs = dict(pixel_format=pixel_format, min_coverage=min_coverage)
+    optional = dict(tgt_cells=tgt_cells, progress=progress, cancel=cancel)
+    kwargs.update((name, value) for name, value in optional.items()
+                  if value is not None)
+
+    builder = _ENGINES[engine].builder
+    return builder(sx_points, sx_bounds, sy_points, sy_bounds,
+                   gx_bounds, gy_bounds, depth, **kwargs)
+
+
+def _overlaps(bounds, n, clip):
+    # Calculate the 1d overlaps of the target intervals, with the
+    # contiguous bounds in fractional source indices, and the n
+    # source intervals.
+    #
+    # Returns the first source index, number of source indices and
+    # offset into the overlap lengths of each target interval, the
+    # overlap lengths, and the length of each target interval.
+    lo = np.minimum(bounds[:-1], bounds[1:])
+    hi = np.maximum(bounds[:-1], bounds[1:])
+    with np.errstate(invalid='ignore'):
+        start, stop = np.floor(lo), np.ceil(hi)
+        if clip:
+            start, stop = np.maximum(start, 0), np.minimum(stop, n)
+            valid = start < stop
+        else:
+            valid = (lo >= 0) & (hi <= n)
+    valid &= np.isfinite(lo) & np.isfinite(hi)
+    start = np.where(valid, start, 0).astype(np.int64)
+    width = np.where(valid, stop, 0).astype(np.int64) - start
+
+    offset = np.zeros(width.size, dtype=np.int64)
+    np.cumsum(width[:-1], out=offset[1:])
+    owner = np.repeat(np.arange(width.size), width)
+    index = start[owner] + np.arange(owner.size) - offset[owner]
+    overlap = (np.minimum(hi[owner], index + 1) -
+               np.maximum(lo[owner], index))
+
+    return start, width, offset, np.maximum(overlap, 0), hi - lo
+
+
+def separable_weights(sx_points, sx_bounds, sy_points, sy_bounds,
+                      gx_bounds, gy_bounds, depth=None, pixel_format=None,
+                      min_coverage=None, tgt_cells=None, progress=None,
+                      cancel=None):
+    """
+    Calculate the exact area weights between the source grid and a
+    rectilinear target grid, as the product of the 1d overlaps of the
+    grids in x and y.
+
+    This is only valid when the target grid is rectilinear in the source
+    coordinate system, e.g. when both grids share the same coordinate
+    system, and is otherwise the same as :func:`agg_regrid.agg_weights`,
+    including the minimum coverage, target cells, progress and
+    cancellation. The buffer depth and pixel format are ignored. As the
+    weights are calculated in one vectorised pass, the progress is only
+    reported, and the cancellation only checked, at the start and end.
+
+    Returns:
+        The :class:`agg_regrid.Weights` of the target grid cells.
+
+    """
+    _check_src_grid(sx_points, sx_bounds, sy_points, sy_bounds)
+    _check_tgt_grid(gx_bounds, gy_bounds)
+    _check_min_coverage(min_coverage)
+
+    gx_bounds = np.asarray(gx_bounds, dtype=np.float64)
+    gy_bounds = np.asarray(gy_bounds, dtype=np.float64)
+
+    if not _rectilinear(gx_bounds, gy_bounds):
+        emsg = 'The separable engine requires a rectilinear target grid.'
+        raise ValueError(emsg)
+
+    sx0, sdx = _start_and_delta(sx_points, sx_bounds, 'x')
+    sy0, sdy = _start_and_delta(sy_points, sy_bounds, 'y')
+
+    snx, sny = sx_points.size, sy_points.size
+    gnx, gny = gx_bounds.shape[1] - 1, gx_bounds.shape[0] - 1
+
+    monitor = _Monitor(gnx * gny, progress=progress, cancel=cancel)
+    monitor(0)
+
+    clip = min_coverage is not None
+    x_start, x_width, x_offset, x_overlap, x_length = _overlaps(
+        (gx_bounds[0] - sx0) / sdx, snx, clip)
+    y_start, y_width, y_offset, y_overlap, y_length = _overlaps(
+        (gy_bounds[:, 0] - sy0) / sdy, sny, clip)
+
+    # The weight sums and areas of the target grid cells in units of
+    # source grid cells.
+    x_sum = np.bincount(np.repeat(np.arange(gnx), x_width),
+                        weights=x_overlap, minlength=gnx)
+    y_sum = np.bincount(np.repeat(np.arange(gny), y_width),
+                        weights=y_overlap, minlength=gny)
+    wsum = np.outer(y_sum, x_sum).ravel()
+    tgt_area = np.outer(y_length, x_length).ravel()
+
+    counts = np.outer(y_width, x_width).ravel()
+    keep = wsum > 0
+    if tgt_cells is not None:
+        selected = np.zeros(counts.size, dtype=bool)
+        selected[_tgt_cells(tgt_cells, (gny, gnx))] = True
+        keep &= selected
+        wsum[~selected] = 0
+    if clip:
+        # Exclude the grid cells insufficiently covered by the source grid.
+        keep &= wsum >= min_coverage * tgt_area
+    counts[~keep] = 0
+
+    indptr = np.zeros(counts.size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    # The (y, x) order source window of each target grid cell.
+    cells = np.repeat(np.arange(counts.size), counts)
+    yi, xi = np.divmod(cells, gnx)
+    yk, xk = np.divmod(np.arange(cells.size) - indptr[cells], x_width[xi])
+    indices = (y_start[yi] + yk) * snx + x_start[xi] + xk
+    data = y_overlap[y_offset[yi] + yk] * x_overlap[x_offset[xi] + xk]
+
+    monitor(gnx * gny)
+
+    return Weights((sny, snx), (gny, gnx), indptr, indices, data, wsum,
+                   tgt_area=tgt_area)
+
+
+def _overlap(xs, ys, x_edges, y_edges, spherical=False):
+    # Calculate the exact overlap areas of the polygon, with the
+    # vertices xs and ys, and each cell of the window defined by
+    # the 1d x_edges and y_edges.
+    #
+    # For each x within a column of the window, the polygon boundary
+    # crossings bound the polygon extent in y, which is clamped to each
+    # row of the window. Integrating over x along each polygon edge gives
+    # the signed overlap area, see Green's theorem.
+    if spherical:
+        func = np.sin
+
+        def integral(a, b):
+            # The integral of sin(y) over the interval [a, b].
+            return 2 * np.sin((a + b) / 2) * np.sin((b - a) / 2)
+    else:
+        def func(y):
+            return y
+
+        def integral(a, b):
+            # The integral of y over the interval [a, b].
+            return (b - a) * (a + b) / 2
+
+    lo, hi = y_edges[:-1, np.newaxis], y_edges[1:, np.newaxis]
+    result = np.zeros((y_edges.size - 1, x_edges.size - 1))
+    nv = len(xs)
+
+    for i in range(nv):
+        xa, ya = xs[i], ys[i]
+        xb, yb = xs[(i + 1) % nv], ys[(i + 1) % nv]
+        if xa == xb:
+            # Vertical edges do not contribute.
+            continue
+        # Clip the edge to each column of the window.
+        x0 = np.clip(min(xa, xb), x_edges[:-1], x_edges[1:])
+        x1 = np.clip(max(xa, xb), x_edges[:-1], x_edges[1:])
+        length = x1 - x0
+        slope = (yb - ya) / (xb - xa)
+        p = ya + (x0 - xa) * slope
+        q = ya + (x1 - xa) * slope
+        t0, t1 = np.minimum(p, q), np.maximum(p, q)
+        span = t1 - t0
+        # Partition the y-extent of the clipped edge into the parts below,
+        # within and above each row of the window.
+        a, b = np.clip(lo, t0, t1), np.clip(hi, t0, t1)
+        below, above = a - t0, t1 - b
+        total = below * func(lo) + above * func(hi) + integral(a, b)
+        mean = np.divide(total, span, out=func(np.clip(p, lo, hi)),
+                         where=span > 0)
+        result += np.sign(xb - xa) * length * (mean - func(lo))
+
+    return np.abs(result)
+
+
+def exact_weights(sx_bounds, sy_bounds, gx_bounds, gy_bounds,
+                  spherical=False, min_coverage=None, tgt_cells=None,
+                  progress=None, cancel=None):
+    """
+    Calculate the exact area weights between the source and target grids.
+
+    The target grid cells are straight edged polygons in the source
+    coordinate system, as rasterised by :func:`agg_regrid.agg_weights`,
+    and the same target grid cells are excluded. This is both the 'exact'
+    engine and the reference of :func:`agg_regrid.calibration.calibrate`.
+
+    Args:
+
+    * sx_bounds:
+        The source grid x-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * sy_bounds:
+        The source grid y-coordinate contiguous bounds, which must be 1d,
+        monotonic and regular.
+    * gx_bounds:
+        The target grid x-coordinate contiguous bounds, which must be 2d.
+    * gy_bounds:
+        The target grid y-coordinate contiguous bounds, which must be 2d.
+
+    Kwargs:
+
+    * spherical:
+        Calculate the overlap areas on the sphere, where the source grid
+        x and y coordinates are longitude and latitude in degrees. Otherwise,
+        calculate the planar overlap areas. Defaults to False.
+    * min_coverage:
+        The minimum fraction of a planar target grid cell covered by the
+        source grid, for the target grid cell to have weights, as per
+        :func:`agg_regrid.agg_weights`. Defaults to None, in which case only
+        the target grid cells entirely within the source grid have weights.
+    * tgt_cells:
+        The target grid cells to calculate the weights of, as per
+        :func:`agg_regrid.agg_weights`. Defaults to None, in which case the
+        weights of all target grid cells are calculated.
+    * progress:
+        A callable reporting the :class:`agg_regrid.Progress` of the
+        calculation, as per :func:`agg_regrid.agg_weights`. Defaults to None.
+    * cancel:
+        A cancellation token of the calculation, as per
+        :func:`agg_regrid.agg_weights`. Defaults to None.
+
+    Returns:
+        The :class:`agg_regrid.Weights` of the target grid cells, being the
+        fraction of each source grid cell overlapped by each target grid cell.
+
+    """
+    _check_min_coverage(min_coverage)
+    clip = min_coverage is not None
+    if clip and spherical:
+        emsg = 'A minimum coverage is not supported for spherical weights.'
+        raise ValueError(emsg)
+
+    sx_bounds = np.asarray(sx_bounds, dtype=np.float64)
+    sy_bounds = np.asarray(sy_bounds, dtype=np.float64)
+    gx_bounds = np.asarray(gx_bounds, dtype=np.float64)
+    gy_bounds = np.asarray(gy_bounds, dtype=np.float64)
+
+    snx, sny = sx_bounds.size - 1, sy_bounds.size - 1
+    gnx, gny = gx_bounds.shape[1] - 1, gx_bounds.shape[0] - 1
+    sx0, sdx = sx_bounds.min(), np.diff(sx_bounds).mean()
+    sy0, sdy = sy_bounds.min(), np.diff(sy_bounds).mean()
+
+    # Calculate the overlap areas in fractional source indices, or
+    # in radians on the sphere.
+    if spherical:
+        x_edges = np.radians(sx0 + np.arange(snx + 1) * sdx)
+        y_edges = np.radians(sy0 + np.arange(sny + 1) * sdy)
+        gx = np.radians(gx_bounds)
+        gy = np.radians(gy_bounds)
+    else:
+        x_edges = np.arange(snx + 1, dtype=np.float64)
+        y_edges = np.arange(sny + 1, dtype=np.float64)
+        gx = (gx_bounds - sx0) / sdx
+        gy = (gy_bounds - sy0) / sdy
+
+    xi_bounds = (gx_bounds - sx0) / sdx
+    yi_bounds = (gy_bounds - sy0) / sdy
+    tgt_area = None if spherical else _cell_areas(xi_bounds, yi_bounds)
+    if clip:
+        finite = np.isfinite(xi_bounds) & np.isfinite(yi_bounds)
+
+    # The clock-wise order of the target grid cell corners.
+    order = [0, 1, 3, 2]
+
+    counts = np.zeros(gny * gnx, dtype=np.int64)
+    wsum = np.zeros(gny * gnx, dtype=np.float64)
+    indices, data = [], []
+
+    if tgt_cells is None:
+        cells = range(gny * gnx)
+    else:
+        cells = _tgt_cells(tgt_cells, (gny, gnx)).tolist()
+
+    monitor = _Monitor(len(cells), progress=progress, cancel=cancel)
+    band = None
+
+    for done, index in enumerate(cells):
+        yi, xi = divmod(index, gnx)
+        if yi != band:
+            # Report progress and check for cancellation between the row
+            # bands of the target grid.
+            band = yi
+            monitor(done)
+        cell = (slice(yi, yi + 2), slice(xi, xi + 2))
+        if clip and not finite[cell].all():
+            # At least one vertex of the grid cell is undefined.
+            continue
+        cell_xi, cell_yi = xi_bounds[cell], yi_bounds[cell]
+        xi_min, xi_max = cell_xi.min(), cell_xi.max()
+        yi_min, yi_max = cell_yi.min(), cell_yi.max()
+        if not clip and (xi_min < 0 or yi_min < 0 or
+                         xi_max > snx or yi_max > sny):
+            # At least one vertex of the grid cell is out of bounds.
+            continue
+        xi_min, xi_max = int(floor(xi_min)), int(ceil(xi_max))
+        yi_min, yi_max = int(floor(yi_min)), int(ceil(yi_max))
+        if clip:
+            # Clip the source region to the source grid.
+            xi_min, xi_max = max(xi_min, 0), min(xi_max, snx)
+            yi_min, yi_max = max(yi_min, 0), min(yi_max, sny)
+            if xi_min >= xi_max or yi_min >= yi_max:
+                # The grid cell does not overlap the source grid.
+                continue
+        xe = x_edges[xi_min:xi_max + 1]
+        ye = y_edges[yi_min:yi_max + 1]
+        weights = _overlap(gx[cell].flat[order], gy[cell].flat[order],
+                           xe, ye, spherical=spherical)
+        # Convert the overlap areas to fractions of the source cells.
+        if spherical:
+            weights /= (np.diff(np.sin(ye))[:, np.newaxis] *
+                        np.diff(xe))
+        wsum[index] = weights.sum()
+        if clip and wsum[index] < min_coverage * tgt_area[index]:
+            # The grid cell is insufficiently covered by the source grid.
+            continue
+        if wsum[index]:
+            window = (np.arange(yi_min, yi_max)[:, np.newaxis] * snx +
+                      np.arange(xi_min, xi_max))
+            counts[index] = weights.size
+            indices.append(window.ravel())
+            data.append(weights.ravel())
+
+    monitor(len(cells))
+
+    indptr = np.zeros(counts.size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.concatenate(indices) if indices else np.empty(0, np.int64)
+    data = np.concatenate(data) if data else np.empty(0, np.float64)
+
+    return Weights((sny, snx), (gny, gnx), indptr, indices, data, wsum,
+                   tgt_area=tgt_area)
+
+
+def _exact_weights(sx_points, sx_bounds, sy_points, sy_bounds,
+                   gx_bounds, gy_bounds, depth=None, pixel_format=None,
+                   min_coverage=None, tgt_cells=None, progress=None,
+                   cancel=None):
+    # The planar exact clipping engine, see
+    # :func:`exact_weights`.
+    _check_src_grid(sx_points, sx_bounds, sy_points, sy_bounds)
+    _check_tgt_grid(gx_bounds, gy_bounds)
+    # The source grid must be regular, as for the other builtin engines.
+    _start_and_delta(sx_points, sx_bounds, 'x')
+    _start_and_delta(sy_points, sy_bounds, 'y')
+    return exact_weights(sx_bounds, sy_bounds, gx_bounds, gy_bounds,
+                         min_coverage=min_coverage, tgt_cells=tgt_cells,
+                         progress=progress, cancel=cancel)
+
+
+# The estimated costs, in microseconds per target grid cell, of each of
+# the builtin engines, as measured by calibration.
+def _agg_cost(properties):
+    return 25 + properties.window * (0.02 + 0.013 * properties.depth ** 2)
+
+
+def _separable_cost(properties):
+    return 0.5 + 0.05 * properties.window
+
+
+def _exact_cost(properties):
+    return 200 + 0.1 * properties.window
+
+
+register_engine('agg', agg_weights, cost=_agg_cost)
+register_engine('separable', separable_weights,
+                valid=lambda properties: properties.rectilinear,
+                cost=_separable_cost)
+register_engine('exact', _exact_weights, cost=_exact_cost)
@@ -0,0 +1,234 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Save and load area weights in the SCRIP/ESMF offline sparse weights file
+layout, as consumed and produced by e.g. CDO and ESMF_RegridWeightGen.
+
+The weights file holds the 1-based target (row) and source (col) grid cell
+indices, and the normalised weight (S) of each entry, along with the
+Fortran order dimensions of the source and target grids (src_grid_dims and
+dst_grid_dims), and the covered area fraction of each target grid cell
+(frac_b). The weights are saved with these ESMF names, and are also loaded
+with the original SCRIP names (dst_address, src_address, remap_matrix and
+dst_grid_frac).
+
+The weights are normalised by the covered area of each target grid cell
+('fracarea'), so that the regridded value of a target grid cell is the sum
+of its weighted source grid cell values.
+
+Note that scipy is required to save the weights files, and to memory map
+them when loading, otherwise they are read with netCDF4.
+
+"""
+
+import numpy as np
+
+from .core import Weights
+
+
+# The names of the target and source grid cell indices, the weights and the
+# target grid cell area fractions, in the ESMF and SCRIP weights files.
+_ESMF_NAMES = ('row', 'col', 'S', 'frac_b')
+_SCRIP_NAMES = ('dst_address', 'src_address', 'remap_matrix',
+                'dst_grid_frac')
+
+
+def _netcdf_file():
+    # The scipy netCDF3 file class, which is an optional dependency.
+    try:
+        from scipy.io import netcdf_file
+    except ImportError:
+        emsg = 'Saving the weights file requires scipy, which is not ' \
+            'installed.'
+        raise ImportError(emsg)
+    return netcdf_file
+
+
+def _open(filename):
+    # Open the netCDF file, memory mapping netCDF3 files when scipy is
+    # available.
+    try:
+        from scipy.io import netcdf_file
+    except ImportError:
+        netcdf_file = None
+
+    if netcdf_file is not None:
+        try:
+            return netcdf_file(filename, 'r', mmap=True)
+        except TypeError:
+            # Not a netCDF3 file.
+            pass
+
+    # Fall back to the lazy netCDF4 reader.
+    import netCDF4
+    dataset = netCDF4.Dataset(filename, 'r')
+    dataset.set_auto_mask(False)
+    return dataset
+
+
+def _read(dataset, filename):
+    # Create the weights from the open weights file. The 1-based rows are
+    # used in place, as memory mapped by scipy, and the columns and the
+    # weights are copied once into the arrays of the weights.
+    variables = dataset.variables
+    names = _ESMF_NAMES
+    if 'row' not in variables and 'dst_address' in variables:
+        names = _SCRIP_NAMES
+    row_name, col_name, weights_name, frac_name = names
+    for name in names[:3] + ('src_grid_dims', 'dst_grid_dims'):
+        if name not in variables:
+            emsg = 'The weights file {!r} has no {!r} variable.'
+            raise ValueError(emsg.format(filename, name))
+
+    # The grid dimensions are in Fortran order.
+    src_shape = tuple(int(n) for n in variables['src_grid_dims'][::-1])
+    tgt_shape = tuple(int(n) for n in variables['dst_grid_dims'][::-1])
+    if len(src_shape) != 2 or len(tgt_shape) != 2:
+        emsg = 'Expected 2d source and target grids, got {} and {}.'
+        raise ValueError(emsg.format(src_shape, tgt_shape))
+    src_size = int(np.prod(src_shape))
+    tgt_size = int(np.prod(tgt_shape))
+
+    rows = variables[row_name][:]
+    cols = variables[col_name][:]
+    data = variables[weights_name][:]
+    if data.ndim == 2:
+        # Only the first order SCRIP weights are used.
+        data = data[:, 0]
+    if np.any(rows[1:] < rows[:-1]):
+        # Sort the entries by target grid cell.
+        order = np.argsort(rows, kind='stable')
+        rows, cols, data = rows[order], cols[order], data[order]
+
+    indices = np.subtract(cols, 1, dtype=np.int64)
+    data = np.array(data, dtype=np.float64)
+
+    if rows.size and (rows[0] < 1 or rows[-1] > tgt_size or
+                      indices.min() < 0 or indices.max() >= src_size):
+        emsg = 'The weights file {!r} has indices outside of the source ' \
+            'grid {} or target grid {}.'
+        raise ValueError(emsg.format(filename, src_shape, tgt_shape))
+
+    # The offsets of the first entry of each target grid cell, and of the
+    # end of the entries, within the sorted rows.
+    indptr = np.searchsorted(rows, np.arange(1, tgt_size + 2,
+                                             dtype=rows.dtype))
+    wsum = np.zeros(tgt_size)
+    cells = indptr[1:] > indptr[:-1]
+    if np.any(cells):
+        wsum[cells] = np.add.reduceat(data, indptr[:-1][cells])
+
+    tgt_area = None
+    if frac_name in variables:
+        frac = np.array(variables[frac_name][:], dtype=np.float64)
+        if frac.shape == (tgt_size,):
+            # Recover the target grid cell areas, relative to the weights
+            # sums, from their covered area fractions.
+            tgt_area = np.ones(tgt_size)
+            np.divide(wsum, frac, out=tgt_area,
+                      where=(frac > 0) & (wsum > 0))
+
+    return Weights(src_shape, tgt_shape, indptr, indices, data, wsum,
+                   tgt_area=tgt_area)
+
+
+def load_weights(filename):
+    """
+    Load the area weights from a SCRIP/ESMF sparse weights file.
+
+    A netCDF3 file is memory mapped when scipy is available, otherwise the
+    file is lazily read, and the source grid cell indices and the weights
+    are copied once from the file into the weights.
+
+    Args:
+
+    * filename:
+        The name of the weights file.
+
+    Returns:
+        The :class:`agg_regrid.Weights`, being the normalised weights with
+        a unit weights sum for each target grid cell with weights. The
+        :attr:`~agg_regrid.Weights.coverage` is the area fraction of each
+        target grid cell (frac_b or dst_grid_frac), if present.
+
+    """
+    dataset = _open(filename)
+    try:
+        # The weights hold no references to the memory mapped file data,
+        # so the file may be cleanly closed.
+        return _read(dataset, filename)
+    finally:
+        dataset.close()
+
+
+def save_weights(weights, filename):
+    """
+    Save the area weights to a SCRIP/ESMF sparse weights file.
+
+    The file is written in the netCDF3 64-bit offset format, so that it
+    may be memory mapped by :func:`load_weights`, which requires scipy.
+
+    Args:
+
+    * weights:
+        The :class:`agg_regrid.Weights` to save.
+    * filename:
+        The name of the weights file.
+
+    """
+    netcdf_file = _netcdf_file()
+
+    rows = weights.rows
+    counts = np.diff(weights.indptr)
+    # Normalise the weights by the weights sum of each target grid cell.
+    wsum = np.repeat(weights.wsum, counts)
+    data = np.divide(weights.data, wsum, out=np.zeros_like(weights.data),
+                     where=wsum != 0)
+
+    src_size = int(np.prod(weights.src_shape))
+    tgt_size = int(np.prod(weights.tgt_shape))
+    if weights.coverage is not None:
+        frac = weights.coverage.ravel()
+    else:
+        frac = (counts > 0).astype(np.float64)
+
+    with netcdf_file(filename, 'w', version=2) as dataset:
+        dataset.title = 'agg-regrid area weights'
+        dataset.normalization = 'fracarea'
+        dataset.map_method = 'Conservative remapping'
+        dataset.conventions = 'NCAR-CSM'
+
+        dataset.createDimension('n_a', src_size)
+        dataset.createDimension('n_b', tgt_size)
+        dataset.createDimension('n_s', data.size)
+        dataset.createDimension('src_grid_rank', 2)
+        dataset.createDimension('dst_grid_rank', 2)
+
+        variable = dataset.createVariable('src_grid_dims', 'i4',
+                                          ('src_grid_rank',))
+        variable[:] = weights.src_shape[::-1]
+        variable = dataset.createVariable('dst_grid_dims', 'i4',
+                                          ('dst_grid_rank',))
+        variable[:] = weights.tgt_shape[::-1]
+        variable = dataset.createVariable('row', 'i4', ('n_s',))
+        variable[:] = rows + 1
+        variable = dataset.createVariable('col', 'i4', ('n_s',))
+        variable[:] = weights.indices + 1
+        variable = dataset.createVariable('S', 'f8', ('n_s',))
+        variable[:] = data
+        variable = dataset.createVariable('frac_b', 'f8', ('n_b',))
+        variable[:] = frac
@@ -15,3 +15,46 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
 """Tests for agg_regrid."""
+
+import numpy as np
+
+
+def grid_cube(xs, ys, nz=None, value=0, level=False, **kwargs):
+    """
+    Returns a cube on the longitude and latitude grid of the points, with
+    guessed bounds, and data counting up from the value.
+
+    Kwargs:
+
+    * nz:
+        The number of leading levels. Defaults to None, for a 2d cube.
+    * value:
+        The value of the first data point. Defaults to 0.
+    * level:
+        Add a 'level' dimension coordinate to the leading levels. Defaults
+        to False.
+
+    Any other keyword arguments are passed to the cube.
+
+    """
+    import iris.cube
+    from iris.coord_systems import GeogCS
+    from iris.coords import DimCoord
+
+    cs = GeogCS(6371229)
+    x = DimCoord(xs, standard_name='longitude', units='degrees',
+                 coord_system=cs)
+    y = DimCoord(ys, standard_name='latitude', units='degrees',
+                 coord_system=cs)
+    x.guess_bounds()
+    y.guess_bounds()
+    shape = (ys.size, xs.size)
+    if nz is not None:
+        shape = (nz,) + shape
+    data = np.arange(np.prod(shape), dtype=np.float64).reshape(shape)
+    cube = iris.cube.Cube(data + value, **kwargs)
+    cube.add_dim_coord(y, len(shape) - 2)
+    cube.add_dim_coord(x, len(shape) - 1)
+    if level:
+        cube.add_dim_coord(DimCoord(np.arange(nz), long_name='level'), 0)
+    return cube
@@ -23,7 +23,8 @@ try:
 except ImportError:
     import mock
 
-from agg_regrid import AreaWeighted, DEFAULT_BUFFER_DEPTH
+from agg_regrid import (AreaWeighted, DEFAULT_BUFFER_DEPTH,
+                        DEFAULT_PIXEL_FORMAT)
 
 
 class Test(unittest.TestCase):
@@ -32,6 +33,7 @@ class Test(unittest.TestCase):
         self.tgt = mock.sentinel.tgt
         self.regridder = mock.sentinel.regridder
         self.depth = DEFAULT_BUFFER_DEPTH
+        self.pixel_format = DEFAULT_PIXEL_FORMAT
 
     def test_regridder(self):
         regridder = 'agg_regrid._AreaWeightedRegridder'
@@ -40,7 +42,12 @@ class Test(unittest.TestCase):
             scheme = AreaWeighted()
             result = scheme.regridder(self.src, self.tgt)
             self.assertEqual(result, self.regridder)
-            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth)]
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=False,
+                                  min_coverage=None,
+                                  engine='agg', tgt_cells=None,
+                                  compact=None)]
             self.assertEqual(mocker.mock_calls, expected)
 
     def test_regridder_with_buffer_depth(self):
@@ -51,9 +58,109 @@ class Test(unittest.TestCase):
             scheme = AreaWeighted(buffer_depth=depth)
             result = scheme.regridder(self.src, self.tgt)
             self.assertEqual(result, self.regridder)
-            expected = [mock.call(self.src, self.tgt, buffer_depth=depth)]
+            expected = [mock.call(self.src, self.tgt, buffer_depth=depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=False,
+                                  min_coverage=None,
+                                  engine='agg', tgt_cells=None,
+                                  compact=None)]
             self.assertEqual(mocker.mock_calls, expected)
 
+    def test_regridder_with_pixel_format(self):
+        pixel_format = mock.sentinel.pixel_format
+        regridder = 'agg_regrid._AreaWeightedRegridder'
+        with mock.patch(regridder, autospec=True,
+                        return_value=self.regridder) as mocker:
+            scheme = AreaWeighted(pixel_format=pixel_format)
+            result = scheme.regridder(self.src, self.tgt)
+            self.assertEqual(result, self.regridder)
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=pixel_format,
+                                  strict_grid=False,
+                                  min_coverage=None,
+                                  engine='agg', tgt_cells=None,
+                                  compact=None)]
+            self.assertEqual(mocker.mock_calls, expected)
+
+    def test_regridder_with_strict_grid(self):
+        regridder = 'agg_regrid._AreaWeightedRegridder'
+        with mock.patch(regridder, autospec=True,
+                        return_value=self.regridder) as mocker:
+            scheme = AreaWeighted(strict_grid=True)
+            result = scheme.regridder(self.src, self.tgt)
+            self.assertEqual(result, self.regridder)
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=True,
+                                  min_coverage=None,
+                                  engine='agg', tgt_cells=None,
+                                  compact=None)]
+            self.assertEqual(mocker.mock_calls, expected)
+
+    def test_regridder_with_min_coverage(self):
+        regridder = 'agg_regrid._AreaWeightedRegridder'
+        with mock.patch(regridder, autospec=True,
+                        return_value=self.regridder) as mocker:
+            scheme = AreaWeighted(min_coverage=0.5)
+            result = scheme.regridder(self.src, self.tgt)
+            self.assertEqual(result, self.regridder)
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=False, min_coverage=0.5,
+                                  engine='agg', tgt_cells=None,
+                                  compact=None)]
+            self.assertEqual(mocker.mock_calls, expected)
+
+    def test_regridder_with_engine(self):
+        regridder = 'agg_regrid._AreaWeightedRegridder'
+        with mock.patch(regridder, autospec=True,
+                        return_value=self.regridder) as mocker:
+            scheme = AreaWeighted(engine='auto')
+            result = scheme.regridder(self.src, self.tgt)
+            self.assertEqual(result, self.regridder)
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=False, min_coverage=None,
+                                  engine='auto', tgt_cells=None,
+                                  compact=None)]
+            self.assertEqual(mocker.mock_calls, expected)
+
+    def test_regridder_with_tgt_cells(self):
+        tgt_cells = mock.sentinel.tgt_cells
+        regridder = 'agg_regrid._AreaWeightedRegridder'
+        with mock.patch(regridder, autospec=True,
+                        return_value=self.regridder) as mocker:
+            scheme = AreaWeighted(tgt_cells=tgt_cells)
+            result = scheme.regridder(self.src, self.tgt)
+            self.assertEqual(result, self.regridder)
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=False, min_coverage=None,
+                                  engine='agg', tgt_cells=tgt_cells,
+                                  compact=None)]
+            self.assertEqual(mocker.mock_calls, expected)
+
+    def test_regridder_with_compact(self):
+        regridder = 'agg_regrid._AreaWeightedRegridder'
+        with mock.patch(regridder, autospec=True,
+                        return_value=self.regridder) as mocker:
+            scheme = AreaWeighted(compact='fixed')
+            result = scheme.regridder(self.src, self.tgt)
+            self.assertEqual(result, self.regridder)
+            expected = [mock.call(self.src, self.tgt, buffer_depth=self.depth,
+                                  pixel_format=self.pixel_format,
+                                  strict_grid=False, min_coverage=None,
+                                  engine='agg', tgt_cells=None,
+                                  compact='fixed')]
+            self.assertEqual(mocker.mock_calls, expected)
+
+    def test_repr(self):
+        scheme = AreaWeighted(buffer_depth=2, pixel_format='float')
+        expected = "AreaWeighted(buffer_depth=2, pixel_format='float', " \
+            "strict_grid=False, min_coverage=None, engine='agg', " \
+            "compact=None)"
+        self.assertEqual(repr(scheme), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
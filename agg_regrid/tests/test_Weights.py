@@ -0,0 +1,671 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.Weights` class."""
+
+import gc
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import numpy.ma as ma
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+import unittest
+from unittest import mock
+
+from agg_regrid import Weights
+import agg_regrid.core
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:2, x:3) and target grid shape (y:1, x:2).
+        self.src_shape = (2, 3)
+        self.tgt_shape = (1, 2)
+        self.indptr = np.array([0, 2, 2])
+        self.indices = np.array([0, 1])
+        self.data = np.array([1.0, 0.5])
+        self.wsum = np.array([1.5, 0.0])
+
+    def test_bad_indptr(self):
+        emsg = 'Expected 3 weights row offsets'
+        with self.assertRaisesRegex(ValueError, emsg):
+            Weights(self.src_shape, self.tgt_shape, self.indptr[:-1],
+                    self.indices, self.data, self.wsum)
+
+    def test_bad_indices(self):
+        emsg = 'Misaligned weights indices'
+        with self.assertRaisesRegex(ValueError, emsg):
+            Weights(self.src_shape, self.tgt_shape, self.indptr,
+                    self.indices[:-1], self.data, self.wsum)
+
+    def test_bad_wsum(self):
+        emsg = 'Expected 2 weights sums'
+        with self.assertRaisesRegex(ValueError, emsg):
+            Weights(self.src_shape, self.tgt_shape, self.indptr,
+                    self.indices, self.data, self.wsum[:-1])
+
+    def test_bad_tgt_area(self):
+        emsg = 'Expected 2 target grid cell areas'
+        with self.assertRaisesRegex(ValueError, emsg):
+            Weights(self.src_shape, self.tgt_shape, self.indptr,
+                    self.indices, self.data, self.wsum, tgt_area=[1.])
+
+    def test_coverage_unknown(self):
+        weights = Weights(self.src_shape, self.tgt_shape, self.indptr,
+                          self.indices, self.data, self.wsum)
+        self.assertIsNone(weights.tgt_area)
+        self.assertIsNone(weights.coverage)
+
+    def test_coverage(self):
+        weights = Weights(self.src_shape, self.tgt_shape, self.indptr,
+                          self.indices, self.data, self.wsum,
+                          tgt_area=[3., 2.])
+        assert_array_equal(weights.coverage, [[0.5, 0]])
+        self.assertIs(weights.coverage, weights.coverage)
+        self.assertFalse(weights.coverage.flags.writeable)
+
+    def test_coverage_clipped(self):
+        weights = Weights(self.src_shape, self.tgt_shape, self.indptr,
+                          self.indices, self.data, self.wsum,
+                          tgt_area=[1.4, 0.])
+        assert_array_equal(weights.coverage, [[1, 0]])
+
+    def test_rows(self):
+        weights = Weights(self.src_shape, self.tgt_shape, self.indptr,
+                          self.indices, self.data, self.wsum)
+        assert_array_equal(weights.rows, [0, 0])
+        self.assertEqual(weights.nnz, 2)
+
+
+class Test_apply(unittest.TestCase):
+    def setUp(self):
+        src_shape, tgt_shape = (2, 3), (1, 2)
+        indptr = np.array([0, 2, 2])
+        indices = np.array([0, 1])
+        data = np.array([1.0, 0.5])
+        wsum = np.array([1.5, 0.0])
+        self.weights = Weights(src_shape, tgt_shape, indptr, indices, data,
+                               wsum)
+        self.data = np.arange(12, dtype=np.float64).reshape(2, 2, 3)
+
+    def test_bad_shape(self):
+        emsg = r'Expected src data with shape \(-1,\) \+ \(2, 3\)'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.weights.apply(self.data[0])
+
+    def test_apply(self):
+        result = self.weights.apply(self.data)
+        expected = ma.masked_array([[[0.5 / 1.5, 0]], [[9.5 / 1.5, 0]]],
+                                   mask=[[[False, True]], [[False, True]]])
+        assert_array_equal(result, expected)
+        assert_array_equal(result.mask, expected.mask)
+
+    def test_apply_not_masked(self):
+        wsum = np.array([1.5, 1.5])
+        indptr = np.array([0, 2, 4])
+        indices = np.array([0, 1, 4, 5])
+        data = np.array([1.0, 0.5, 0.5, 1.0])
+        weights = Weights((2, 3), (1, 2), indptr, indices, data, wsum)
+        result = weights.apply(self.data)
+        self.assertFalse(ma.isMaskedArray(result))
+        expected = [[[0.5 / 1.5, 14.0 / 3]], [[9.5 / 1.5, 32.0 / 3]]]
+        assert_array_equal(result, expected)
+
+    def test_apply_masked_no_masked_points(self):
+        wsum = np.array([1.5, 1.5])
+        indptr = np.array([0, 2, 4])
+        indices = np.array([0, 1, 4, 5])
+        data = np.array([1.0, 0.5, 0.5, 1.0])
+        weights = Weights((2, 3), (1, 2), indptr, indices, data, wsum)
+        result = weights.apply(ma.masked_array(self.data))
+        self.assertFalse(ma.isMaskedArray(result))
+
+    def test_tgt_mask(self):
+        assert_array_equal(self.weights.tgt_mask, [[False, True]])
+
+    def test_apply_masked(self):
+        data = ma.masked_array(self.data)
+        data[0, 0, 1] = ma.masked
+        data[1, 0, :2] = ma.masked
+        result = self.weights.apply(data)
+        expected = ma.masked_array([[[0 / 1.5, 0]], [[0, 0]]],
+                                   mask=[[[False, True]], [[True, True]]])
+        assert_array_equal(result, expected)
+        assert_array_equal(result.mask, expected.mask)
+
+
+class Test_apply_adjoint(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:2, x:3) and target grid shape (y:1, x:3),
+        # where the last target grid cell has no weights.
+        src_shape, tgt_shape = (2, 3), (1, 3)
+        indptr = np.array([0, 2, 5, 5])
+        indices = np.array([0, 1, 1, 2, 4])
+        data = np.array([1.0, 0.5, 0.5, 1.0, 0.5])
+        wsum = np.array([1.5, 2.0, 0.0])
+        self.weights = Weights(src_shape, tgt_shape, indptr, indices, data,
+                               wsum)
+        self.data = np.arange(6, dtype=np.float64).reshape(2, 1, 3) + 1
+
+    def test_bad_shape(self):
+        emsg = r'Expected tgt data with shape \(-1,\) \+ \(1, 3\)'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.weights.apply_adjoint(self.data[0])
+
+    def test_apply_adjoint(self):
+        result = self.weights.apply_adjoint(self.data)
+        self.assertNotIsInstance(result, ma.MaskedArray)
+        expected = [[[1 / 1.5, 0.5 / 1.5 + 2 * 0.25, 2 * 0.5],
+                     [0, 2 * 0.25, 0]],
+                    [[4 / 1.5, 2 / 1.5 + 5 * 0.25, 5 * 0.5],
+                     [0, 5 * 0.25, 0]]]
+        assert_array_almost_equal(result, expected)
+
+    def test_apply_adjoint_masked(self):
+        data = ma.masked_array(self.data, mask=[[[False, True, False]],
+                                                [[False, False, False]]])
+        result = self.weights.apply_adjoint(data)
+        expected = self.weights.apply_adjoint(data.filled(0))
+        assert_array_equal(result, expected)
+        self.assertEqual(result[0, 1, 1], 0)
+
+    def test_transpose(self):
+        # The adjoint satisfies <A x, y> = <x, A^T y>.
+        rng = np.random.RandomState(0)
+        x = rng.rand(4, 2, 3)
+        y = rng.rand(4, 1, 3)
+        forward = self.weights.apply(x)
+        lhs = (forward.filled(0) * y).sum()
+        rhs = (x * self.weights.apply_adjoint(y)).sum()
+        self.assertAlmostEqual(lhs, rhs)
+
+    def test_no_weights(self):
+        weights = Weights((2, 3), (1, 1), [0, 0], [], [], [0.])
+        result = weights.apply_adjoint(np.ones((1, 1, 1)))
+        assert_array_equal(result, np.zeros((1, 2, 3)))
+
+
+class Test_aggregate(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:2, x:3) and target grid shape (y:1, x:3),
+        # where the last target grid cell has no weights.
+        src_shape, tgt_shape = (2, 3), (1, 3)
+        indptr = np.array([0, 3, 6, 6])
+        indices = np.array([0, 1, 3, 1, 2, 4])
+        data = np.array([1.0, 0.5, 0.0, 0.5, 1.0, 0.5])
+        wsum = np.array([1.5, 2.0, 0.0])
+        self.weights = Weights(src_shape, tgt_shape, indptr, indices, data,
+                               wsum)
+        self.data = np.array([[[1., 2., 3.], [4., 5., 6.]]])
+        self.names = ('mean', 'sum', 'fraction', 'min', 'max', 'std')
+
+    def test_bad_aggregation(self):
+        emsg = "Invalid aggregation, got 'median'"
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.weights.aggregate(self.data, ['mean', 'median'])
+
+    def test_bad_shape(self):
+        emsg = r'Expected src data with shape \(-1,\) \+ \(2, 3\)'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.weights.aggregate(self.data[0], ['mean'])
+
+    def test_aggregate(self):
+        results = self.weights.aggregate(self.data, self.names)
+        results = dict(zip(self.names, results))
+        mean1 = (1 + 0.5 * 2) / 1.5
+        mean2 = (0.5 * 2 + 3 + 0.5 * 5) / 2
+        std1 = np.sqrt(((1 - mean1) ** 2 + 0.5 * (2 - mean1) ** 2) / 1.5)
+        std2 = np.sqrt((0.5 * (2 - mean2) ** 2 + (3 - mean2) ** 2 +
+                        0.5 * (5 - mean2) ** 2) / 2)
+        expected = dict(mean=[mean1, mean2], sum=[2, 6.5], fraction=[1, 1],
+                        min=[1, 2], max=[2, 5], std=[std1, std2])
+        for name in self.names:
+            result = results[name]
+            self.assertEqual(result.shape, (1, 1, 3))
+            assert_array_equal(result.mask, [[[False, False, True]]])
+            assert_array_almost_equal(result[0, 0, :2], expected[name])
+
+    def test_mean(self):
+        result, = self.weights.aggregate(self.data, ['mean'])
+        assert_array_equal(result, self.weights.apply(self.data))
+
+    def test_order(self):
+        results = self.weights.aggregate(self.data, ['max', 'min', 'max'])
+        assert_array_equal(results[0], results[2])
+        assert_array_equal(results[1], [[[1, 2, 0]]])
+
+    def test_masked(self):
+        data = ma.masked_array(self.data, mask=[[[False, True, False],
+                                                 [True, False, False]]])
+        results = self.weights.aggregate(data, self.names)
+        results = dict(zip(self.names, results))
+        # The masked source data count towards the weights of the mean.
+        assert_array_almost_equal(results['mean'][0, 0, :2],
+                                  [1 / 1.5, 5.5 / 2])
+        assert_array_almost_equal(results['sum'][0, 0, :2], [1, 5.5])
+        assert_array_almost_equal(results['fraction'][0, 0, :2],
+                                  [1 / 1.5, 1.5 / 2])
+        assert_array_almost_equal(results['min'][0, 0, :2], [1, 3])
+        assert_array_almost_equal(results['max'][0, 0, :2], [1, 5])
+        mean2 = 5.5 / 1.5
+        std2 = np.sqrt(((3 - mean2) ** 2 + 0.5 * (5 - mean2) ** 2) / 1.5)
+        assert_array_almost_equal(results['std'][0, 0, :2], [0, std2])
+        results['mean'].mask[0, 0, 0] = True
+        self.assertFalse(results['sum'].mask[0, 0, 0])
+
+    def test_masked_without_overlap(self):
+        # Only the zero weight source data of the first target grid cell
+        # is unmasked.
+        data = ma.masked_array(self.data, mask=[[[True, True, False],
+                                                 [False, False, False]]])
+        results = self.weights.aggregate(data, self.names)
+        results = dict(zip(self.names, results))
+        for name in ('mean', 'sum', 'fraction'):
+            self.assertFalse(results[name].mask[0, 0, 0])
+        for name in ('min', 'max', 'std'):
+            self.assertTrue(results[name].mask[0, 0, 0])
+            self.assertFalse(results[name].mask[0, 0, 1])
+
+    def test_not_masked(self):
+        weights = Weights((2, 3), (1, 1), [0, 2], [0, 1], [1.0, 0.5], [1.5])
+        results = weights.aggregate(self.data, self.names)
+        for result in results:
+            self.assertNotIsInstance(result, ma.MaskedArray)
+
+
+class Test_aggregate_mask_cache(unittest.TestCase):
+    def setUp(self):
+        src_shape, tgt_shape = (2, 3), (1, 3)
+        indptr = np.array([0, 3, 6, 6])
+        indices = np.array([0, 1, 3, 1, 2, 4])
+        data = np.array([1.0, 0.5, 0.0, 0.5, 1.0, 0.5])
+        wsum = np.array([1.5, 2.0, 0.0])
+        self.weights = Weights(src_shape, tgt_shape, indptr, indices, data,
+                               wsum)
+        self.names = ('mean', 'sum', 'fraction', 'min', 'max', 'std')
+        self.masks = [[[False, True, False], [True, False, False]],
+                      [[True, True, False], [False, False, False]],
+                      [[False, False, False], [False, True, False]]]
+        self.data = ma.masked_array(np.arange(18.).reshape(3, 2, 3),
+                                    mask=self.masks)
+
+    def test_shared_mask(self):
+        data = ma.masked_array(np.arange(18.).reshape(3, 2, 3),
+                               mask=[self.masks[0]] * 3)
+        results = self.weights.aggregate(data, self.names)
+        self.assertEqual(len(self.weights._mask_cache), 1)
+        for i in range(3):
+            expected = self.weights.aggregate(data[i:i + 1], self.names)
+            for result, slice_result in zip(results, expected):
+                assert_array_equal(result[i:i + 1], slice_result)
+                assert_array_equal(result.mask[i:i + 1], slice_result.mask)
+
+    def test_mixed_masks(self):
+        results = self.weights.aggregate(self.data, self.names)
+        self.assertEqual(len(self.weights._mask_cache), 3)
+        for i in range(3):
+            weights = Weights(self.weights.src_shape, self.weights.tgt_shape,
+                              self.weights.indptr, self.weights.indices,
+                              self.weights.data, self.weights.wsum)
+            expected = weights.aggregate(self.data[i:i + 1], self.names)
+            for result, slice_result in zip(results, expected):
+                assert_array_equal(result[i:i + 1], slice_result)
+                assert_array_equal(result.mask[i:i + 1], slice_result.mask)
+
+    def test_reused(self):
+        self.weights.aggregate(self.data, ['mean'])
+        with mock.patch('numpy.where', side_effect=np.where) as where:
+            self.weights.aggregate(self.data, ['mean'])
+        where.assert_not_called()
+
+    def test_masked_values_ignored(self):
+        data = self.data.copy()
+        data.data[data.mask] = np.nan
+        results = self.weights.aggregate(data, self.names)
+        expected = self.weights.aggregate(self.data, self.names)
+        for result, expected_result in zip(results, expected):
+            assert_array_equal(result, expected_result)
+
+    def test_least_recently_used(self):
+        with mock.patch.object(agg_regrid.core, '_MASK_CACHE_SIZE', 2):
+            for i in (0, 1, 0, 2):
+                self.weights.aggregate(self.data[i:i + 1], ['mean'])
+        keys = [np.packbits(np.array(self.masks[i]).ravel()).tobytes()
+                for i in (0, 2)]
+        self.assertEqual(list(self.weights._mask_cache), keys)
+
+    def test_pickle(self):
+        self.weights.aggregate(self.data, ['mean'])
+        weights = pickle.loads(pickle.dumps(self.weights))
+        self.assertEqual(len(weights._mask_cache), 0)
+        self.assertIsNot(weights._lock, self.weights._lock)
+        assert_array_equal(weights.apply(self.data),
+                           self.weights.apply(self.data))
+
+
+class Test_aggregate_blocks(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:4, x:6) and target grid shape (y:2, x:3),
+        # where each target grid cell has a 2x2 window.
+        src_shape, tgt_shape = (4, 6), (2, 3)
+        rows = np.arange(6)
+        starts = (rows // 3) * 12 + (rows % 3) * 2
+        indices = (starts[:, np.newaxis] + [0, 1, 6, 7]).ravel()
+        data = np.random.RandomState(0).rand(24)
+        indptr = np.arange(7) * 4
+        wsum = np.add.reduceat(data, indptr[:-1])
+        self.weights = Weights(src_shape, tgt_shape, indptr, indices, data,
+                               wsum)
+        self.data = ma.masked_array(np.arange(120.).reshape(5, 4, 6))
+        self.data[1, 0, :3] = ma.masked
+        self.names = ('mean', 'sum', 'fraction', 'min', 'max', 'std')
+
+    def test_blocks(self):
+        expected = self.weights.aggregate(self.data, self.names)
+        # Blocks of two target grid cells and two leading slices.
+        with mock.patch.object(agg_regrid.core, '_BLOCK_SIZE', 16):
+            with mock.patch.object(agg_regrid.core, '_BLOCK_LEADING', 2):
+                results = self.weights.aggregate(self.data, self.names)
+        for result, expected_result in zip(results, expected):
+            assert_array_equal(result, expected_result)
+            assert_array_equal(result.mask, expected_result.mask)
+
+    def test_cover(self):
+        # Each leading slice and target grid cell is in exactly one block.
+        for size in (1, 7, 16, 1000):
+            with mock.patch.object(agg_regrid.core, '_BLOCK_SIZE', size):
+                covered = np.zeros((5, 6), dtype=int)
+                for lead, tile in agg_regrid.core._blocks(5, 6, 4):
+                    covered[lead, tile] += 1
+            assert_array_equal(covered, 1)
+
+
+class Test_compact(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:4, x:6) and target grid shape (y:2, x:3),
+        # with 2x2 windows, a 1x3 window and a target grid cell without
+        # weights.
+        src_shape, tgt_shape = (4, 6), (2, 3)
+        windows = [[0, 1, 6, 7], [2, 3, 8, 9], [4, 5, 10, 11],
+                   [12, 13, 18, 19], [15, 16, 17], []]
+        counts = [len(window) for window in windows]
+        indices = np.concatenate(windows).astype(np.int64)
+        quantum = 1. / 255
+        data = np.random.RandomState(0).randint(1, 256, indices.size)
+        data = data * quantum
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        wsum = np.zeros(6)
+        wsum[:5] = np.add.reduceat(data, indptr[:-2])
+        self.args = (src_shape, tgt_shape, indptr, indices, data, wsum)
+        self.quantum = quantum
+        self.weights = Weights(*self.args)
+        self.data = ma.masked_array(np.arange(72.).reshape(3, 4, 6))
+        self.data[1, 0, :3] = ma.masked
+        self.names = ('mean', 'sum', 'fraction', 'min', 'max', 'std')
+
+    def check(self, compact, rtol):
+        expected = self.weights.aggregate(self.data, self.names)
+        results = compact.aggregate(self.data, self.names)
+        for result, expected_result in zip(results, expected):
+            assert_array_equal(result.mask, expected_result.mask)
+            np.testing.assert_allclose(result.filled(0),
+                                       expected_result.filled(0), rtol=rtol)
+
+    def test_windows(self):
+        compact = Weights(*self.args).compact('float64')
+        self.assertIsNone(compact._indices)
+        self.assertEqual(compact._starts.dtype, np.int32)
+        assert_array_equal(compact.indices, self.weights.indices)
+        assert_array_equal(compact.data, self.weights.data)
+        self.assertEqual(compact.error, 0)
+        self.check(compact, 1e-12)
+
+    def test_not_windows(self):
+        indices = self.args[3].copy()
+        indices[[0, 1]] = indices[[1, 0]]
+        weights = Weights(*self.args[:3] + (indices,) + self.args[4:])
+        compact = Weights(*self.args[:3] + (indices,) + self.args[4:])
+        compact.compact('float64')
+        self.assertIsNone(compact._starts)
+        self.assertEqual(compact._indices.dtype, np.int32)
+        assert_array_equal(compact.indices, indices)
+        result = compact.apply(self.data)
+        assert_array_equal(result, weights.apply(self.data))
+
+    def test_irregular_rows(self):
+        # Rows of 2 and 3 weights, which share a window height and width.
+        args = ((3, 4), (1, 2), [0, 2, 5], [0, 4, 1, 5, 6],
+                [0.5, 0.5, 0.2, 0.3, 0.5], [1., 1.])
+        data = np.arange(12.).reshape(1, 3, 4)
+        compact = Weights(*args).compact('float64')
+        self.assertIsNone(compact._starts)
+        assert_array_equal(compact.indices, args[3])
+        assert_array_equal(compact.apply(data), Weights(*args).apply(data))
+
+    def test_float32(self):
+        compact = Weights(*self.args).compact()
+        self.assertEqual(compact._data.dtype, np.float32)
+        self.assertGreater(compact.error, 0)
+        self.assertLess(compact.error, 1e-7)
+        assert_array_almost_equal(compact.data, self.weights.data)
+        self.check(compact, 1e-6)
+
+    def test_fixed(self):
+        compact = Weights(*self.args).compact('fixed')
+        self.assertEqual(compact._data.dtype, np.uint16)
+        self.assertLessEqual(compact.error, self.weights.data.max() / 65535)
+        self.check(compact, 1e-4)
+
+    def test_fixed_quantum(self):
+        compact = Weights(*self.args, quantum=self.quantum).compact('fixed')
+        self.assertEqual(compact._data.dtype, np.uint16)
+        self.assertLess(compact.error, 1e-15)
+        self.check(compact, 1e-12)
+
+    def test_footprint(self):
+        before = self.weights.footprint()
+        compact = Weights(*self.args).compact('fixed')
+        after = compact.footprint()
+        self.assertEqual(list(after), list(before))
+        self.assertEqual(self.weights.nbytes, sum(before.values()))
+        self.assertLess(after['indices'], before['indices'])
+        self.assertLess(after['data'], before['data'])
+
+    def test_footprint_cache(self):
+        weights = Weights(*self.args)
+        before = weights.footprint()['cache']
+        weights.aggregate(self.data, ['mean'])
+        self.assertGreater(weights.footprint()['cache'], before)
+        weights.compact()
+        self.assertEqual(weights.footprint()['cache'], before)
+
+    def test_pickle(self):
+        compact = Weights(*self.args).compact('fixed')
+        result = pickle.loads(pickle.dumps(compact))
+        assert_array_equal(result.apply(self.data), compact.apply(self.data))
+
+    def test_bad_precision(self):
+        emsg = 'Invalid weights precision'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.weights.compact('float16')
+
+
+class Test_share(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:40, x:60) and target grid shape (y:20,
+        # x:30), where each target grid cell has a 2x2 window.
+        src_shape, tgt_shape = (40, 60), (20, 30)
+        rows = np.arange(600)
+        starts = (rows // 30) * 120 + (rows % 30) * 2
+        indices = (starts[:, np.newaxis] + [0, 1, 60, 61]).ravel()
+        data = np.random.RandomState(0).rand(2400)
+        indptr = np.arange(601) * 4
+        wsum = np.add.reduceat(data, indptr[:-1])
+        self.args = (src_shape, tgt_shape, indptr, indices, data, wsum)
+        self.data = np.arange(4800.).reshape(2, 40, 60)
+        self.expected = Weights(*self.args).apply(self.data)
+
+    def test_pickle(self):
+        weights = Weights(*self.args)
+        size = len(pickle.dumps(weights))
+        weights.share()
+        self.addCleanup(weights._owner)
+        self.assertTrue(os.path.exists(weights._shared.filename))
+        state = pickle.dumps(weights)
+        self.assertLess(len(state), size / 10)
+        result = pickle.loads(state)
+        assert_array_equal(result.apply(self.data), self.expected)
+        self.assertIsNone(result._owner)
+        self.assertFalse(result.wsum.flags.writeable)
+
+    def test_pickle_derived(self):
+        weights = Weights(*self.args, tgt_area=np.full(600, 4.)).share()
+        self.addCleanup(weights._owner)
+        size = len(pickle.dumps(weights))
+        adjoint = weights.apply_adjoint(self.expected)
+        coverage = weights.coverage
+        state = pickle.dumps(weights)
+        self.assertEqual(len(state), size)
+        result = pickle.loads(state)
+        self.assertIsNone(result._transposed)
+        assert_array_equal(result.apply_adjoint(self.expected), adjoint)
+        assert_array_equal(result.coverage, coverage)
+
+    def test_compact(self):
+        weights = Weights(*self.args).compact('fixed').share()
+        self.addCleanup(weights._owner)
+        result = pickle.loads(pickle.dumps(weights))
+        self.assertIsNone(result._indices)
+        assert_array_equal(result.apply(self.data),
+                           weights.apply(self.data))
+        np.testing.assert_allclose(result.apply(self.data), self.expected,
+                                   rtol=1e-4)
+
+    def test_removed(self):
+        weights = Weights(*self.args).share()
+        filename = weights._shared.filename
+        del weights
+        gc.collect()
+        self.assertFalse(os.path.exists(filename))
+
+    def test_removed_before_unpickled(self):
+        weights = Weights(*self.args).share()
+        filename = weights._shared.filename
+        state = pickle.dumps(weights)
+        del weights
+        gc.collect()
+        emsg = 'no longer exists, as the shared weights were garbage collected'
+        with self.assertRaisesRegex(FileNotFoundError, emsg):
+            pickle.loads(state)
+        self.assertFalse(os.path.exists(filename))
+
+    def test_removed_by_owner_process(self):
+        weights = Weights(*self.args).share()
+        filename = weights._shared.filename
+        self.addCleanup(os.remove, filename)
+        with mock.patch('os.getpid', return_value=-1):
+            weights._owner()
+        self.assertTrue(os.path.exists(filename))
+
+    def test_filename(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'weights')
+            weights = Weights(*self.args).share(filename)
+            self.assertIsNone(weights._owner)
+            result = pickle.loads(pickle.dumps(weights))
+            assert_array_equal(result.apply(self.data), self.expected)
+            del weights, result
+            gc.collect()
+            self.assertTrue(os.path.exists(filename))
+
+    def test_compact_unshared(self):
+        weights = Weights(*self.args).share()
+        self.addCleanup(weights._owner)
+        weights.compact()
+        self.assertIsNone(weights._shared)
+        result = pickle.loads(pickle.dumps(weights))
+        np.testing.assert_allclose(result.apply(self.data), self.expected,
+                                   rtol=1e-6)
+
+
+class Test_window(unittest.TestCase):
+    def setUp(self):
+        # Source grid shape (y:8, x:12) and target grid shape (y:4, x:6),
+        # where each target grid cell has a 2x2 window, except for the
+        # last target grid cell, which has no weights.
+        src_shape, tgt_shape = (8, 12), (4, 6)
+        rows = np.arange(23)
+        starts = (rows // 6) * 24 + (rows % 6) * 2
+        indices = (starts[:, np.newaxis] + [0, 1, 12, 13]).ravel()
+        data = np.random.RandomState(0).randint(1, 256, 92) / 255.
+        indptr = np.concatenate([np.arange(24) * 4, [92]])
+        wsum = np.zeros(24)
+        wsum[:23] = np.add.reduceat(data, indptr[:-2])
+        self.args = (src_shape, tgt_shape, indptr, indices, data, wsum)
+        self.tgt_area = np.full(24, 4.)
+        self.data = np.arange(192.).reshape(2, 8, 12)
+
+    def check(self, weights):
+        result = weights.window(slice(1, 4), slice(2, None))
+        self.assertEqual(result.src_shape, weights.src_shape)
+        self.assertEqual(result.tgt_shape, (3, 4))
+        expected = weights.apply(self.data)[:, 1:4, 2:]
+        assert_array_equal(result.apply(self.data), expected)
+        assert_array_equal(result.apply(self.data).mask, expected.mask)
+        return result
+
+    def test_window(self):
+        weights = Weights(*self.args, tgt_area=self.tgt_area)
+        result = self.check(weights)
+        assert_array_equal(result.coverage, weights.coverage[1:4, 2:])
+        self.assertIsNone(result._precision)
+
+    def test_compact(self):
+        for precision in ('float32', 'fixed'):
+            weights = Weights(*self.args).compact(precision)
+            result = self.check(weights)
+            self.assertEqual(result._precision, precision)
+            self.assertEqual(result._data.dtype, weights._data.dtype)
+            self.assertIsNotNone(result._starts)
+            self.assertEqual(result.error, weights.error)
+            assert_array_equal(result.data,
+                               weights.window(slice(1, 4),
+                                              slice(2, None)).data)
+
+    def test_full(self):
+        weights = Weights(*self.args)
+        result = weights.window(slice(None), slice(None))
+        assert_array_equal(result.indptr, weights.indptr)
+        assert_array_equal(result.indices, weights.indices)
+        assert_array_equal(result.data, weights.data)
+
+    def test_bad_step(self):
+        weights = Weights(*self.args)
+        emsg = 'Expected a unit step slice of the target grid x-dimension'
+        with self.assertRaisesRegex(ValueError, emsg):
+            weights.window(slice(None), slice(0, 4, 2))
+
+    def test_empty(self):
+        weights = Weights(*self.args)
+        emsg = 'Expected a non-empty window of the target grid y-dimension'
+        with self.assertRaisesRegex(ValueError, emsg):
+            weights.window(slice(3, 3), slice(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
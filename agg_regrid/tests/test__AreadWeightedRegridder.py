@@ -16,14 +16,25 @@
 # along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
 """Unit tests for the `agg_regrid._AreaWeightedRegridder` class."""
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import threading
+import time
 import unittest
-
-import iris
 from unittest import mock
+
+from iris.aux_factory import HybridHeightFactory
+from iris.coords import AuxCoord, DimCoord
+import iris.cube
+import numpy as np
 import numpy.ma as ma
+from numpy.testing import assert_array_almost_equal, assert_array_equal
 
-from agg_regrid import (_AreaWeightedRegridder as Regridder,
-                        DEFAULT_BUFFER_DEPTH)
+from agg_regrid import (_AreaWeightedRegridder as Regridder, BuildCancelled,
+                        DEFAULT_BUFFER_DEPTH, DEFAULT_PIXEL_FORMAT, Weights)
+import agg_regrid.engines as engines
+from agg_regrid.tests import grid_cube
 
 
 class Test(unittest.TestCase):
@@ -40,6 +51,10 @@ class Test(unittest.TestCase):
         self.tgt_grid = (self.gx, self.gy)
         self.side_effect = (self.src_grid, self.tgt_grid)
         self.snapshot_grid = 'agg_regrid.snapshot_grid'
+        patcher = mock.patch('agg_regrid._grid_fingerprint',
+                             side_effect=lambda x, y: (x, y))
+        self.fingerprint = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_bad_src_grid_cube(self):
         emsg = 'source grid must be a cube'
@@ -63,6 +78,16 @@ class Test(unittest.TestCase):
         self.assertIsNone(regridder._gy_bounds)
         self.assertIsNone(regridder._sx_bounds)
         self.assertIsNone(regridder._sy_bounds)
+        self.assertIsNone(regridder._weights)
+        self.assertEqual(regridder._src_fingerprint, self.src_grid)
+        self.assertEqual(regridder._tgt_fingerprint, self.tgt_grid)
+        self.assertFalse(regridder.strict_grid)
+
+    def test_bad_pixel_format(self):
+        with mock.patch(self.snapshot_grid, side_effect=self.side_effect):
+            emsg = 'Invalid pixel format'
+            with self.assertRaisesRegex(ValueError, emsg):
+                Regridder(self.src_cube, self.tgt_cube, pixel_format='gray')
 
     def test_snapshot_grid__no_sx_coord_system(self):
         sx = mock.Mock(coord_system=None)
@@ -136,13 +161,24 @@ class Test___call__(unittest.TestCase):
         dim_coords = [self.sx, self.sy]
         self.cube = mock.Mock(spec=iris.cube.Cube, coord_dims=coord_dims,
                               metadata=self.metadata, dim_coords=dim_coords,
-                              aux_coords=(), data=self.data)
+                              aux_coords=(), aux_factories=(),
+                              data=self.data)
         self.side_effect = (self.src_grid, self.tgt_grid)
+        patcher = mock.patch('agg_regrid._grid_fingerprint',
+                             side_effect=lambda x, y: (x, y))
+        self.fingerprint = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('agg_regrid._share_coord',
+                             side_effect=lambda coord: coord.copy())
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.gmesh = (mock.sentinel.gxx, mock.sentinel.gyy)
         self.snapshot_grid = 'agg_regrid.snapshot_grid'
         self.get_xy_dim_coords = 'agg_regrid.get_xy_dim_coords'
         self.meshgrid = 'numpy.meshgrid'
-        self.agg = 'agg_regrid.agg'
+        self.build_weights = 'agg_regrid.build_weights'
+        self.regrid = 'agg_regrid._regrid'
+        self.weights = mock.sentinel.weights
         self.add_dim_coord = 'iris.cube.Cube.add_dim_coord'
         self.depth = mock.sentinel.buffer_depth
 
@@ -171,6 +207,39 @@ class Test___call__(unittest.TestCase):
                     regridder = Regridder(self.src_cube, self.tgt_cube)
                     regridder(self.cube)
 
+    def test_different_grid_same_fingerprint(self):
+        sx = mock.Mock(coord_system=mock.sentinel.scrs)
+        self.fingerprint.side_effect = None
+        self.fingerprint.return_value = mock.sentinel.fingerprint
+        with mock.patch(self.snapshot_grid, side_effect=self.side_effect):
+            return_value = (sx, self.sy)
+            with mock.patch(self.get_xy_dim_coords, return_value=return_value):
+                with mock.patch(self.regrid, return_value=1):
+                    with mock.patch(self.build_weights):
+                        with mock.patch(self.add_dim_coord):
+                            regridder = Regridder(self.src_cube,
+                                                  self.tgt_cube)
+                            regridder._gx_bounds = mock.sentinel.gx_bounds
+                            regridder._gy_bounds = mock.sentinel.gy_bounds
+                            regridder(self.cube)
+        expected = [mock.call(*self.src_grid), mock.call(*self.tgt_grid),
+                    mock.call(sx, self.sy)]
+        self.assertEqual(self.fingerprint.call_args_list, expected)
+
+    def test_strict_grid__different_grid_same_fingerprint(self):
+        sx = mock.Mock(coord_system=mock.sentinel.scrs)
+        self.fingerprint.side_effect = None
+        self.fingerprint.return_value = mock.sentinel.fingerprint
+        with mock.patch(self.snapshot_grid, side_effect=self.side_effect):
+            return_value = (sx, self.sy)
+            with mock.patch(self.get_xy_dim_coords, return_value=return_value):
+                emsg = 'source cube is not defined on the same source grid'
+                with self.assertRaisesRegex(ValueError, emsg):
+                    regridder = Regridder(self.src_cube, self.tgt_cube,
+                                          strict_grid=True)
+                    regridder(self.cube)
+        self.assertEqual(self.fingerprint.call_count, 2)
+
     def test_same_crs(self):
         side_effect = (self.src_grid, self.src_grid)
         with mock.patch(self.snapshot_grid, side_effect=side_effect):
@@ -178,22 +247,31 @@ class Test___call__(unittest.TestCase):
                             return_value=self.src_grid):
                 with mock.patch(self.meshgrid, return_value=self.gmesh):
                     data = 1
-                    with mock.patch(self.agg, return_value=data) as magg:
-                        with mock.patch(self.add_dim_coord) as madd:
-                            regridder = Regridder(self.src_cube,
-                                                  self.tgt_cube,
-                                                  buffer_depth=self.depth)
-                            result = regridder(self.cube)
+                    with mock.patch(self.build_weights,
+                                    return_value=self.weights) as magg:
+                        with mock.patch(self.regrid,
+                                        return_value=data) as mregrid:
+                            with mock.patch(self.add_dim_coord) as madd:
+                                regridder = Regridder(self.src_cube,
+                                                      self.tgt_cube,
+                                                      buffer_depth=self.depth)
+                                result = regridder(self.cube)
 
         gxx, gyy = self.gmesh
         self.assertEqual(regridder._sx_bounds, self.sxb)
         self.assertEqual(regridder._sy_bounds, self.syb)
         self.assertEqual(regridder._gx_bounds, gxx)
         self.assertEqual(regridder._gy_bounds, gyy)
-        expected = [mock.call(self.data, self.sxp, self.sxb, self.syp,
-                              self.syb, self.sx_dim, self.sy_dim, gxx, gyy,
-                              self.depth)]
+        self.assertEqual(regridder._weights, self.weights)
+        expected = [mock.call('agg', self.sxp, self.sxb, self.syp, self.syb,
+                              gxx, gyy, self.depth,
+                              pixel_format=DEFAULT_PIXEL_FORMAT,
+                              min_coverage=None, tgt_cells=None,
+                              progress=None, cancel=None)]
         self.assertEqual(magg.call_args_list, expected)
+        expected = [mock.call(self.weights, self.data, self.sx_dim,
+                              self.sy_dim)]
+        self.assertEqual(mregrid.call_args_list, expected)
         expected = [mock.call(self.sx.copy(), [self.sx_dim]),
                     mock.call(self.sy.copy(), [self.sy_dim])]
         self.assertEqual(madd.call_args_list, expected)
@@ -210,16 +288,675 @@ class Test___call__(unittest.TestCase):
             with mock.patch(self.get_xy_dim_coords,
                             return_value=self.src_grid):
                 with mock.patch(self.meshgrid, return_value=self.gmesh):
-                    with mock.patch(self.agg, return_value=1) as magg:
-                        with mock.patch(self.add_dim_coord):
-                            regridder = Regridder(self.src_cube, self.tgt_cube)
-                            regridder(self.cube)
+                    with mock.patch(self.build_weights,
+                                    return_value=self.weights) as magg:
+                        with mock.patch(self.regrid,
+                                        return_value=1) as mregrid:
+                            with mock.patch(self.add_dim_coord):
+                                regridder = Regridder(self.src_cube,
+                                                      self.tgt_cube)
+                                regridder(self.cube)
 
         gxx, gyy = self.gmesh
-        expected = [mock.call(data.data, self.sxp, self.sxb, self.syp,
-                              self.syb, self.sx_dim, self.sy_dim, gxx, gyy,
-                              DEFAULT_BUFFER_DEPTH)]
+        expected = [mock.call('agg', self.sxp, self.sxb, self.syp, self.syb,
+                              gxx, gyy, DEFAULT_BUFFER_DEPTH,
+                              pixel_format=DEFAULT_PIXEL_FORMAT,
+                              min_coverage=None, tgt_cells=None,
+                              progress=None, cancel=None)]
         self.assertEqual(magg.call_args_list, expected)
+        expected = [mock.call(self.weights, data.data, self.sx_dim,
+                              self.sy_dim)]
+        self.assertEqual(mregrid.call_args_list, expected)
+
+    def test_cached_weights(self):
+        coord_dims = mock.Mock(side_effect=[[self.sx_dim], [self.sy_dim]] * 4)
+        self.cube.coord_dims = coord_dims
+        side_effect = (self.src_grid, self.src_grid)
+        with mock.patch(self.snapshot_grid, side_effect=side_effect):
+            with mock.patch(self.get_xy_dim_coords,
+                            return_value=self.src_grid):
+                with mock.patch(self.meshgrid, return_value=self.gmesh):
+                    with mock.patch(self.build_weights,
+                                    return_value=self.weights) as magg:
+                        with mock.patch(self.regrid,
+                                        return_value=1) as mregrid:
+                            with mock.patch(self.add_dim_coord):
+                                regridder = Regridder(self.src_cube,
+                                                      self.tgt_cube)
+                                regridder(self.cube)
+                                regridder(self.cube)
+
+        self.assertEqual(magg.call_count, 1)
+        expected = [mock.call(self.weights, self.data, self.sx_dim,
+                              self.sy_dim)] * 2
+        self.assertEqual(mregrid.call_args_list, expected)
+
+
+class Test___call____result_cube(unittest.TestCase):
+    def setUp(self):
+        self.src = self.cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5),
+                             nz=3)
+        self.tgt = self.cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        height = AuxCoord(np.arange(3.), long_name='level_height', units='m')
+        sigma = AuxCoord(np.linspace(1, 0, 3), long_name='sigma')
+        orography = AuxCoord(np.arange(30.).reshape(5, 6),
+                             standard_name='surface_altitude', units='m')
+        self.src.add_aux_coord(height, 0)
+        self.src.add_aux_coord(sigma, 0)
+        self.src.add_aux_coord(orography, (1, 2))
+        self.src.add_aux_factory(HybridHeightFactory(height, sigma,
+                                                     orography))
+        self.regridder = Regridder(self.src, self.tgt)
+
+    def cube(self, xs, ys, nz=None):
+        return grid_cube(xs, ys, nz=nz, level=nz is not None,
+                         standard_name='air_temperature', units='K')
+
+    def test_metadata(self):
+        result = self.regridder(self.src)
+        self.assertEqual(result.metadata, self.src.metadata)
+        self.src.attributes['source'] = 'test'
+        result = self.regridder(self.src)
+        self.assertEqual(result.attributes, dict(source='test'))
+        result.attributes['source'] = 'changed'
+        self.assertEqual(self.src.attributes['source'], 'test')
+
+    def test_coords(self):
+        result = self.regridder(self.src)
+        self.assertEqual(result.shape, (3, 3, 4))
+        self.assertEqual(result.coord('longitude'),
+                         self.tgt.coord('longitude'))
+        self.assertEqual(result.coord('latitude'),
+                         self.tgt.coord('latitude'))
+        self.assertEqual(result.coord_dims('longitude'), (2,))
+        self.assertEqual(result.coord_dims('latitude'), (1,))
+        for name in ('level', 'level_height', 'sigma'):
+            self.assertEqual(result.coord(name), self.src.coord(name))
+            self.assertEqual(result.coord_dims(name), (0,))
+
+    def test_coords_shared(self):
+        result = self.regridder(self.src)
+        for name in ('level', 'level_height'):
+            coord = result.coord(name)
+            src_coord = self.src.coord(name)
+            self.assertIsNot(coord, src_coord)
+            self.assertTrue(np.shares_memory(coord.points, src_coord.points))
+            self.assertFalse(coord.points.flags.writeable)
+            coord.rename('changed')
+            self.assertEqual(src_coord.name(), name)
+
+    def test_target_coords_shared(self):
+        result1 = self.regridder(self.src)
+        result2 = self.regridder(self.src)
+        x1, x2 = result1.coord('longitude'), result2.coord('longitude')
+        self.assertIsNot(x1, x2)
+        self.assertIsNot(x1, self.regridder._gx)
+        self.assertTrue(np.shares_memory(x1.points, x2.points))
+
+    def test_aux_factory(self):
+        result = self.regridder(self.src)
+        self.assertEqual(len(result.aux_factories), 1)
+        orography = result.coord('surface_altitude')
+        self.assertEqual(result.coord_dims(orography), (1, 2))
+        expected = self.regridder(self.src[0]).data - self.src[0, 0, 0].data
+        assert_array_equal(orography.points, expected)
+        altitude = result.coord('altitude')
+        self.assertEqual(altitude.shape, (3, 3, 4))
+        self.assertIs(result.aux_factory().dependencies['orography'],
+                      orography)
+
+    def test_aux_factory_dropped_coordinates(self):
+        src = self.cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5), nz=3)
+        height = AuxCoord(np.arange(3.), long_name='level_height', units='m')
+        sigma = AuxCoord(np.linspace(1, 0, 6), long_name='sigma')
+        src.add_aux_coord(height, 0)
+        src.add_aux_coord(sigma, 2)
+        src.add_aux_factory(HybridHeightFactory(height, sigma))
+        regridder = Regridder(src, self.tgt)
+        emsg = 'Cannot update aux factory'
+        with self.assertWarnsRegex(UserWarning, emsg):
+            result = regridder(src)
+        self.assertEqual(result.aux_factories, ())
+        self.assertEqual(len(result.coords('sigma')), 0)
+
+
+class Test_regrid_iter(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        self.tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, self.tgt)
+
+    def sources(self, n):
+        for value in range(n):
+            src = self.src.copy()
+            src.data = src.lazy_data() + value
+            yield src
+
+    def test_results(self):
+        results = list(self.regridder.regrid_iter(self.sources(5)))
+        self.assertEqual(len(results), 5)
+        for result, src in zip(results, self.sources(5)):
+            self.assertEqual(result, self.regridder(src))
+
+    def test_prefetch(self):
+        results = list(self.regridder.regrid_iter(self.sources(5),
+                                                  prefetch=1))
+        self.assertEqual(len(results), 5)
+
+    def test_realised_in_background(self):
+        sources = list(self.sources(2))
+        results = self.regridder.regrid_iter(sources)
+        next(results)
+        self.assertFalse(sources[0].has_lazy_data())
+        results.close()
+
+    def test_bad_prefetch(self):
+        emsg = 'prefetch of at least one'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.regridder.regrid_iter(self.sources(1), prefetch=0)
+
+    def test_bad_src_cube(self):
+        results = self.regridder.regrid_iter(['dummy'])
+        with self.assertRaisesRegex(TypeError, 'source must be a cube'):
+            next(results)
+
+    def test_different_grid(self):
+        src = grid_cube(np.linspace(0, 10, 7), np.linspace(0, 8, 5))
+        results = self.regridder.regrid_iter([self.src, src])
+        next(results)
+        emsg = 'source cube is not defined on the same source grid'
+        with self.assertRaisesRegex(ValueError, emsg):
+            next(results)
+
+
+async def _gather(*coros, **kwargs):
+    return await asyncio.gather(*coros, **kwargs)
+
+
+class Test_aregrid(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        self.tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, self.tgt)
+        self.expected = Regridder(self.src, self.tgt)(self.src)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.calls = 0
+
+    def slow_build_weights(self, *args, **kwargs):
+        from agg_regrid import engines
+        self.calls += 1
+        time.sleep(0.1)
+        return engines.build_weights(*args, **kwargs)
+
+    def gather(self, *coros, **kwargs):
+        return self.loop.run_until_complete(_gather(*coros, **kwargs))
+
+    def test_result(self):
+        result, = self.gather(self.regridder.aregrid(self.src))
+        self.assertEqual(result, self.expected)
+
+    def test_shared_weights_calculation(self):
+        with mock.patch('agg_regrid.build_weights',
+                        side_effect=self.slow_build_weights):
+            results = self.gather(*[self.regridder.aregrid(self.src)
+                                    for _ in range(5)])
+            result, = self.gather(self.regridder.aregrid(self.src))
+        self.assertEqual(self.calls, 1)
+        for result in results + [result]:
+            self.assertEqual(result, self.expected)
+        self.assertIsNone(self.regridder._pending_weights)
+
+    def test_executor(self):
+        threads = []
+
+        def build_weights(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return self.slow_build_weights(*args, **kwargs)
+
+        with ThreadPoolExecutor(thread_name_prefix='custom') as executor:
+            with mock.patch('agg_regrid.build_weights',
+                            side_effect=build_weights):
+                result, = self.gather(self.regridder.aregrid(self.src,
+                                                             executor))
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('custom'))
+        self.assertEqual(result, self.expected)
+
+    def test_failed_weights_calculation(self):
+        side_effect = [ValueError('bad weights'), self.slow_build_weights]
+
+        def build_weights(*args, **kwargs):
+            effect = side_effect.pop(0)
+            if isinstance(effect, Exception):
+                time.sleep(0.1)
+                raise effect
+            return effect(*args, **kwargs)
+
+        with mock.patch('agg_regrid.build_weights', side_effect=build_weights):
+            coros = [self.regridder.aregrid(self.src) for _ in range(3)]
+            results = self.gather(*coros, return_exceptions=True)
+            for result in results:
+                self.assertIsInstance(result, ValueError)
+            # The calculation is retried by the next caller.
+            result, = self.gather(self.regridder.aregrid(self.src))
+        self.assertEqual(result, self.expected)
+
+    def test_bad_src_cube(self):
+        emsg = 'source must be a cube'
+        with self.assertRaisesRegex(TypeError, emsg):
+            self.gather(self.regridder.aregrid('dummy'))
+
+
+class Test__get_weights(unittest.TestCase):
+    def setUp(self):
+        src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(src, tgt)
+        self.calls = 0
+
+    def test_threads(self):
+        def build_weights(*args, **kwargs):
+            self.calls += 1
+            time.sleep(0.1)
+            return mock.sentinel.weights
+
+        with mock.patch('agg_regrid.build_weights', side_effect=build_weights):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(self.regridder._get_weights)
+                           for _ in range(4)]
+                results = [future.result() for future in futures]
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [mock.sentinel.weights] * 4)
+
+    def test_min_coverage(self):
+        src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        tgt = grid_cube(np.linspace(-2, 8, 6), np.linspace(2, 6, 3))
+        regridder = Regridder(src, tgt, min_coverage=0.5)
+        with mock.patch('agg_regrid.build_weights',
+                        return_value=mock.sentinel.weights) as mocker:
+            regridder._get_weights()
+        _, kwargs = mocker.call_args
+        self.assertEqual(kwargs['min_coverage'], 0.5)
+
+    def test_tgt_cells(self):
+        src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        tgt_cells = np.zeros((3, 4), dtype=bool)
+        tgt_cells[1, 1:3] = True
+        regridder = Regridder(src, tgt, tgt_cells=tgt_cells)
+        result = regridder(src)
+        expected = Regridder(src, tgt)(src)
+        assert_array_equal(result.data.mask, ~tgt_cells)
+        assert_array_equal(result.data[tgt_cells], expected.data[tgt_cells])
+
+    def test_calculate_weights(self):
+        reports = []
+        weights = self.regridder.calculate_weights(progress=reports.append)
+        self.assertIs(weights, self.regridder._get_weights())
+        self.assertEqual(reports[-1][:2], (12, 12))
+
+    def test_calculate_weights_cancelled(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(BuildCancelled):
+            self.regridder.calculate_weights(cancel=cancel)
+        self.assertIsNone(self.regridder._weights)
+        self.assertFalse(self.regridder._lock.locked())
+        self.assertIsNotNone(self.regridder.calculate_weights())
+
+    def test_bad_min_coverage(self):
+        src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        emsg = 'Expected a minimum coverage between 0 and 1'
+        with self.assertRaisesRegex(ValueError, emsg):
+            Regridder(src, src, min_coverage=-0.1)
+
+    def test_compact(self):
+        src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        regridder = Regridder(src, tgt, compact='fixed')
+        weights = regridder._get_weights()
+        self.assertEqual(weights._data.dtype, np.uint16)
+        self.assertLess(weights.error, 1e-15)
+        expected = Regridder(src, tgt)
+        self.assertLess(weights.nbytes, expected._get_weights().nbytes)
+        assert_array_almost_equal(regridder(src).data, expected(src).data)
+
+    def test_bad_compact(self):
+        src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        emsg = 'Invalid weights precision'
+        with self.assertRaisesRegex(ValueError, emsg):
+            Regridder(src, src, compact='float16')
+
+
+def _window_cube(x0, x1, y0, y1):
+    # A window of a large target grid, with the same bounds.
+    bounds = np.arange(21) * 0.7 + 2
+    cube = grid_cube(bounds[x0:x1] + 0.35, bounds[y0:y1] + 0.35)
+    for name, start, stop in (('longitude', x0, x1),
+                              ('latitude', y0, y1)):
+        cube.coord(name).bounds = np.stack([bounds[start:stop],
+                                            bounds[start + 1:stop + 1]],
+                                           axis=-1)
+    return cube
+
+
+class Test_updated(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 19, 20), np.linspace(0, 15, 16))
+        self.regridder = Regridder(self.src, _window_cube(0, 8, 0, 6))
+        # Move the target grid by two columns, and extend it by one row.
+        self.tgt = _window_cube(2, 10, 0, 7)
+
+    def test_reuse(self):
+        from agg_regrid import engines
+
+        self.regridder(self.src)
+        with mock.patch('agg_regrid.build_weights',
+                        side_effect=engines.build_weights) as mocker:
+            regridder = self.regridder.updated(self.tgt)
+        _, kwargs = mocker.call_args
+        # Only the new column and row of target grid cells are calculated.
+        self.assertEqual(len(kwargs['tgt_cells']), 2 * 7 + 6)
+        expected = Regridder(self.src, self.tgt)
+        assert_array_equal(regridder._weights.indptr,
+                           expected._get_weights().indptr)
+        assert_array_equal(regridder._weights.data,
+                           expected._get_weights().data)
+        assert_array_equal(regridder(self.src).data,
+                           expected(self.src).data)
+        self.assertIsNot(regridder._lock, self.regridder._lock)
+        self.assertEqual(regridder._tgt_fingerprint,
+                         expected._tgt_fingerprint)
+
+    def test_without_weights(self):
+        with mock.patch('agg_regrid.build_weights') as mocker:
+            regridder = self.regridder.updated(self.tgt)
+        self.assertEqual(mocker.call_count, 0)
+        self.assertIsNone(regridder._weights)
+        expected = Regridder(self.src, self.tgt)(self.src)
+        assert_array_equal(regridder(self.src).data, expected.data)
+
+    def test_tgt_cells(self):
+        self.regridder.tgt_cells = [0]
+        self.regridder(self.src)
+        regridder = self.regridder.updated(self.tgt, tgt_cells=[0, 1, 8])
+        expected = Regridder(self.src, self.tgt,
+                             tgt_cells=[0, 1, 8])(self.src)
+        result = regridder(self.src)
+        assert_array_equal(result.data.mask, expected.data.mask)
+        assert_array_equal(result.data, expected.data)
+
+    def test_bad_tgt_grid_cube(self):
+        emsg = 'target grid must be a cube'
+        with self.assertRaisesRegex(TypeError, emsg):
+            self.regridder.updated('dummy')
+
+
+class Test_window(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 19, 20), np.linspace(0, 15, 16))
+        self.regridder = Regridder(self.src, _window_cube(0, 8, 0, 6))
+
+    def test_window(self):
+        self.regridder(self.src)
+        with mock.patch('agg_regrid.build_weights') as mocker:
+            regridder = self.regridder.window(y=slice(1, 4), x=slice(2, 7))
+            result = regridder(self.src)
+        self.assertEqual(mocker.call_count, 0)
+        expected = Regridder(self.src, _window_cube(2, 7, 1, 4))
+        self.assertEqual(regridder._tgt_fingerprint,
+                         expected._tgt_fingerprint)
+        assert_array_equal(regridder._gx_bounds, expected._grid_bounds()[2])
+        assert_array_equal(regridder._gy_bounds, expected._grid_bounds()[3])
+        self.assertEqual(result, expected(self.src))
+        self.assertIsNot(regridder._lock, self.regridder._lock)
+
+    def test_bbox(self):
+        self.regridder(self.src)
+        result = self.regridder.window(bbox=(3.6, 2.8, 6.7, 4.6))
+        expected = self.regridder.window(y=slice(1, 4), x=slice(2, 7))
+        self.assertEqual(result._tgt_fingerprint, expected._tgt_fingerprint)
+        self.assertEqual(result(self.src), expected(self.src))
+
+    def test_without_weights(self):
+        regridder = self.regridder.window(y=slice(1, 4), x=slice(2, 7))
+        self.assertIsNone(regridder._weights)
+        expected = Regridder(self.src, _window_cube(2, 7, 1, 4))(self.src)
+        self.assertEqual(regridder(self.src), expected)
+
+    def test_tgt_cells(self):
+        self.regridder.tgt_cells = [9, 10, 20]
+        self.regridder(self.src)
+        regridder = self.regridder.window(y=slice(1, 4), x=slice(2, 7))
+        expected = np.ones((3, 5), dtype=bool)
+        expected[0, 0] = expected[1, 2] = False
+        assert_array_equal(regridder.tgt_cells, ~expected)
+        assert_array_equal(regridder(self.src).data.mask, expected)
+
+    def test_compact(self):
+        self.regridder.compact = 'fixed'
+        self.regridder(self.src)
+        regridder = self.regridder.window(y=slice(1, 4), x=slice(2, 7))
+        self.assertEqual(regridder._weights._precision, 'fixed')
+        expected = Regridder(self.src, _window_cube(2, 7, 1, 4))(self.src)
+        assert_array_almost_equal(regridder(self.src).data, expected.data)
+
+    def test_bad_bbox(self):
+        emsg = 'Expected either the window slices or a bounding box'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.regridder.window(x=slice(2, 7), bbox=(3.6, 2.8, 6.7, 4.6))
+
+    def test_empty_bbox(self):
+        emsg = 'Expected a non-empty window of the target grid x-dimension'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.regridder.window(bbox=(30, 2.8, 40, 4.6))
+
+
+class Test_pickle(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, tgt)
+        self.expected = Regridder(self.src, tgt)(self.src)
+
+    def test_pickle(self):
+        self.regridder(self.src)
+        regridder = pickle.loads(pickle.dumps(self.regridder))
+        self.assertIsNotNone(regridder._weights)
+        self.assertIsNot(regridder._lock, self.regridder._lock)
+        self.assertEqual(regridder(self.src), self.expected)
+
+    def test_pickle_without_weights(self):
+        regridder = pickle.loads(pickle.dumps(self.regridder))
+        self.assertIsNone(regridder._weights)
+        self.assertEqual(regridder(self.src), self.expected)
+
+    def test_pickle_without_bounds(self):
+        self.regridder(self.src)
+        regridder = pickle.loads(pickle.dumps(self.regridder))
+        self.assertIsNotNone(self.regridder._gx_bounds)
+        self.assertIsNone(regridder._gx_bounds)
+        self.assertIsNone(regridder._gy_bounds)
+
+    def test_share(self):
+        result = self.regridder.share()
+        self.assertIs(result, self.regridder)
+        weights = self.regridder._weights
+        self.addCleanup(weights._owner)
+        self.assertIsNotNone(weights._shared)
+        regridder = pickle.loads(pickle.dumps(self.regridder))
+        self.assertEqual(regridder._weights._shared, weights._shared)
+        self.assertEqual(regridder(self.src), self.expected)
+
+
+class Test_adjoint(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        self.tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, self.tgt)
+
+    def test_transpose(self):
+        rng = np.random.RandomState(0)
+        src = self.src.copy(rng.rand(*self.src.shape))
+        tgt = self.tgt.copy(rng.rand(*self.tgt.shape))
+        forward = self.regridder(src)
+        adjoint = self.regridder.adjoint(tgt)
+        self.assertEqual(adjoint.shape, self.src.shape)
+        self.assertAlmostEqual((forward.data * tgt.data).sum(),
+                               (src.data * adjoint.data).sum())
+
+    def test_coords(self):
+        result = self.regridder.adjoint(self.tgt)
+        self.assertEqual(result.coord('longitude'),
+                         self.src.coord('longitude'))
+        self.assertEqual(result.coord('latitude'), self.src.coord('latitude'))
+
+    def test_leading_dimension(self):
+        tgt = iris.cube.CubeList([self.tgt.copy(self.tgt.data + i)
+                                  for i in range(3)])
+        for i, cube in enumerate(tgt):
+            cube.add_aux_coord(DimCoord(i, long_name='level'))
+        tgt = tgt.merge_cube()
+        tgt.transpose([1, 0, 2])
+        result = self.regridder.adjoint(tgt)
+        self.assertEqual(result.shape, (5, 3, 6))
+        assert_array_equal(result.data[:, 1],
+                           self.regridder.adjoint(tgt[:, 1]).data)
+        self.assertEqual(result.coord_dims('level'), (1,))
+
+    def test_bad_tgt_cube(self):
+        with self.assertRaisesRegex(TypeError, 'target must be a cube'):
+            self.regridder.adjoint('dummy')
+
+    def test_src_cube(self):
+        emsg = 'target cube is not defined on the same target grid'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.regridder.adjoint(self.src)
+
+
+class Test_aggregate(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        self.src.rename('air_temperature')
+        self.src.units = 'K'
+        self.tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, self.tgt)
+
+    def test_aggregate(self):
+        names = ['mean', 'sum', 'fraction', 'min', 'max', 'std']
+        cubes = self.regridder.aggregate(self.src, names)
+        self.assertIsInstance(cubes, iris.cube.CubeList)
+        self.assertEqual(len(cubes), 6)
+        mean, total, fraction, minimum, maximum, std = cubes
+        self.assertEqual(mean, self.regridder(self.src))
+        for cube in cubes:
+            self.assertEqual(cube.shape, (3, 4))
+            self.assertEqual(cube.coord('longitude'),
+                             self.tgt.coord('longitude'))
+        self.assertEqual(total.name(), 'air_temperature')
+        self.assertEqual(total.cell_methods[0].method, 'sum')
+        self.assertEqual(total.cell_methods[0].coord_names, ('area',))
+        self.assertEqual(minimum.cell_methods[0].method, 'minimum')
+        self.assertEqual(maximum.cell_methods[0].method, 'maximum')
+        self.assertEqual(std.cell_methods[0].method, 'standard_deviation')
+        self.assertEqual(fraction.name(), 'valid_fraction')
+        self.assertEqual(fraction.units, '1')
+        self.assertEqual(fraction.cell_methods, ())
+        assert_array_equal(fraction.data, 1)
+        self.assertTrue(np.all(minimum.data <= mean.data))
+        self.assertTrue(np.all(maximum.data >= mean.data))
+        self.assertTrue(np.all(std.data >= 0))
+
+    def test_single_pass(self):
+        with mock.patch('agg_regrid.core.Weights.aggregate',
+                        autospec=True, side_effect=lambda w, d, a: [
+                            np.zeros((d.shape[0],) + w.tgt_shape)] * len(a)
+                        ) as aggregate:
+            self.regridder.aggregate(self.src, ['sum', 'max'])
+        self.assertEqual(aggregate.call_count, 1)
+
+    def test_bad_aggregation(self):
+        with self.assertRaisesRegex(ValueError, 'Invalid aggregation'):
+            self.regridder.aggregate(self.src, ['median'])
+
+
+class Test_coverage(unittest.TestCase):
+    def setUp(self):
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        # The first target grid column lies partly outside the source grid.
+        self.tgt = grid_cube(np.linspace(-1, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, self.tgt)
+
+    def test_coverage(self):
+        coverage = self.regridder.coverage()
+        self.assertEqual(coverage.name(), 'coverage_fraction')
+        self.assertEqual(coverage.units, '1')
+        self.assertEqual(coverage.shape, (3, 4))
+        self.assertEqual(coverage.coord('longitude'),
+                         self.tgt.coord('longitude'))
+        assert_array_equal(coverage.data[:, 0], 0)
+        assert_array_almost_equal(coverage.data[:, 1:], 1, decimal=2)
+
+    def test_call(self):
+        result, coverage = self.regridder(self.src, coverage=True)
+        self.assertEqual(result, self.regridder(self.src))
+        self.assertEqual(coverage, self.regridder.coverage())
+
+    def test_call_masked(self):
+        src = self.src.copy(ma.masked_array(self.src.data))
+        src.data[:, :3] = ma.masked
+        result, coverage = self.regridder(src, coverage=True)
+        self.assertEqual(result, self.regridder(src))
+        self.assertEqual(coverage.name(), 'coverage_fraction')
+        self.assertEqual(coverage.shape, result.shape)
+        weights = self.regridder._get_weights()
+        fraction, = weights.aggregate(src.data[np.newaxis], ['fraction'])
+        expected = fraction[0].filled(0) * weights.coverage
+        self.assertNotIsInstance(coverage.data, ma.MaskedArray)
+        assert_array_almost_equal(coverage.data, expected)
+        self.assertTrue(np.all(coverage.data[:, 1] < 1))
+
+    def test_call_masked_transposed(self):
+        src = self.src.copy(ma.masked_array(self.src.data))
+        src.data[:, :3] = ma.masked
+        _, expected = self.regridder(src, coverage=True)
+        src.transpose()
+        result, coverage = self.regridder(src, coverage=True)
+        self.assertEqual(result.coord_dims('longitude'), (0,))
+        assert_array_almost_equal(coverage.data, expected.data.T)
+
+    def test_min_coverage(self):
+        regridder = Regridder(self.src, self.tgt, min_coverage=0.75)
+        coverage = regridder.coverage()
+        # The partly covered first target grid column is rejected.
+        assert_array_equal(coverage.data[:, 0], 0)
+        assert_array_almost_equal(coverage.data[:, 1:], 1, decimal=2)
+
+    def test_call_min_coverage(self):
+        src = self.src.copy(ma.masked_array(self.src.data))
+        src.data[:, -1] = ma.masked
+        regridder = Regridder(self.src, self.tgt, min_coverage=0.75)
+        result, coverage = regridder(src, coverage=True)
+        self.assertTrue(np.all(result.data.mask[:, 0]))
+        assert_array_equal(coverage.data[:, 0], 0)
+        self.assertTrue(np.all(coverage.data[:, 1:] > 0))
+
+    def test_no_tgt_area(self):
+        def builder(*args, **kwargs):
+            weights = engines.agg_weights(*args, **kwargs)
+            return Weights(weights.src_shape, weights.tgt_shape,
+                           weights.indptr, weights.indices, weights.data,
+                           weights.wsum)
+
+        with mock.patch.dict(engines._ENGINES):
+            engines.register_engine('no_area', builder)
+            regridder = Regridder(self.src, self.tgt, engine='no_area')
+            emsg = 'no target grid cell areas'
+            with self.assertRaisesRegex(ValueError, emsg):
+                regridder.coverage()
+            with self.assertRaisesRegex(ValueError, emsg):
+                regridder(self.src, coverage=True)
 
 
 if __name__ == '__main__':
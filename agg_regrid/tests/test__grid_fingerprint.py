@@ -0,0 +1,98 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid._grid_fingerprint` function."""
+
+import unittest
+
+from iris.coord_systems import GeogCS
+from iris.coords import DimCoord
+import numpy as np
+
+from agg_regrid import _grid_fingerprint
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.cs = GeogCS(6371229)
+        self.x = self.coord(np.linspace(0, 90, 10), 'longitude')
+        self.y = self.coord(np.linspace(-45, 45, 7), 'latitude')
+        self.fingerprint = _grid_fingerprint(self.x, self.y)
+
+    def coord(self, points, name, cs=None, units='degrees', bounds=None):
+        if cs is None:
+            cs = self.cs
+        coord = DimCoord(points, standard_name=name, units=units,
+                         coord_system=cs, bounds=bounds)
+        if bounds is None:
+            coord.guess_bounds()
+        return coord
+
+    def test_hashable(self):
+        self.assertEqual(hash(self.fingerprint),
+                         hash(_grid_fingerprint(self.x, self.y)))
+
+    def test_copy(self):
+        result = _grid_fingerprint(self.x.copy(), self.y.copy())
+        self.assertEqual(result, self.fingerprint)
+
+    def test_equal_coord_system(self):
+        x = self.coord(self.x.points, 'longitude', cs=GeogCS(6371229))
+        self.assertEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_different_coord_system(self):
+        x = self.coord(self.x.points, 'longitude', cs=GeogCS(6371000))
+        self.assertNotEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_different_shape(self):
+        x = self.coord(np.linspace(0, 90, 11), 'longitude')
+        self.assertNotEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_different_end_points(self):
+        y = self.coord(np.linspace(-45, 46, 7), 'latitude')
+        self.assertNotEqual(_grid_fingerprint(self.x, y), self.fingerprint)
+
+    def test_different_dtype(self):
+        x = self.coord(self.x.points.astype(np.float32), 'longitude')
+        self.assertNotEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_different_units(self):
+        x = self.coord(np.deg2rad(self.x.points), 'longitude',
+                       units='radians')
+        self.assertNotEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_different_bounds(self):
+        x = self.x.copy()
+        x.bounds = x.bounds + 1
+        self.assertNotEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_no_bounds(self):
+        x = self.x.copy()
+        x.bounds = None
+        self.assertNotEqual(_grid_fingerprint(x, self.y), self.fingerprint)
+
+    def test_swapped(self):
+        self.assertNotEqual(_grid_fingerprint(self.y, self.x),
+                            self.fingerprint)
+
+    def test_single_point(self):
+        x = self.coord(np.array([10.]), 'longitude', bounds=[[5, 15]])
+        fingerprint = _grid_fingerprint(x, self.y)
+        self.assertEqual(fingerprint[0][6], 0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
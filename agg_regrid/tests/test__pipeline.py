@@ -0,0 +1,102 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid._pipeline.pipeline` function."""
+
+import itertools
+import threading
+import time
+import unittest
+
+from agg_regrid._pipeline import pipeline
+
+
+def _double(x):
+    return 2 * x
+
+
+def _increment(x):
+    return x + 1
+
+
+class Test(unittest.TestCase):
+    def test_results(self):
+        result = list(pipeline(range(10), (_double, _increment), 2))
+        self.assertEqual(result, [2 * x + 1 for x in range(10)])
+
+    def test_no_items(self):
+        self.assertEqual(list(pipeline([], (_double,), 1)), [])
+
+    def test_background_threads(self):
+        caller = threading.current_thread()
+        threads = []
+
+        def record(x):
+            threads.append(threading.current_thread())
+            return x
+
+        list(pipeline(range(3), (record,), 1))
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(caller, threads)
+
+    def test_bounded(self):
+        produced = itertools.count()
+
+        def items():
+            while True:
+                yield next(produced)
+
+        results = pipeline(items(), (_double, _increment), 2)
+        self.assertEqual(next(results), 1)
+        time.sleep(0.3)
+        # Two queues of two items, one item held by each of the two stages,
+        # one item yielded to the consumer and one more counted.
+        self.assertLessEqual(next(produced), 8)
+        results.close()
+
+    def test_function_failure(self):
+        def fail(x):
+            if x == 2:
+                raise ValueError('bad item')
+            return x
+
+        results = pipeline(range(5), (fail, _double), 1)
+        self.assertEqual(next(results), 0)
+        self.assertEqual(next(results), 2)
+        with self.assertRaisesRegex(ValueError, 'bad item'):
+            next(results)
+
+    def test_items_failure(self):
+        def items():
+            yield 1
+            raise IOError('bad file')
+
+        results = pipeline(items(), (_double,), 1)
+        self.assertEqual(next(results), 2)
+        with self.assertRaisesRegex(IOError, 'bad file'):
+            next(results)
+
+    def test_close(self):
+        before = threading.active_count()
+        results = pipeline(itertools.count(), (_double, _increment), 1)
+        self.assertEqual(next(results), 1)
+        self.assertEqual(threading.active_count(), before + 2)
+        results.close()
+        self.assertEqual(threading.active_count(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
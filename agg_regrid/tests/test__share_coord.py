@@ -0,0 +1,76 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid._share_coord` function."""
+
+import unittest
+
+from iris.coords import AuxCoord, DimCoord
+import numpy as np
+
+from agg_regrid import _share_coord
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.aux = AuxCoord(np.arange(4.), long_name='forecast_period',
+                            units='hours', bounds=np.arange(8.).reshape(4, 2))
+        self.dim = DimCoord(np.arange(4.), long_name='time', units='hours')
+
+    def test_equal(self):
+        for coord in (self.aux, self.dim):
+            result = _share_coord(coord)
+            self.assertIsNot(result, coord)
+            self.assertEqual(result, coord)
+            self.assertEqual(type(result), type(coord))
+
+    def test_shared_points_and_bounds(self):
+        result = _share_coord(self.aux)
+        self.assertTrue(np.shares_memory(result.points, self.aux.points))
+        self.assertTrue(np.shares_memory(result.bounds, self.aux.bounds))
+
+    def test_read_only(self):
+        result = _share_coord(self.aux)
+        self.assertFalse(result.points.flags.writeable)
+        self.assertFalse(result.bounds.flags.writeable)
+        self.assertTrue(self.aux.points.flags.writeable)
+        with self.assertRaises(ValueError):
+            result.points[0] = 10
+
+    def test_independent_metadata(self):
+        self.aux.attributes['source'] = 'test'
+        result = _share_coord(self.aux)
+        result.attributes['source'] = 'changed'
+        result.rename('changed')
+        self.assertEqual(self.aux.attributes['source'], 'test')
+        self.assertEqual(self.aux.name(), 'forecast_period')
+
+    def test_independent_values(self):
+        result = _share_coord(self.aux)
+        result.points = np.zeros(4)
+        result.bounds = None
+        self.assertEqual(self.aux.points[1], 1)
+        self.assertTrue(self.aux.has_bounds())
+
+    def test_lazy(self):
+        coord = AuxCoord(self.aux.lazy_points(), long_name='lazy')
+        result = _share_coord(coord)
+        self.assertTrue(result.has_lazy_points())
+        self.assertIs(result.core_points(), coord.core_points())
+
+
+if __name__ == '__main__':
+    unittest.main()
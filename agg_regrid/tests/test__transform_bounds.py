@@ -0,0 +1,80 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid._transform_bounds` function."""
+
+import unittest
+from unittest import mock
+
+import cartopy.crs as ccrs
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import agg_regrid
+from agg_regrid import _transform_bounds
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.from_crs = ccrs.RotatedPole(177.5, 37.5)
+        self.to_crs = ccrs.PlateCarree()
+        self.x_bounds = np.linspace(-20, 20, 11)
+        self.y_bounds = np.linspace(-15, 15, 7)
+        xx, yy = np.meshgrid(self.x_bounds, self.y_bounds)
+        xyz = self.to_crs.transform_points(self.from_crs, xx, yy)
+        self.expected = xyz[..., 0], xyz[..., 1]
+
+    def check(self, workers):
+        result = _transform_bounds(self.from_crs, self.to_crs,
+                                   self.x_bounds, self.y_bounds,
+                                   workers=workers)
+        for bounds, expected in zip(result, self.expected):
+            self.assertEqual(bounds.shape, (7, 11))
+            assert_array_equal(bounds, expected)
+
+    def test_single_chunk(self):
+        self.check(workers=4)
+
+    def test_chunked(self):
+        # Two rows per chunk, with a partial last chunk.
+        with mock.patch.object(agg_regrid, '_TRANSFORM_CHUNK_SIZE', 22):
+            with mock.patch.object(self.to_crs, 'transform_points',
+                                   wraps=self.to_crs.transform_points) as tp:
+                self.check(workers=4)
+        self.assertEqual(tp.call_count, 4)
+        self.assertEqual([args[1].shape for args, _ in tp.call_args_list],
+                         [(2, 11)] * 3 + [(1, 11)])
+
+    def test_chunked_serial(self):
+        with mock.patch.object(agg_regrid, '_TRANSFORM_CHUNK_SIZE', 22):
+            with mock.patch.object(agg_regrid, 'ThreadPoolExecutor') as tpe:
+                self.check(workers=1)
+        tpe.assert_not_called()
+
+    def test_chunk_smaller_than_row(self):
+        with mock.patch.object(agg_regrid, '_TRANSFORM_CHUNK_SIZE', 1):
+            self.check(workers=2)
+
+    def test_error(self):
+        with mock.patch.object(agg_regrid, '_TRANSFORM_CHUNK_SIZE', 22):
+            with mock.patch.object(self.to_crs, 'transform_points',
+                                   side_effect=ValueError('failed')):
+                with self.assertRaisesRegex(ValueError, 'failed'):
+                    self.check(workers=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
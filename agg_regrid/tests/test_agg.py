@@ -16,12 +16,13 @@
 # along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
 """Unit tests for the `agg_regrid.agg` function."""
 
+import threading
 import numpy as np
 import numpy.ma as ma
-from numpy.testing import assert_array_equal
+from numpy.testing import assert_array_almost_equal, assert_array_equal
 import unittest
 
-from agg_regrid import agg, DEFAULT_BUFFER_DEPTH
+from agg_regrid import agg, BuildCancelled, DEFAULT_BUFFER_DEPTH, Progress
 
 
 class TestDimensionality(unittest.TestCase):
@@ -250,6 +251,17 @@ class TestRegridDepth(unittest.TestCase):
             result = agg(*self.args, depth=depth)
             assert_array_equal(result, self._expected(depth))
 
+    def test_pixel_format_float(self):
+        # The float coverage is exact for any depth.
+        for depth in [2**i for i in range(4)]:
+            result = agg(*self.args, depth=depth, pixel_format='float')
+            assert_array_almost_equal(result, self._expected(2))
+
+    def test_bad_pixel_format(self):
+        emsg = 'Invalid pixel format'
+        with self.assertRaisesRegex(ValueError, emsg):
+            agg(*self.args, depth=1, pixel_format='gray16')
+
 
 class TestRegridSingleLevel(unittest.TestCase):
     def setUp(self):
@@ -427,5 +439,158 @@ class TestRegridSingleLevel(unittest.TestCase):
                 self.gx_bounds, self.gy_bounds, self.depth)
 
 
+class TestRegridPartialOverlap(unittest.TestCase):
+    def setUp(self):
+        # Source has points shape (y:4, x:4) of unit grid cells.
+        self.data = np.arange(16, dtype=np.float64).reshape(4, 4)
+        self.s_points = np.arange(4) + 0.5
+        self.s_bounds = np.arange(5.)
+        # Target grid has points shape (y:1, x:2). The first grid cell
+        # straddles the left edge of the source grid with a third of its
+        # area covered, and the second has two thirds of its area covered.
+        self.gx_bounds = np.array([[-1.5, 1.5, 3.5]] * 2)
+        self.gy_bounds = np.array([[-1.] * 3, [2.] * 3])
+
+    def _agg(self, min_coverage):
+        return agg(self.data, self.s_points, self.s_bounds,
+                   self.s_points, self.s_bounds, 1, 0,
+                   self.gx_bounds, self.gy_bounds, 1,
+                   pixel_format='float', min_coverage=min_coverage)
+
+    def test_default(self):
+        result = self._agg(None)
+        assert_array_equal(result.mask, [[True, True]])
+
+    def test_clipped(self):
+        result = self._agg(0)
+        # The mean of the overlapped source grid cells, with the half
+        # covered source grid cells weighted by a half.
+        expected = [[(0 + 4 + 0.5 * (1 + 5)) / 3,
+                     (0.5 * (1 + 5) + 2 + 6 + 0.5 * (3 + 7)) / 4]]
+        assert_array_almost_equal(result, expected)
+        self.assertFalse(ma.is_masked(result))
+
+    def test_min_coverage(self):
+        result = self._agg(0.5)
+        assert_array_equal(result.mask, [[True, False]])
+        self.assertAlmostEqual(result[0, 1], 4)
+
+    def test_outside(self):
+        self.gx_bounds = self.gx_bounds + 10
+        result = self._agg(0)
+        assert_array_equal(result.mask, [[True, True]])
+
+    def test_bad_min_coverage(self):
+        emsg = 'Expected a minimum coverage between 0 and 1'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self._agg(1.5)
+
+
+class TestRegridTargetCells(unittest.TestCase):
+    def setUp(self):
+        self.data = np.arange(48, dtype=np.float64).reshape(6, 8)
+        self.sx_points = np.arange(8) + 0.5
+        self.sx_bounds = np.arange(9.)
+        self.sy_points = np.arange(6) + 0.5
+        self.sy_bounds = np.arange(7.)
+        self.gx_bounds, self.gy_bounds = np.meshgrid([1.5, 4.0, 6.5],
+                                                     [1.5, 3.0, 4.5])
+
+    def _agg(self, tgt_cells=None):
+        return agg(self.data, self.sx_points, self.sx_bounds,
+                   self.sy_points, self.sy_bounds, 1, 0,
+                   self.gx_bounds, self.gy_bounds, 1, tgt_cells=tgt_cells)
+
+    def test_mask(self):
+        expected = ma.asarray(self._agg())
+        tgt_cells = np.array([[True, False], [False, True]])
+        result = self._agg(tgt_cells)
+        expected[~tgt_cells] = ma.masked
+        assert_array_equal(result, expected)
+        assert_array_equal(result.mask, ~tgt_cells)
+
+    def test_indices(self):
+        expected = ma.asarray(self._agg())
+        result = self._agg([3, 1, 3])
+        expected[0, 0] = expected[1, 0] = ma.masked
+        assert_array_equal(result, expected)
+        assert_array_equal(result.mask, [[True, False], [True, False]])
+
+    def test_none(self):
+        result = self._agg([])
+        self.assertTrue(result.mask.all())
+
+    def test_bad_mask_shape(self):
+        emsg = 'Expected target cells with the shape of the target grid'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self._agg(np.ones((2, 3), dtype=bool))
+
+    def test_bad_indices(self):
+        emsg = 'Expected target cell indices within the range 0-3'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self._agg([0, 4])
+
+
+class TestRegridProgress(unittest.TestCase):
+    def setUp(self):
+        self.data = np.arange(48, dtype=np.float64).reshape(6, 8)
+        self.sx_points = np.arange(8) + 0.5
+        self.sx_bounds = np.arange(9.)
+        self.sy_points = np.arange(6) + 0.5
+        self.sy_bounds = np.arange(7.)
+        self.gx_bounds, self.gy_bounds = np.meshgrid([1.5, 4.0, 6.5],
+                                                     [1.5, 3.0, 4.5])
+        self.reports = []
+
+    def _agg(self, tgt_cells=None, progress=None, cancel=None):
+        return agg(self.data, self.sx_points, self.sx_bounds,
+                   self.sy_points, self.sy_bounds, 1, 0,
+                   self.gx_bounds, self.gy_bounds, 1, tgt_cells=tgt_cells,
+                   progress=progress, cancel=cancel)
+
+    def test_progress(self):
+        result = self._agg(progress=self.reports.append)
+        assert_array_equal(result, self._agg())
+        self.assertEqual([report[:2] for report in self.reports],
+                         [(0, 4), (2, 4), (4, 4)])
+        for report in self.reports:
+            self.assertIsInstance(report, Progress)
+            self.assertGreaterEqual(report.elapsed, 0)
+
+    def test_progress_tgt_cells(self):
+        self._agg(tgt_cells=[1, 3], progress=self.reports.append)
+        self.assertEqual([report[:2] for report in self.reports],
+                         [(0, 2), (1, 2), (2, 2)])
+
+    def test_rate(self):
+        report = Progress(50, 200, 2.)
+        self.assertEqual(report.rate, 25)
+        self.assertEqual(report.remaining, 6)
+        self.assertIsNone(Progress(0, 200, 0.).remaining)
+
+    def test_cancelled(self):
+        cancel = threading.Event()
+        cancel.set()
+        emsg = 'cancelled after 0 of 4 target grid cells'
+        with self.assertRaisesRegex(BuildCancelled, emsg):
+            self._agg(cancel=cancel)
+
+    def test_cancelled_between_row_bands(self):
+        cancel = threading.Event()
+
+        def progress(report):
+            self.reports.append(report)
+            cancel.set()
+
+        emsg = 'cancelled after 2 of 4 target grid cells'
+        with self.assertRaisesRegex(BuildCancelled, emsg):
+            self._agg(progress=progress, cancel=cancel)
+        self.assertEqual(len(self.reports), 1)
+
+    def test_not_cancelled(self):
+        cancel = threading.Event()
+        assert_array_equal(self._agg(cancel=cancel), self._agg())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.calibration` module."""
+
+import numpy as np
+from numpy.testing import assert_array_almost_equal
+import unittest
+from unittest import mock
+
+from agg_regrid import agg_weights, engines
+from agg_regrid.calibration import (calibrate, Calibration, cheapest, report,
+                                    synthetic_grids)
+from agg_regrid.engines import exact_weights
+
+
+class Test_calibrate(unittest.TestCase):
+    def setUp(self):
+        self.grids = synthetic_grids(src_shape=(10, 12), tgt_shape=(6, 7))
+
+    def test_synthetic_grids(self):
+        sx_bounds, sy_bounds, gx_bounds, gy_bounds = self.grids
+        self.assertEqual(gx_bounds.shape, (7, 8))
+        self.assertTrue(sx_bounds[0] < gx_bounds.min())
+        self.assertTrue(gx_bounds.max() < sx_bounds[-1])
+        self.assertTrue(sy_bounds[0] < gy_bounds.min())
+        self.assertTrue(gy_bounds.max() < sy_bounds[-1])
+
+    def test_settings(self):
+        settings = [dict(depth=1), dict(depth=16, pixel_format='float')]
+        result = calibrate(*self.grids, settings=settings)
+        self.assertEqual([c.setting for c in result], settings)
+        low, high = result
+        self.assertTrue(high.max_error < low.max_error)
+        self.assertTrue(high.conservation_error < low.conservation_error)
+        self.assertTrue(high.max_error < 1e-3)
+        self.assertTrue(high.mean_error <= high.max_error)
+
+    def test_engines(self):
+        settings = [dict(engine='agg', depth=16, pixel_format='float'),
+                    dict(engine='exact')]
+        with mock.patch('agg_regrid.calibration.build_weights',
+                        side_effect=engines.build_weights) as mocker:
+            result = calibrate(*self.grids, settings=settings)
+        self.assertEqual([c.setting for c in result], settings)
+        self.assertEqual([call[0][0] for call in mocker.call_args_list],
+                         ['agg', 'exact'])
+        self.assertEqual(result[1].max_error, 0)
+
+    def test_default_settings(self):
+        result = calibrate(*self.grids)
+        engine_names = [c.setting.get('engine', 'agg') for c in result]
+        self.assertEqual(engine_names.count('agg'), 10)
+        self.assertNotIn('separable', engine_names)
+        self.assertEqual(engine_names[-1], 'exact')
+
+    def test_separable(self):
+        sx_bounds, sy_bounds = self.grids[:2]
+        gx_bounds, gy_bounds = np.meshgrid(np.linspace(-5, 5, 8),
+                                           np.linspace(-4, 4, 6))
+        result = calibrate(sx_bounds, sy_bounds, gx_bounds, gy_bounds)
+        separable, = [c for c in result
+                      if c.setting.get('engine') == 'separable']
+        self.assertLess(separable.max_error, 1e-12)
+
+    def test_exact(self):
+        sx_bounds, sy_bounds, gx_bounds, gy_bounds = self.grids
+        reference = exact_weights(*self.grids)
+        sx_points = (sx_bounds[:-1] + sx_bounds[1:]) / 2
+        sy_points = (sy_bounds[:-1] + sy_bounds[1:]) / 2
+        weights = agg_weights(sx_points, sx_bounds, sy_points, sy_bounds,
+                              gx_bounds, gy_bounds, 16, pixel_format='float')
+        assert_array_almost_equal(weights.wsum, reference.wsum, decimal=3)
+
+
+class Test_cheapest(unittest.TestCase):
+    def setUp(self):
+        self.calibrations = [Calibration({'depth': 1}, 0.1, 0.01, 0.1, 1.0),
+                             Calibration({'depth': 2}, 0.01, 0.001, 0.1, 2.0),
+                             Calibration({'depth': 4}, 0.001, 0.0, 0.1, 4.0)]
+
+    def test_cheapest(self):
+        result = cheapest(self.calibrations, 0.05)
+        self.assertEqual(result.setting, {'depth': 2})
+
+    def test_none(self):
+        self.assertIsNone(cheapest(self.calibrations, 1e-6))
+
+    def test_report(self):
+        lines = report(self.calibrations).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[2].startswith('depth=1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
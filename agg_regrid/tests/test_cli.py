@@ -0,0 +1,167 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.cli` module."""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import iris
+import iris.cube
+import numpy as np
+from numpy.testing import assert_array_almost_equal
+
+from agg_regrid import AreaWeighted
+from agg_regrid.cli import main, regrid_files, Summary
+from agg_regrid.tests import grid_cube
+
+
+def _cube(xs, ys, name='air_temperature', nz=None):
+    return grid_cube(xs, ys, nz=nz, level=nz is not None, long_name=name,
+                     units='K')
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.output_dir = os.path.join(self.tmpdir, 'output')
+        os.mkdir(self.output_dir)
+        self.target = _cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.target_file = self.save([self.target], 'target.nc')
+        src1 = _cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5), 'a', nz=2)
+        src2 = _cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5), 'b')
+        src3 = _cube(np.linspace(0, 10, 11), np.linspace(0, 8, 9), 'c')
+        self.sources = [src1, src2, src3]
+        self.inputs = [self.save([src1, src2], 'one.nc'),
+                       self.save([src3], 'two.nc')]
+
+    def save(self, cubes, filename):
+        filename = os.path.join(self.tmpdir, filename)
+        iris.save(cubes, filename)
+        return filename
+
+    def check_outputs(self):
+        for src in self.sources:
+            filename = 'one.nc' if src.name() in 'ab' else 'two.nc'
+            result = iris.load_cube(os.path.join(self.output_dir, filename),
+                                    src.name())
+            expected = src.regrid(self.target, AreaWeighted())
+            assert_array_almost_equal(result.data, expected.data)
+            self.assertEqual(result.coord('longitude').shape, (4,))
+
+    def test_regrid_files(self):
+        summary = regrid_files(self.inputs, self.target, self.output_dir)
+        self.assertIsInstance(summary, Summary)
+        self.assertEqual(summary.files, 2)
+        self.assertEqual(summary.cubes, 3)
+        self.assertEqual(summary.skipped, 0)
+        # One regridder for each distinct source grid.
+        self.assertEqual(summary.regridders, 2)
+        self.assertEqual(list(summary.times),
+                         ['load', 'build', 'regrid', 'save'])
+        self.check_outputs()
+
+    def test_workers_and_chunk_size(self):
+        summary = regrid_files(self.inputs, self.target, self.output_dir,
+                               workers=3, chunk_size=2)
+        self.assertEqual(summary.cubes, 3)
+        self.check_outputs()
+
+    def test_skipped(self):
+        cube = iris.cube.Cube(np.arange(3.), long_name='no_grid')
+        filename = self.save([cube] + self.sources[1:2], 'three.nc')
+        log = io.StringIO()
+        summary = regrid_files([filename], self.target, self.output_dir,
+                               log=log)
+        self.assertEqual(summary.cubes, 1)
+        self.assertEqual(summary.skipped, 1)
+        self.assertIn("skipping cube 'no_grid'", log.getvalue())
+
+    def test_engine(self):
+        summary = regrid_files(self.inputs, self.target, self.output_dir,
+                               engine='separable')
+        self.assertEqual(summary.cubes, 3)
+        for src in self.sources:
+            filename = 'one.nc' if src.name() in 'ab' else 'two.nc'
+            result = iris.load_cube(os.path.join(self.output_dir, filename),
+                                    src.name())
+            scheme = AreaWeighted(engine='separable')
+            expected = src.regrid(self.target, scheme)
+            assert_array_almost_equal(result.data, expected.data)
+
+    def test_bad_engine(self):
+        emsg = 'Invalid engine'
+        with self.assertRaisesRegex(ValueError, emsg):
+            regrid_files(self.inputs, self.target, self.output_dir,
+                         engine='bad')
+
+    def test_bad_workers(self):
+        emsg = 'at least one worker'
+        with self.assertRaisesRegex(ValueError, emsg):
+            regrid_files(self.inputs, self.target, self.output_dir,
+                         workers=0)
+
+    def test_bad_chunk_size(self):
+        emsg = 'chunk size of at least one'
+        with self.assertRaisesRegex(ValueError, emsg):
+            regrid_files(self.inputs, self.target, self.output_dir,
+                         chunk_size=0)
+
+    def test_overwrite_input(self):
+        emsg = 'Cannot overwrite the input file'
+        with self.assertRaisesRegex(ValueError, emsg):
+            regrid_files(self.inputs, self.target, self.tmpdir)
+
+    def test_main(self):
+        stdout = io.StringIO()
+        argv = ['-t', self.target_file, '-o', self.output_dir, '-d', '4',
+                '--pixel-format', 'float', '-w', '2'] + self.inputs
+        with contextlib.redirect_stdout(stdout):
+            main(argv)
+        report = stdout.getvalue()
+        self.assertIn('Regridded 3 cubes from 2 files with 2 regridders',
+                      report)
+        self.assertIn('Throughput', report)
+        for src in self.sources:
+            filename = 'one.nc' if src.name() in 'ab' else 'two.nc'
+            result = iris.load_cube(os.path.join(self.output_dir, filename),
+                                    src.name())
+            scheme = AreaWeighted(buffer_depth=4, pixel_format='float')
+            expected = src.regrid(self.target, scheme)
+            assert_array_almost_equal(result.data, expected.data)
+
+    def test_main_quiet(self):
+        stdout = io.StringIO()
+        argv = ['-q', '-t', self.target_file, '-o', self.output_dir]
+        with contextlib.redirect_stdout(stdout):
+            main(argv + self.inputs)
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test_main_missing_output_dir(self):
+        argv = ['-t', self.target_file, '-o',
+                os.path.join(self.tmpdir, 'missing')] + self.inputs
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main(argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.core` module."""
+
+import subprocess
+import sys
+import unittest
+
+import agg_regrid
+import agg_regrid.core
+
+
+class Test(unittest.TestCase):
+    def modules(self, module):
+        # Import the module in a clean interpreter, and report whether
+        # iris or cartopy were also imported.
+        code = 'import sys, {}; ' \
+            'print(any(name.split(".")[0] in ("iris", "cartopy") ' \
+            'for name in sys.modules))'.format(module)
+        output = subprocess.check_output([sys.executable, '-c', code])
+        return output.decode().strip()
+
+    def test_core_iris_free(self):
+        self.assertEqual(self.modules('agg_regrid.core'), 'False')
+
+    def test_package_iris_free(self):
+        self.assertEqual(self.modules('agg_regrid'), 'False')
+
+    def test_calibration_iris_free(self):
+        self.assertEqual(self.modules('agg_regrid.calibration'), 'False')
+
+    def test_reexport(self):
+        for name in ('agg', 'agg_weights', 'Weights', 'DEFAULT_BUFFER_DEPTH',
+                     'DEFAULT_PIXEL_FORMAT'):
+            self.assertIs(getattr(agg_regrid, name),
+                          getattr(agg_regrid.core, name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.engines` module."""
+
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from agg_regrid import BuildCancelled, engines
+from agg_regrid.calibration import synthetic_grids
+from agg_regrid.engines import (build_weights, engine_names, exact_weights,
+                                GridProperties, grid_properties,
+                                register_engine, select_engine,
+                                separable_weights)
+
+
+def _points(bounds):
+    return (bounds[:-1] + bounds[1:]) / 2
+
+
+def _dense(weights):
+    # The dense (target, source) weights matrix.
+    result = np.zeros((weights.wsum.size, np.prod(weights.src_shape)))
+    result[weights.rows, weights.indices] = weights.data
+    return result
+
+
+class Test_register_engine(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(engines._ENGINES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.builder = mock.Mock(return_value=mock.sentinel.weights)
+
+    def test_builtin(self):
+        self.assertEqual(engine_names(),
+                         ['agg', 'separable', 'exact', 'auto'])
+
+    def test_register(self):
+        register_engine('mine', self.builder)
+        self.assertEqual(engine_names()[-2:], ['mine', 'auto'])
+        result = build_weights('mine', 1, 2, 3, 4, 5, 6, 7)
+        self.assertIs(result, mock.sentinel.weights)
+        expected = [mock.call(1, 2, 3, 4, 5, 6, 7, pixel_format=None,
+                              min_coverage=None)]
+        self.assertEqual(self.builder.mock_calls, expected)
+
+    def test_tgt_cells(self):
+        register_engine('mine', self.builder)
+        build_weights('mine', 1, 2, 3, 4, 5, 6, 7, tgt_cells=[0])
+        expected = [mock.call(1, 2, 3, 4, 5, 6, 7, pixel_format=None,
+                              min_coverage=None, tgt_cells=[0])]
+        self.assertEqual(self.builder.mock_calls, expected)
+
+    def test_progress_and_cancel(self):
+        register_engine('mine', self.builder)
+        build_weights('mine', 1, 2, 3, 4, 5, 6, 7,
+                      progress=mock.sentinel.progress,
+                      cancel=mock.sentinel.cancel)
+        expected = [mock.call(1, 2, 3, 4, 5, 6, 7, pixel_format=None,
+                              min_coverage=None,
+                              progress=mock.sentinel.progress,
+                              cancel=mock.sentinel.cancel)]
+        self.assertEqual(self.builder.mock_calls, expected)
+
+    def test_duplicate(self):
+        emsg = "engine 'agg' is already registered"
+        with self.assertRaisesRegex(ValueError, emsg):
+            register_engine('agg', self.builder)
+
+    def test_replace(self):
+        register_engine('agg', self.builder, replace=True)
+        self.assertIs(build_weights('agg', 1, 2, 3, 4, 5, 6, 7),
+                      mock.sentinel.weights)
+
+    def test_auto(self):
+        emsg = "Cannot register an engine named 'auto'"
+        with self.assertRaisesRegex(ValueError, emsg):
+            register_engine('auto', self.builder)
+
+    def test_bad_engine(self):
+        emsg = 'Invalid engine'
+        with self.assertRaisesRegex(ValueError, emsg):
+            build_weights('bad', 1, 2, 3, 4, 5, 6, 7)
+
+
+class Test_select_engine(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(engines._ENGINES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def properties(self, rectilinear=False, window=4.):
+        return GridProperties(rectilinear, 100, window, 8, 'gray8')
+
+    def test_rectilinear(self):
+        properties = self.properties(rectilinear=True)
+        self.assertEqual(select_engine(properties), 'separable')
+
+    def test_small_window(self):
+        self.assertEqual(select_engine(self.properties()), 'agg')
+
+    def test_large_window(self):
+        properties = self.properties(window=1000.)
+        self.assertEqual(select_engine(properties), 'exact')
+
+    def test_third_party(self):
+        register_engine('mine', None, cost=lambda properties: 0)
+        self.assertEqual(select_engine(self.properties()), 'mine')
+
+    def test_third_party_invalid(self):
+        register_engine('mine', None, valid=lambda properties: False,
+                        cost=lambda properties: 0)
+        self.assertEqual(select_engine(self.properties()), 'agg')
+
+    def test_third_party_without_cost(self):
+        register_engine('mine', None)
+        self.assertEqual(select_engine(self.properties()), 'agg')
+
+    def test_none(self):
+        engines._ENGINES.clear()
+        emsg = 'No registered engine supports the grids'
+        with self.assertRaisesRegex(ValueError, emsg):
+            select_engine(self.properties())
+
+
+class Test_grid_properties(unittest.TestCase):
+    def test_rectilinear(self):
+        bounds = np.arange(9.)
+        gx_bounds, gy_bounds = np.meshgrid([0.5, 2.5, 4.5], [1., 5.])
+        result = grid_properties(bounds, bounds, gx_bounds, gy_bounds, 8)
+        self.assertEqual(result, GridProperties(True, 2, 12., 8, 'gray8'))
+
+    def test_rotated(self):
+        result = grid_properties(*synthetic_grids(), depth=2,
+                                 pixel_format='float')
+        self.assertFalse(result.rectilinear)
+        self.assertEqual(result.cells, 30 * 45)
+        self.assertEqual((result.depth, result.pixel_format), (2, 'float'))
+
+    def test_auto(self):
+        sx_bounds, sy_bounds, gx_bounds, gy_bounds = synthetic_grids()
+        args = (_points(sx_bounds), sx_bounds, _points(sy_bounds), sy_bounds,
+                gx_bounds, gy_bounds, 8)
+        result = build_weights('auto', *args)
+        expected = build_weights('agg', *args)
+        assert_array_equal(result.data, expected.data)
+
+
+class Test_separable_weights(unittest.TestCase):
+    def setUp(self):
+        self.s_bounds = np.arange(11.) * 0.5 - 1
+        self.s_points = _points(self.s_bounds)
+        self.gx_bounds, self.gy_bounds = np.meshgrid(
+            np.linspace(-2, 4.2, 8), np.linspace(-1.7, 3, 6))
+
+    def weights(self, func, min_coverage, tgt_cells=None):
+        if func is exact_weights:
+            return exact_weights(self.s_bounds, self.s_bounds,
+                                 self.gx_bounds, self.gy_bounds,
+                                 min_coverage=min_coverage,
+                                 tgt_cells=tgt_cells)
+        return func(self.s_points, self.s_bounds, self.s_points,
+                    self.s_bounds, self.gx_bounds, self.gy_bounds, 1,
+                    min_coverage=min_coverage, tgt_cells=tgt_cells)
+
+    def check(self, min_coverage, tgt_cells=None):
+        result = self.weights(separable_weights, min_coverage, tgt_cells)
+        expected = self.weights(exact_weights, min_coverage, tgt_cells)
+        assert_array_equal(result.indptr, expected.indptr)
+        assert_array_almost_equal(_dense(result), _dense(expected))
+        assert_array_almost_equal(result.wsum, expected.wsum)
+        assert_array_almost_equal(result.coverage, expected.coverage)
+
+    def test_inside(self):
+        self.check(None)
+
+    def test_clipped(self):
+        self.check(0)
+
+    def test_min_coverage(self):
+        self.check(0.5)
+
+    def test_tgt_cells(self):
+        tgt_cells = np.zeros((5, 7), dtype=bool)
+        tgt_cells[1:4, 2:5] = True
+        self.check(0, tgt_cells)
+        result = self.weights(separable_weights, 0, tgt_cells)
+        assert_array_equal(result.tgt_mask, ~tgt_cells)
+
+    def test_progress(self):
+        progress = mock.Mock()
+        separable_weights(self.s_points, self.s_bounds, self.s_points,
+                          self.s_bounds, self.gx_bounds, self.gy_bounds,
+                          progress=progress)
+        dones = [args[0][:2] for args, _ in progress.call_args_list]
+        self.assertEqual(dones, [(0, 35), (35, 35)])
+
+    def test_cancelled(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(BuildCancelled):
+            separable_weights(self.s_points, self.s_bounds, self.s_points,
+                              self.s_bounds, self.gx_bounds, self.gy_bounds,
+                              cancel=cancel)
+
+    def test_exact_engine_cancelled(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(BuildCancelled):
+            build_weights('exact', self.s_points, self.s_bounds,
+                          self.s_points, self.s_bounds, self.gx_bounds,
+                          self.gy_bounds, 1, min_coverage=0, cancel=cancel)
+
+    def test_not_rectilinear(self):
+        self.gx_bounds[0, 0] += 0.1
+        emsg = 'requires a rectilinear target grid'
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.weights(separable_weights, None)
+
+
+class Test_exact_weights(unittest.TestCase):
+    def setUp(self):
+        # Source has bounds shape (y:6, x:8)
+        self.sx_bounds = np.arange(9, dtype=np.float64)
+        self.sy_bounds = np.arange(7, dtype=np.float64)
+
+    def test_inset_by_half_cell(self):
+        gx_bounds, gy_bounds = np.meshgrid([0.5, 7.5], [0.5, 5.5])
+        weights = exact_weights(self.sx_bounds, self.sy_bounds,
+                                gx_bounds, gy_bounds)
+        expected = np.ones((6, 8))
+        expected[0, :] = expected[-1, :] = 0.5
+        expected[:, 0] = expected[:, -1] = 0.5
+        expected[0, 0] = expected[0, -1] = 0.25
+        expected[-1, 0] = expected[-1, -1] = 0.25
+        assert_array_almost_equal(weights.data.reshape(6, 8), expected)
+        self.assertAlmostEqual(weights.wsum[0], 35.0)
+
+    def test_rotated(self):
+        gx_bounds = np.array([[1.5, 4.5],
+                              [3.5, 6.5]])
+        gy_bounds = np.array([[3.5, 0.5],
+                              [5.5, 2.5]])
+        weights = exact_weights(self.sx_bounds, self.sy_bounds,
+                                gx_bounds, gy_bounds)
+        self.assertAlmostEqual(weights.wsum[0], 12.0)
+
+    def test_out_of_bounds(self):
+        gx_bounds, gy_bounds = np.meshgrid([-0.5, 2.5, 4.0], [0.5, 5.5])
+        weights = exact_weights(self.sx_bounds, self.sy_bounds,
+                                gx_bounds, gy_bounds)
+        self.assertEqual(weights.wsum[0], 0)
+        self.assertAlmostEqual(weights.wsum[1], 7.5)
+
+    def test_min_coverage(self):
+        gx_bounds, gy_bounds = np.meshgrid([-0.5, 2.5, 4.0], [0.5, 5.5])
+        weights = exact_weights(self.sx_bounds, self.sy_bounds,
+                                gx_bounds, gy_bounds, min_coverage=0.9)
+        self.assertAlmostEqual(weights.wsum[0], 12.5)
+        assert_array_almost_equal(weights.coverage, [[12.5 / 15, 1]])
+        self.assertEqual(weights.tgt_mask.tolist(), [[True, False]])
+        weights = exact_weights(self.sx_bounds, self.sy_bounds,
+                                gx_bounds, gy_bounds, min_coverage=0)
+        self.assertEqual(weights.tgt_mask.tolist(), [[False, False]])
+
+    def test_irregular_src_grid(self):
+        sx_bounds = self.sx_bounds ** 2
+        sx_points = (sx_bounds[:-1] + sx_bounds[1:]) / 2
+        sy_points = (self.sy_bounds[:-1] + self.sy_bounds[1:]) / 2
+        gx_bounds, gy_bounds = np.meshgrid([0.5, 7.5], [0.5, 5.5])
+        emsg = 'Expected src x-coordinate points to be regular'
+        for engine in ('agg', 'separable', 'exact'):
+            with self.subTest(engine=engine), \
+                    self.assertRaisesRegex(ValueError, emsg):
+                build_weights(engine, sx_points, sx_bounds, sy_points,
+                              self.sy_bounds, gx_bounds, gy_bounds, 8)
+
+    def test_spherical_min_coverage(self):
+        gx_bounds, gy_bounds = np.meshgrid([0.5, 7.5], [0.5, 5.5])
+        emsg = 'not supported for spherical weights'
+        with self.assertRaisesRegex(ValueError, emsg):
+            exact_weights(self.sx_bounds, self.sy_bounds,
+                          gx_bounds, gy_bounds, spherical=True,
+                          min_coverage=0)
+
+    def test_spherical(self):
+        sx_bounds = np.array([0.0, 5.0, 10.0])
+        sy_bounds = np.array([60.0, 65.0, 70.0])
+        gx_bounds, gy_bounds = np.meshgrid([0.0, 10.0], [60.0, 70.0])
+        weights = exact_weights(sx_bounds, sy_bounds, gx_bounds, gy_bounds,
+                                spherical=True)
+        assert_array_almost_equal(weights.data, np.ones(4))
+
+
+if __name__ == '__main__':
+    unittest.main()
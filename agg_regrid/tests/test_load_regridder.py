@@ -0,0 +1,88 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.load_regridder` function."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import netCDF4
+import numpy as np
+from numpy.testing import assert_array_almost_equal
+
+from agg_regrid import _AreaWeightedRegridder as Regridder, load_regridder
+from agg_regrid.tests import grid_cube
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, 'weights.nc')
+        self.src = grid_cube(np.linspace(0, 10, 6), np.linspace(0, 8, 5))
+        self.tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 3))
+        self.regridder = Regridder(self.src, self.tgt)
+        self.regridder.save_weights(self.filename)
+
+    def test_round_trip(self):
+        with mock.patch('agg_regrid.build_weights') as mocker:
+            regridder = load_regridder(self.filename, self.src, self.tgt)
+            result = regridder(self.src)
+        self.assertEqual(mocker.call_count, 0)
+        expected = self.regridder(self.src)
+        assert_array_almost_equal(result.data, expected.data)
+        self.assertEqual(result.coord('longitude'),
+                         expected.coord('longitude'))
+
+    def test_kwargs(self):
+        regridder = load_regridder(self.filename, self.src, self.tgt,
+                                   strict_grid=True)
+        self.assertTrue(regridder.strict_grid)
+
+    def test_no_frac_b(self):
+        # Copy the weights file without the target grid cell area fractions.
+        filename = os.path.join(self.tmpdir, 'external.nc')
+        with netCDF4.Dataset(self.filename) as source, \
+                netCDF4.Dataset(filename, 'w') as dataset:
+            for name, dimension in source.dimensions.items():
+                dataset.createDimension(name, len(dimension))
+            for name, variable in source.variables.items():
+                if name != 'frac_b':
+                    dataset.createVariable(name, variable.dtype,
+                                           variable.dimensions)[:] = \
+                        variable[:]
+        regridder = load_regridder(filename, self.src, self.tgt)
+        result = regridder(self.src)
+        assert_array_almost_equal(result.data, self.regridder(self.src).data)
+        emsg = 'no target grid cell areas'
+        with self.assertRaisesRegex(ValueError, emsg):
+            regridder.coverage()
+        with self.assertRaisesRegex(ValueError, emsg):
+            regridder(self.src, coverage=True)
+
+    def test_grid_mismatch(self):
+        emsg = 'is for a source grid \\(5, 6\\) and target grid \\(3, 4\\), ' \
+            'got \\(5, 6\\) and \\(2, 4\\)'
+        tgt = grid_cube(np.linspace(2, 8, 4), np.linspace(2, 6, 2))
+        with self.assertRaisesRegex(ValueError, emsg):
+            load_regridder(self.filename, self.src, tgt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.scrip` module."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import warnings
+
+import netCDF4
+import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from agg_regrid import agg_weights, load_weights, save_weights
+from agg_regrid.calibration import synthetic_grids
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, 'weights.nc')
+        sx_bounds, sy_bounds, gx_bounds, gy_bounds = synthetic_grids(
+            src_shape=(10, 12), tgt_shape=(6, 7), margin=-1)
+        self.weights = agg_weights((sx_bounds[:-1] + sx_bounds[1:]) / 2,
+                                   sx_bounds,
+                                   (sy_bounds[:-1] + sy_bounds[1:]) / 2,
+                                   sy_bounds, gx_bounds, gy_bounds, 4,
+                                   min_coverage=0)
+        self.data = np.random.RandomState(0).rand(2, 10, 12)
+
+    def write(self, rows, cols, S, src_dims=(3, 2), dst_dims=(2, 1),
+              names=('row', 'col', 'S')):
+        # Write an ESMF weights file in the netCDF4 format.
+        with netCDF4.Dataset(self.filename, 'w') as dataset:
+            dataset.createDimension('n_s', len(S))
+            dataset.createDimension('src_grid_rank', len(src_dims))
+            dataset.createDimension('dst_grid_rank', len(dst_dims))
+            for name, values in zip(names, (rows, cols, S)):
+                dtype = 'f8' if name == 'S' else 'i4'
+                dataset.createVariable(name, dtype, ('n_s',))[:] = values
+            dataset.createVariable('src_grid_dims', 'i4',
+                                   ('src_grid_rank',))[:] = src_dims
+            dataset.createVariable('dst_grid_dims', 'i4',
+                                   ('dst_grid_rank',))[:] = dst_dims
+
+    def test_round_trip(self):
+        save_weights(self.weights, self.filename)
+        with netCDF4.Dataset(self.filename) as dataset:
+            self.assertEqual(dataset.data_model, 'NETCDF3_64BIT_OFFSET')
+            assert_array_equal(dataset.variables['src_grid_dims'], [12, 10])
+            assert_array_equal(dataset.variables['dst_grid_dims'], [7, 6])
+        result = load_weights(self.filename)
+        self.assertEqual(result.src_shape, (10, 12))
+        self.assertEqual(result.tgt_shape, (6, 7))
+        assert_array_equal(result.indptr, self.weights.indptr)
+        assert_array_equal(result.indices, self.weights.indices)
+        assert_array_almost_equal(result.apply(self.data),
+                                  self.weights.apply(self.data))
+        assert_array_equal(result.tgt_mask, self.weights.tgt_mask)
+        assert_array_almost_equal(result.coverage, self.weights.coverage)
+
+    def test_normalised(self):
+        save_weights(self.weights, self.filename)
+        result = load_weights(self.filename)
+        rows = ~result.tgt_mask.ravel()
+        assert_array_almost_equal(result.wsum[rows], 1)
+
+    def test_external(self):
+        # Unsorted 1-based entries, with a target grid of (y:1, x:2) on a
+        # source grid of (y:2, x:3).
+        self.write(rows=[2, 1, 2], cols=[6, 1, 3], S=[0.25, 1, 0.75])
+        result = load_weights(self.filename)
+        self.assertEqual(result.src_shape, (2, 3))
+        self.assertEqual(result.tgt_shape, (1, 2))
+        assert_array_equal(result.indptr, [0, 1, 3])
+        assert_array_equal(result.indices, [0, 5, 2])
+        assert_array_equal(result.data, [1, 0.25, 0.75])
+        self.assertIsNone(result.coverage)
+        data = np.arange(6.).reshape(1, 2, 3)
+        assert_array_equal(result.apply(data), [[[0, 2.75]]])
+
+    def test_empty_cells(self):
+        self.write(rows=[3, 1, 3], cols=[6, 1, 3], S=[0.25, 1, 0.5],
+                   dst_dims=(4, 1))
+        result = load_weights(self.filename)
+        assert_array_equal(result.indptr, [0, 1, 1, 3, 3])
+        assert_array_equal(result.wsum, [1, 0, 0.75, 0])
+        assert_array_equal(result.tgt_mask, [[False, True, False, True]])
+
+    def test_memory_mapped(self):
+        save_weights(self.weights, self.filename)
+        with warnings.catch_warnings():
+            # The file is closed with no references to its mapped data.
+            warnings.simplefilter('error')
+            result = load_weights(self.filename)
+        self.assertTrue(result.indices.flags.owndata)
+        self.assertTrue(result.data.flags.owndata)
+
+    def test_scrip_names(self):
+        # The SCRIP names, with first and second order weights.
+        with netCDF4.Dataset(self.filename, 'w') as dataset:
+            dataset.createDimension('num_links', 3)
+            dataset.createDimension('num_wgts', 2)
+            dataset.createDimension('dst_grid_size', 2)
+            dataset.createDimension('grid_rank', 2)
+            dataset.createVariable('dst_address', 'i4',
+                                   ('num_links',))[:] = [2, 1, 2]
+            dataset.createVariable('src_address', 'i4',
+                                   ('num_links',))[:] = [6, 1, 3]
+            dataset.createVariable('remap_matrix', 'f8',
+                                   ('num_links', 'num_wgts'))[:] = \
+                [[0.25, 9], [1, 9], [0.75, 9]]
+            dataset.createVariable('dst_grid_frac', 'f8',
+                                   ('dst_grid_size',))[:] = [1, 0.5]
+            dataset.createVariable('src_grid_dims', 'i4',
+                                   ('grid_rank',))[:] = (3, 2)
+            dataset.createVariable('dst_grid_dims', 'i4',
+                                   ('grid_rank',))[:] = (2, 1)
+        result = load_weights(self.filename)
+        self.assertEqual(result.src_shape, (2, 3))
+        self.assertEqual(result.tgt_shape, (1, 2))
+        assert_array_equal(result.indptr, [0, 1, 3])
+        assert_array_equal(result.indices, [0, 5, 2])
+        assert_array_equal(result.data, [1, 0.25, 0.75])
+        assert_array_equal(result.coverage, [[1, 0.5]])
+
+    def test_missing_variable(self):
+        self.write(rows=[1], cols=[1], S=[1], names=('row', 'col', 'W'))
+        emsg = "has no 'S' variable"
+        with self.assertRaisesRegex(ValueError, emsg):
+            load_weights(self.filename)
+
+    def test_bad_rank(self):
+        self.write(rows=[1], cols=[1], S=[1], src_dims=(6,))
+        emsg = 'Expected 2d source and target grids'
+        with self.assertRaisesRegex(ValueError, emsg):
+            load_weights(self.filename)
+
+    def test_bad_indices(self):
+        self.write(rows=[1], cols=[7], S=[1])
+        emsg = 'has indices outside of the source grid'
+        with self.assertRaisesRegex(ValueError, emsg):
+            load_weights(self.filename)
+
+    def test_no_scipy(self):
+        save_weights(self.weights, self.filename)
+        with mock.patch.dict(sys.modules, {'scipy.io': None}):
+            result = load_weights(self.filename)
+            emsg = 'requires scipy'
+            with self.assertRaisesRegex(ImportError, emsg):
+                save_weights(self.weights, self.filename)
+        assert_array_equal(result.indices, self.weights.indices)
+        assert_array_almost_equal(result.coverage, self.weights.coverage)
+
+
+if __name__ == '__main__':
+    unittest.main()
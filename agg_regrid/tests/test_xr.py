@@ -0,0 +1,219 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""Unit tests for the `agg_regrid.xr` module."""
+
+import pickle
+import unittest
+
+import cartopy.crs as ccrs
+from iris.coord_systems import GeogCS, RotatedGeogCS
+from iris.coords import DimCoord
+import iris.cube
+import numpy as np
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from agg_regrid import agg, AreaWeighted
+
+try:
+    import dask.array
+    import xarray
+    from agg_regrid.xr import XarrayRegridder
+except ImportError:
+    xarray = None
+
+
+def _grid(x, y, name='tas', leading=0, x_name='lon', y_name='lat'):
+    shape = (leading,) * bool(leading) + (len(y), len(x))
+    dims = ('t',) * bool(leading) + (y_name, x_name)
+    data = np.arange(np.prod(shape), dtype=np.float64).reshape(shape)
+    coords = {y_name: (y_name, y, {'axis': 'Y'}),
+              x_name: (x_name, x, {'axis': 'X'})}
+    return xarray.DataArray(data, dims=dims, coords=coords, name=name)
+
+
+@unittest.skipIf(xarray is None, 'Test(s) require "xarray" and "dask".')
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.sx = np.arange(8) + 0.5
+        self.sy = np.arange(6) + 0.5
+        self.src = _grid(self.sx, self.sy, leading=2)
+        self.tgt = _grid([2.75, 5.25], [2.25, 3.75])
+        self.crs = ccrs.PlateCarree()
+        self.regridder = XarrayRegridder(self.src, self.tgt,
+                                         src_crs=self.crs, tgt_crs=self.crs)
+        self.expected = agg(self.src.values, self.sx, np.arange(9.),
+                            self.sy, np.arange(7.), 2, 1,
+                            *np.meshgrid([1.5, 4., 6.5], [1.5, 3., 4.5]),
+                            depth=8)
+
+    def test_regrid(self):
+        result = self.regridder(self.src)
+        self.assertEqual(result.dims, ('t', 'lat', 'lon'))
+        self.assertEqual(result.name, 'tas')
+        assert_array_equal(result.lon, self.tgt.lon)
+        assert_array_equal(result.lat, self.tgt.lat)
+        assert_array_almost_equal(result.values, self.expected)
+
+    def test_transposed(self):
+        result = self.regridder(self.src.transpose('lon', 't', 'lat'))
+        self.assertEqual(result.dims, ('lon', 't', 'lat'))
+        assert_array_almost_equal(result.transpose('t', 'lat', 'lon'),
+                                  self.expected)
+
+    def test_lazy(self):
+        src = self.src.chunk({'t': 1})
+        result = self.regridder(src)
+        self.assertIsInstance(result.data, dask.array.Array)
+        self.assertEqual(result.data.chunks, ((1, 1), (2,), (2,)))
+        assert_array_almost_equal(result.compute().values, self.expected)
+
+    def test_missing(self):
+        src = self.src.copy()
+        src[0, 1:3, 1:4] = np.nan
+        result = self.regridder(src)
+        self.assertTrue(np.isnan(result[0, 0, 0]))
+        assert_array_almost_equal(result[1], self.expected[1])
+
+    def test_decreasing(self):
+        src = self.src.isel(lat=slice(None, None, -1))
+        regridder = XarrayRegridder(src, self.tgt, src_crs=self.crs,
+                                    tgt_crs=self.crs)
+        assert_array_almost_equal(regridder(src).values, self.expected)
+
+    def test_uncovered(self):
+        # The last target grid cell extends beyond the source grid.
+        tgt = _grid([2.75, 5.25, 9.25], [2.25, 3.75])
+        regridder = XarrayRegridder(self.src, tgt, src_crs=self.crs,
+                                    tgt_crs=self.crs)
+        result = regridder(self.src)
+        self.assertTrue(np.isnan(result[:, :, 2]).all())
+        self.assertFalse(np.isnan(result[:, :, :2]).any())
+        assert_array_almost_equal(result[:, :, 0], self.expected[:, :, 0])
+
+    def test_dataset(self):
+        src = xarray.Dataset({'tas': self.src,
+                              'time': ('t', [1, 2]),
+                              'lat_bnds': (('lat', 'bnds'),
+                                           np.zeros((6, 2)))})
+        result = self.regridder(src)
+        self.assertEqual(set(result.data_vars), {'tas', 'time'})
+        assert_array_equal(result.time, [1, 2])
+        assert_array_almost_equal(result.tas.values, self.expected)
+
+    def test_bounds(self):
+        src = self.src.to_dataset()
+        src.lon.attrs['bounds'] = 'lon_bnds'
+        bounds = np.stack([np.arange(8.), np.arange(1., 9.)], axis=-1)
+        src['lon_bnds'] = (('lon', 'bnds'), bounds * 2)
+        regridder = XarrayRegridder(src, self.tgt, src_crs=self.crs,
+                                    tgt_crs=self.crs)
+        assert_array_equal(regridder._sx_bounds, np.arange(9.) * 2)
+
+    def test_grid_mapping(self):
+        src = self.src.assign_coords(
+            crs=((), 0, {'crs_wkt': self.crs.to_wkt()}))
+        src.attrs['grid_mapping'] = 'crs'
+        tgt = self.tgt.assign_coords(
+            spatial_ref=((), 0, {'crs_wkt': self.crs.to_wkt()}))
+        regridder = XarrayRegridder(src, tgt)
+        result = regridder(src)
+        self.assertNotIn('crs', result.coords)
+        self.assertIn('spatial_ref', result.coords)
+        self.assertEqual(result.attrs['grid_mapping'], 'spatial_ref')
+        assert_array_almost_equal(result.values, self.expected)
+
+    def test_cf_grid_mapping(self):
+        src = self.src.assign_coords(
+            crs=((), 0, {'grid_mapping_name': 'latitude_longitude'}))
+        src.attrs['grid_mapping'] = 'crs'
+        regridder = XarrayRegridder(src, self.tgt, tgt_crs='EPSG:4326')
+        assert_array_almost_equal(regridder(src).values, self.expected)
+
+    def test_cross_crs(self):
+        # Compare with the Iris regridder.
+        cs = GeogCS(6371229.)
+        rcs = RotatedGeogCS(37.5, 177.5, ellipsoid=cs)
+        sx, sy = np.linspace(-10, 10, 21), np.linspace(-8, 8, 17)
+        tx, ty = np.linspace(-3, 4, 5), np.linspace(45, 52, 4)
+        src = _grid(sx, sy, x_name='rlon', y_name='rlat')
+        tgt = _grid(tx, ty)
+        regridder = XarrayRegridder(src, tgt,
+                                    src_crs=rcs.as_cartopy_crs(),
+                                    tgt_crs=cs.as_cartopy_crs())
+        result = regridder(src)
+
+        def cube(data, x, y, cs, names):
+            cube = iris.cube.Cube(data)
+            for dim, (points, name) in enumerate(zip((y, x), names)):
+                coord = DimCoord(points, standard_name=name,
+                                 units='degrees', coord_system=cs)
+                coord.guess_bounds()
+                cube.add_dim_coord(coord, dim)
+            return cube
+
+        src_cube = cube(src.values, sx, sy, rcs,
+                        ('grid_latitude', 'grid_longitude'))
+        tgt_cube = cube(tgt.values, tx, ty, cs, ('latitude', 'longitude'))
+        expected = AreaWeighted().regridder(src_cube, tgt_cube)(src_cube)
+        assert_array_equal(result.values, expected.data.filled(np.nan))
+
+    def test_pickle(self):
+        regridder = pickle.loads(pickle.dumps(self.regridder))
+        assert_array_almost_equal(regridder(self.src).values, self.expected)
+
+    def test_share(self):
+        self.regridder.share()
+        self.addCleanup(self.regridder._weights._owner)
+        regridder = pickle.loads(pickle.dumps(self.regridder))
+        self.assertIsNotNone(regridder._weights._shared)
+        assert_array_almost_equal(regridder(self.src).values, self.expected)
+
+    def test_no_crs(self):
+        emsg = 'The source grid requires a coordinate reference system'
+        with self.assertRaisesRegex(ValueError, emsg):
+            XarrayRegridder(self.src, self.tgt, tgt_crs=self.crs)
+
+    def test_ambiguous_coord(self):
+        src = self.src.assign_coords(x=('lon', self.sx))
+        emsg = r"Expected one x-coordinate, got \['lon', 'x'\]"
+        with self.assertRaisesRegex(ValueError, emsg):
+            XarrayRegridder(src, self.tgt, src_crs=self.crs,
+                            tgt_crs=self.crs)
+        regridder = XarrayRegridder(src, self.tgt, x='lon',
+                                    src_crs=self.crs, tgt_crs=self.crs)
+        self.assertEqual(regridder.x, 'lon')
+
+    def test_bad_coord(self):
+        emsg = "Expected a 1d y-coordinate named 'bad'"
+        with self.assertRaisesRegex(ValueError, emsg):
+            XarrayRegridder(self.src, self.tgt, y='bad', src_crs=self.crs,
+                            tgt_crs=self.crs)
+
+    def test_different_grid(self):
+        src = self.src.assign_coords(lon=self.sx + 1)
+        emsg = "'tas' data is not defined on the same source grid"
+        with self.assertRaisesRegex(ValueError, emsg):
+            self.regridder(src)
+
+    def test_bad_type(self):
+        emsg = 'Expected an xarray DataArray or Dataset'
+        with self.assertRaisesRegex(TypeError, emsg):
+            self.regridder(self.src.values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,468 @@
+# (C) British Crown Copyright 2020, Met Office
+#
+# This file is part of agg-regrid.
+#
+# agg-regrid is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# agg-regrid is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with agg-regrid.  If not, see <http://www.gnu.org/licenses/>.
+"""
+An xarray front end of the area-weighted regridder, which regrids
+:class:`xarray.DataArray` and :class:`xarray.Dataset` objects directly,
+without converting them to and from Iris cubes.
+
+The source and target grids are defined by 1d x and y coordinates, and the
+coordinate reference system of each grid is given explicitly or found from
+its CF grid mapping variable, e.g.
+
+    regridder = XarrayRegridder(src, tgt)
+    result = regridder(src)
+
+Missing (NaN) source data are treated as masked, and the target grid cells
+without weights are missing in the result. Dask backed data are regridded
+lazily, chunk by chunk over the non-horizontal dimensions.
+
+Note that xarray (and cartopy, when the grids have different coordinate
+reference systems) are only imported when used.
+
+"""
+
+import threading
+
+import numpy as np
+import numpy.ma as ma
+
+from . import _transform_bounds
+from .core import (_check_min_coverage, DEFAULT_BUFFER_DEPTH,
+                   DEFAULT_PIXEL_FORMAT, _PIXEL_FORMATS, _regrid)
+from .engines import _check_engine, build_weights
+
+# The CF standard names, and the common names, of the x and y coordinates.
+_NAMES = {'x': ('projection_x_coordinate', 'grid_longitude', 'longitude',
+                'x', 'lon', 'rlon'),
+          'y': ('projection_y_coordinate', 'grid_latitude', 'latitude',
+                'y', 'lat', 'rlat')}
+
+
+def _find_coord(obj, name, kind):
+    """
+    Returns the name of the 1d x or y coordinate of the xarray object,
+    being the given name, or else the coordinate with a CF axis attribute
+    or a standard (or common) x or y name.
+
+    """
+    if name is None:
+        names = [key for key, coord in obj.coords.items()
+                 if coord.ndim == 1 and
+                 (coord.attrs.get('axis', '').lower() == kind or
+                  coord.attrs.get('standard_name') in _NAMES[kind] or
+                  key in _NAMES[kind])]
+        if len(names) != 1:
+            emsg = 'Expected one {}-coordinate, got {}. Specify the name ' \
+                'of the {}-coordinate.'
+            raise ValueError(emsg.format(kind, names, kind))
+        name, = names
+
+    if name not in obj.coords or obj.coords[name].ndim != 1:
+        emsg = 'Expected a 1d {}-coordinate named {!r}.'
+        raise ValueError(emsg.format(kind, name))
+
+    return name
+
+
+def _grid_mapping(obj):
+    """
+    Returns the name of the CF grid mapping variable of the xarray object,
+    or None.
+
+    """
+    if hasattr(obj, 'data_vars'):
+        variables = list(obj.data_vars.values())
+    else:
+        variables = [obj]
+
+    for variable in variables:
+        name = variable.attrs.get('grid_mapping',
+                                  variable.encoding.get('grid_mapping'))
+        if name is not None and name in obj.coords:
+            return name
+        if name is not None and name in getattr(obj, 'data_vars', {}):
+            return name
+
+    if 'spatial_ref' in obj.coords:
+        return 'spatial_ref'
+
+    return None
+
+
+def _crs(obj, crs, kind):
+    """
+    Returns the cartopy crs of the grid of the xarray object, being the
+    given crs (a cartopy or pyproj crs, or any input accepted by
+    :meth:`pyproj.crs.CRS.from_user_input`), or else that of its CF grid
+    mapping variable.
+
+    """
+    import cartopy.crs as ccrs
+    import pyproj
+
+    if crs is None:
+        name = _grid_mapping(obj)
+        if name is None:
+            emsg = 'The {} grid requires a coordinate reference system, ' \
+                'either from a grid mapping variable or given explicitly.'
+            raise ValueError(emsg.format(kind))
+        attrs = obj[name].attrs
+        wkt = attrs.get('crs_wkt', attrs.get('spatial_ref'))
+        if wkt is not None:
+            crs = pyproj.CRS.from_wkt(wkt)
+        else:
+            crs = pyproj.CRS.from_cf(attrs)
+
+    if not isinstance(crs, ccrs.CRS):
+        crs = ccrs.CRS(pyproj.CRS.from_user_input(crs))
+
+    return crs
+
+
+def _contiguous_bounds(obj, name, kind):
+    """
+    Returns the 1d contiguous bounds of the coordinate of the xarray object,
+    from its CF bounds variable, or else guessed from its points.
+
+    """
+    coord = obj.coords[name]
+    bounds = coord.attrs.get('bounds')
+    if bounds is not None and bounds in getattr(obj, 'variables', {}):
+        bounds = np.asarray(obj.variables[bounds], dtype=np.float64)
+        if bounds.shape != (coord.size, 2) or \
+                not np.array_equal(bounds[1:, 0], bounds[:-1, 1]):
+            emsg = 'Expected contiguous {}-coordinate bounds, got {!r}.'
+            raise ValueError(emsg.format(kind, coord.attrs['bounds']))
+        return np.append(bounds[:, 0], bounds[-1, 1])
+
+    points = np.asarray(coord, dtype=np.float64)
+    if points.size < 2:
+        emsg = 'Cannot guess the bounds of the {}-coordinate {!r} with ' \
+            'a single point.'
+        raise ValueError(emsg.format(kind, name))
+    # Guess the bounds midway between the points, as for Iris.
+    middle = (points[:-1] + points[1:]) / 2
+    first = points[0] - (middle[0] - points[0])
+    last = points[-1] + (points[-1] - middle[-1])
+    return np.concatenate([[first], middle, [last]])
+
+
+class XarrayRegridder:
+    """
+    Regrids :class:`xarray.DataArray` and :class:`xarray.Dataset` objects on
+    a source grid to a target grid, with the same weights engines as
+    :class:`agg_regrid.AreaWeighted`.
+
+    """
+
+    def __init__(self, src_grid, tgt_grid, x=None, y=None, tgt_x=None,
+                 tgt_y=None, src_crs=None, tgt_crs=None, buffer_depth=None,
+                 pixel_format=None, min_coverage=None, engine='agg',
+                 tgt_cells=None):
+        """
+        Args:
+
+        * src_grid:
+            The :class:`xarray.DataArray` or :class:`xarray.Dataset`
+            providing the source grid.
+        * tgt_grid:
+            The :class:`xarray.DataArray` or :class:`xarray.Dataset`
+            providing the target grid.
+
+        Kwargs:
+
+        * x, y:
+            The names of the 1d source grid x and y coordinates. Default to
+            None, in which case the coordinates with a CF axis attribute, or
+            a standard x or y name, are used.
+        * tgt_x, tgt_y:
+            The names of the 1d target grid x and y coordinates, as for the
+            source grid.
+        * src_crs, tgt_crs:
+            The coordinate reference system of the source and target grids,
+            as a cartopy or pyproj crs, or any input accepted by
+            :meth:`pyproj.crs.CRS.from_user_input`, e.g. 'EPSG:4326'.
+            Default to None, in which case the CF grid mapping variable of
+            each grid is used.
+        * buffer_depth (int):
+            The AGG buffer depth. Defaults to
+            :data:`~agg_regrid.DEFAULT_BUFFER_DEPTH`.
+        * pixel_format (str):
+            The AGG pixel format. Defaults to
+            :data:`~agg_regrid.DEFAULT_PIXEL_FORMAT`.
+        * min_coverage (float):
+            The minimum fraction of a target grid cell covered by the source
+            grid, see :class:`agg_regrid.AreaWeighted`. Defaults to None.
+        * engine (str):
+            The weights engine, see :class:`agg_regrid.AreaWeighted`.
+            Defaults to 'agg'.
+        * tgt_cells:
+            The target grid cells to regrid, see
+            :class:`agg_regrid.AreaWeighted`. Defaults to None.
+
+        """
+        if buffer_depth is None:
+            buffer_depth = DEFAULT_BUFFER_DEPTH
+
+        if pixel_format is None:
+            pixel_format = DEFAULT_PIXEL_FORMAT
+
+        if pixel_format not in _PIXEL_FORMATS:
+            emsg = 'Invalid pixel format, got {!r} expected one of {}.'
+            raise ValueError(emsg.format(pixel_format,
+                                         sorted(_PIXEL_FORMATS)))
+
+        _check_min_coverage(min_coverage)
+        _check_engine(engine)
+
+        self.buffer_depth = buffer_depth
+        self.pixel_format = pixel_format
+        self.min_coverage = min_coverage
+        self.engine = engine
+        self.tgt_cells = tgt_cells
+
+        self.x = _find_coord(src_grid, x, 'x')
+        self.y = _find_coord(src_grid, y, 'y')
+        self.tgt_x = _find_coord(tgt_grid, tgt_x, 'x')
+        self.tgt_y = _find_coord(tgt_grid, tgt_y, 'y')
+
+        # The dimensions of the grid coordinates.
+        self._dims = (src_grid.coords[self.y].dims[0],
+                      src_grid.coords[self.x].dims[0])
+        self._tgt_dims = (tgt_grid.coords[self.tgt_y].dims[0],
+                          tgt_grid.coords[self.tgt_x].dims[0])
+
+        self._src_crs = _crs(src_grid, src_crs, 'source')
+        self._tgt_crs = _crs(tgt_grid, tgt_crs, 'target')
+
+        # Snapshot the grid coordinates, and the target grid coordinates and
+        # grid mapping variable to add to the result.
+        self._sx = np.array(src_grid.coords[self.x])
+        self._sy = np.array(src_grid.coords[self.y])
+        self._sx_bounds = _contiguous_bounds(src_grid, self.x, 'x')
+        self._sy_bounds = _contiguous_bounds(src_grid, self.y, 'y')
+        self._gx_bounds = _contiguous_bounds(tgt_grid, self.tgt_x, 'x')
+        self._gy_bounds = _contiguous_bounds(tgt_grid, self.tgt_y, 'y')
+        self._src_grid_mapping = _grid_mapping(src_grid)
+        self._tgt_coords = {name: coord.variable.copy()
+                            for name, coord in tgt_grid.coords.items()
+                            if coord.dims and
+                            set(coord.dims) <= set(self._tgt_dims)}
+        self._tgt_grid_mapping = _grid_mapping(tgt_grid)
+        if self._tgt_grid_mapping is not None:
+            variable = tgt_grid[self._tgt_grid_mapping].variable.copy()
+            self._tgt_coords[self._tgt_grid_mapping] = variable
+
+        # The weights are calculated for increasing source coordinates, with
+        # the source data flipped to match.
+        self._flip = (self._sy[-1] < self._sy[0], self._sx[-1] < self._sx[0])
+
+        # Cache the weights of the target grid cells, calculated once even
+        # when called concurrently from multiple threads.
+        self._weights = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        msg = '{}(x={!r}, y={!r}, tgt_x={!r}, tgt_y={!r}, engine={!r})'
+        return msg.format(self.__class__.__name__, self.x, self.y,
+                          self.tgt_x, self.tgt_y, self.engine)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_weights(self, progress=None, cancel=None):
+        """
+        Calculate and cache the :class:`agg_regrid.Weights` of the target
+        grid cells.
+
+        """
+        if self._weights is None:
+            with self._lock:
+                if self._weights is None:
+                    sx, sy = self._sx, self._sy
+                    sx_bounds, sy_bounds = self._sx_bounds, self._sy_bounds
+                    if self._flip[1]:
+                        sx, sx_bounds = sx[::-1], sx_bounds[::-1]
+                    if self._flip[0]:
+                        sy, sy_bounds = sy[::-1], sy_bounds[::-1]
+
+                    # Convert the target grid bounds to the source crs.
+                    if self._tgt_crs.equals(self._src_crs,
+                                            ignore_axis_order=True):
+                        gx_bounds, gy_bounds = np.meshgrid(self._gx_bounds,
+                                                           self._gy_bounds)
+                    else:
+                        gx_bounds, gy_bounds = _transform_bounds(
+                            self._tgt_crs, self._src_crs, self._gx_bounds,
+                            self._gy_bounds)
+
+                    weights = build_weights(self.engine, sx, sx_bounds,
+                                            sy, sy_bounds, gx_bounds,
+                                            gy_bounds, self.buffer_depth,
+                                            pixel_format=self.pixel_format,
+                                            min_coverage=self.min_coverage,
+                                            tgt_cells=self.tgt_cells,
+                                            progress=progress, cancel=cancel)
+                    self._weights = weights
+        return self._weights
+
+    def calculate_weights(self, progress=None, cancel=None):
+        """
+        Calculate the weights of this regridder ahead of regridding, see
+        :meth:`agg_regrid.AreaWeighted.regridder`.
+
+        Kwargs:
+
+        * progress:
+            A callable reporting the :class:`agg_regrid.Progress` of the
+            calculation. Defaults to None.
+        * cancel:
+            A cancellation token of the calculation, such as a
+            :class:`threading.Event`. Defaults to None.
+
+        Returns:
+            The :class:`agg_regrid.Weights` of the target grid cells.
+
+        """
+        return self._get_weights(progress=progress, cancel=cancel)
+
+    def share(self, filename=None):
+        """
+        Share the weights of this regridder, calculating them if necessary,
+        so that pickling this regridder to dask worker processes on the same
+        host only pickles a reference to the weights, see
+        :meth:`agg_regrid.Weights.share`.
+
+        Kwargs:
+
+        * filename:
+            The name of the file to share the weights through. Defaults to
+            None, in which case a temporary file in shared memory (where
+            available) is used.
+
+        Returns:
+            This regridder.
+
+        """
+        self._get_weights().share(filename)
+        return self
+
+    def _apply(self, data, weights):
+        # Regrid the trailing (y, x) dimensions of the real data, with the
+        # missing source data masked and the masked results missing.
+        if self._flip[0]:
+            data = data[..., ::-1, :]
+        if self._flip[1]:
+            data = data[..., ::-1]
+        if np.issubdtype(data.dtype, np.floating):
+            missing = np.isnan(data)
+            if missing.any():
+                data = ma.masked_array(data, mask=missing)
+        result = _regrid(weights, data, data.ndim - 1, data.ndim - 2)
+        return ma.filled(result, np.nan)
+
+    def _regrid_array(self, array, weights):
+        # Regrid the data array, which is lazy for lazy data.
+        import xarray
+
+        for name, coord in ((self.x, self._sx), (self.y, self._sy)):
+            if name not in array.coords or \
+                    not np.array_equal(array.coords[name], coord):
+                emsg = 'The {!r} data is not defined on the same source ' \
+                    'grid as this regridder.'
+                raise ValueError(emsg.format(array.name))
+
+        dims, tgt_dims = self._dims, self._tgt_dims
+        sizes = dict(zip(tgt_dims, weights.tgt_shape))
+        result = xarray.apply_ufunc(
+            self._apply, array, kwargs=dict(weights=weights),
+            input_core_dims=[list(dims)], output_core_dims=[list(tgt_dims)],
+            exclude_dims=set(dims), dask='parallelized',
+            output_dtypes=[np.float64],
+            dask_gufunc_kwargs=dict(output_sizes=sizes, allow_rechunk=True),
+            keep_attrs=True)
+
+        # Restore the order of the dimensions, with the target grid
+        # dimensions in place of the source grid dimensions.
+        order = dict(zip(dims, tgt_dims))
+        result = result.transpose(*[order.get(dim, dim)
+                                    for dim in array.dims])
+
+        # Replace the source grid mapping with that of the target grid.
+        if self._src_grid_mapping in result.coords:
+            result = result.drop_vars(self._src_grid_mapping)
+        result = result.assign_coords(self._tgt_coords)
+        result.attrs.pop('grid_mapping', None)
+        result.encoding.pop('grid_mapping', None)
+        if self._tgt_grid_mapping is not None:
+            result.attrs['grid_mapping'] = self._tgt_grid_mapping
+        return result
+
+    def __call__(self, obj):
+        """
+        Regrid the :class:`xarray.DataArray`, or each data variable of the
+        :class:`xarray.Dataset`, on the source grid to the target grid.
+
+        Data variables of a dataset without the source grid dimensions are
+        unchanged, and those with only one of the source grid dimensions
+        (such as coordinate bounds) are dropped.
+
+        Args:
+
+        * obj:
+            The :class:`xarray.DataArray` or :class:`xarray.Dataset` to
+            regrid.
+
+        Returns:
+            The regridded :class:`xarray.DataArray` or
+            :class:`xarray.Dataset` of float64 data, which is lazy for lazy
+            (dask) source data. The coordinates along the source grid
+            dimensions are replaced by the target grid coordinates.
+
+        """
+        import xarray
+
+        weights = self._get_weights()
+
+        if isinstance(obj, xarray.DataArray):
+            return self._regrid_array(obj, weights)
+
+        if not isinstance(obj, xarray.Dataset):
+            emsg = 'Expected an xarray DataArray or Dataset, got {}.'
+            raise TypeError(emsg.format(type(obj)))
+
+        dims = set(self._dims)
+        variables = {}
+        for name, variable in obj.data_vars.items():
+            if name == self._src_grid_mapping:
+                continue
+            if dims <= set(variable.dims):
+                variables[name] = self._regrid_array(variable, weights)
+            elif not dims & set(variable.dims):
+                variables[name] = variable
+
+        result = xarray.Dataset(variables, attrs=obj.attrs)
+        coords = {name: coord for name, coord in obj.coords.items()
+                  if not dims & set(coord.dims) and
+                  name != self._src_grid_mapping}
+        return result.assign_coords(coords).assign_coords(self._tgt_coords)